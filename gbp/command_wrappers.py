@@ -24,10 +24,12 @@ import os
 import os.path
 import signal
 import sys
+import time
 from contextlib import contextmanager
 from tempfile import TemporaryFile
 
 import gbp.log as log
+import gbp.profile
 
 class CommandExecFailed(Exception):
     """Exception raised by the Command class"""
@@ -89,6 +91,13 @@ class Command(object):
         self.retcode = 1
         self.stdout, self.stderr, self.err_reason = [''] * 3
 
+    def _record(self, cmd, start):
+        """Report a finished command to the profiler/tracer"""
+        gbp.profile.record_command(cmd, start, time.time() - start,
+                                   cwd=self.cwd, returncode=self.retcode,
+                                   stdout_bytes=len(self.stdout or ''),
+                                   stderr_bytes=len(self.stderr or ''))
+
     def __call(self, args):
         """
         Wraps subprocess.call so we can be verbose and fix Python's
@@ -107,6 +116,7 @@ class Command(object):
         with proxy_stdf():
             stdout_arg = subprocess.PIPE if self.capture_stdout else sys.stdout
             stderr_arg = subprocess.PIPE if self.capture_stderr else sys.stderr
+            start = time.time()
             try:
                 popen = subprocess.Popen(cmd,
                                          cwd=self.cwd,
@@ -119,9 +129,11 @@ class Command(object):
             except OSError as err:
                 self.err_reason = "execution failed: %s" % str(err)
                 self.retcode = 1
+                self._record(cmd, start)
                 raise
 
         self.retcode = popen.returncode
+        self._record(cmd, start)
         if self.retcode < 0:
             self.err_reason = "it was terminated by signal %d" % -self.retcode
         elif self.retcode > 0:
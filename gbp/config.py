@@ -17,12 +17,12 @@
 """handles command line and config file option parsing for the gbp commands"""
 
 from optparse import OptionParser, OptionGroup, Option, OptionValueError
+from six import StringIO
 from six.moves import configparser
 from copy import copy
 import errno
 import os.path
 import sys
-import tempfile
 
 
 try:
@@ -180,6 +180,8 @@ class GbpOptionParser(OptionParser):
                  'commit': 'False',
                  'upstream-vcs-tag': '',
                  'tmp-dir': '/var/tmp/gbp/',
+                 'profile': '',
+                 'trace': '',
              }
     help = {
              'debian-branch':
@@ -350,6 +352,14 @@ class GbpOptionParser(OptionParser):
               'tmp-dir':
                   ("Base directory under which temporary directories are "
                    "created, default is '%(tmp-dir)s'"),
+              'profile':
+                  ("Write per-phase timing and subprocess statistics in JSON "
+                   "format to the given file and show a summary at the end "
+                   "of the run, default is '%(profile)s'"),
+              'trace':
+                  ("Write a trace of all executed git and external commands "
+                   "in Chrome trace-event JSON format to the given file, "
+                   "default is '%(trace)s'"),
            }
 
     def_config_files = {'/etc/git-buildpackage/gbp.conf': 'system',
@@ -358,6 +368,10 @@ class GbpOptionParser(OptionParser):
                         '%(top_dir)s/debian/gbp.conf':    'debian',
                         '%(git_dir)s/gbp.conf':           None}
 
+    # Merged configs of read_config_files()
+    _config_cache = {}
+    _config_cache_size = 16
+
     @classmethod
     def get_config_files(klass, no_local=False):
         """
@@ -393,56 +407,112 @@ class GbpOptionParser(OptionParser):
             files = [fname for fname in files if fname.startswith('/')]
         return files
 
-    def _read_config_file(self, parser, repo, filename, git_treeish):
-        """Read config file"""
+    @staticmethod
+    def _config_file_stamp(filename):
+        """Identify the version of a config file on disk"""
+        try:
+            stat = os.stat(filename)
+        except OSError:
+            return None
+        return (stat.st_mtime, stat.st_size, stat.st_ino)
+
+    @classmethod
+    def read_config_files(cls, repo=None, git_treeish=None):
+        """
+        Read and merge all config files
+
+        The merged config is cached, keyed by the modification times of the
+        config files and the tree the per-tree config files are read from,
+        so creating several parsers only reads the files once.
+
+        @param repo: repository to read the per-repo config files from
+        @type repo: L{GitRepository}
+        @param git_treeish: read the per-tree config files from this treeish
+            instead of the working copy
+        @type git_treeish: C{str}
+        @return: the merged config, must not be modified
+        @rtype: C{SafeConfigParser}
+        """
         str_fields = {}
         if repo:
             str_fields['git_dir'] = repo.git_dir
             if not repo.bare:
                 str_fields['top_dir'] = repo.path
 
-        # Read per-tree config file
-        if repo and git_treeish and filename.startswith('%(top_dir)s/'):
-            with tempfile.TemporaryFile() as tmp:
-                relpath = filename.replace('%(top_dir)s/', '')
-                try:
-                    config = repo.show('%s:%s' % (git_treeish, relpath))
-                    tmp.writelines(config)
-                except GitRepositoryError:
-                    pass
-                tmp.seek(0)
-                parser.readfp(tmp)
-                return
-        try:
-            filename = filename % str_fields
-        except KeyError:
-            # Skip if filename wasn't expanded, i.e. we're not in git repo
-            return
-        parser.read(filename)
+        tree = None
+        if repo and git_treeish:
+            try:
+                tree = repo.rev_parse('%s^{tree}' % git_treeish)
+            except GitRepositoryError:
+                pass
+
+        # Config files as (filename, path in tree) tuples
+        sources = []
+        for filename in cls.get_config_files():
+            if repo and git_treeish and filename.startswith('%(top_dir)s/'):
+                sources.append((None, filename.replace('%(top_dir)s/', '')))
+                continue
+            try:
+                filename = filename % str_fields
+            except KeyError:
+                # Skip if filename wasn't expanded, i.e. we're not in git repo
+                continue
+            sources.append((filename, None))
+
+        key = (tree, tuple([(fname, relpath, cls._config_file_stamp(fname))
+                            for fname, relpath in sources if fname]),
+               tuple([relpath for fname, relpath in sources if relpath]))
+        if key in cls._config_cache:
+            return cls._config_cache[key]
+
+        # Read per-tree config files with one git command
+        blobs = {}
+        relpaths = [relpath for _fname, relpath in sources if relpath]
+        if tree and relpaths:
+            objects = repo.iter_objects(['%s:%s' % (tree, relpath) for
+                                         relpath in relpaths], missing_ok=True)
+            for relpath, (objtype, content) in zip(relpaths, objects):
+                if objtype == 'blob':
+                    blobs[relpath] = content
+
+        parser = configparser.SafeConfigParser()
+        for filename, relpath in sources:
+            if relpath:
+                parser.readfp(StringIO(blobs.get(relpath, '')))
+            else:
+                parser.read(filename)
+        if len(cls._config_cache) >= cls._config_cache_size:
+            cls._config_cache.clear()
+        cls._config_cache[key] = parser
+        return parser
 
     def _warn_old_config_section(self, oldcmd, cmd):
         if not os.getenv("GBP_DISABLE_SECTION_DEPRECTATION"):
             gbp.log.warn("Old style config section [%s] found "
                          "please rename to [%s]" % (oldcmd, cmd))
 
-    def parse_config_files(self, git_treeish=None):
+    def parse_config_files(self, git_treeish=None, repo=None):
         """
         Parse the possible config files and set appropriate values
         default values
+
+        @param git_treeish: read the per-tree config files from this treeish
+        @type git_treeish: C{str}
+        @param repo: repository in the current directory, opened if not
+            given
+        @type repo: L{GitRepository}
         """
-        parser = configparser.SafeConfigParser()
         # Fill in the built in values
         self.config = dict(self.__class__.defaults)
         # Update with the values from the defaults section. This is needed
         # in case the config file doesn't have a [<command>] section at all
-        config_files = self.get_config_files()
-        try:
-            repo = GitRepository(".")
-        except GitRepositoryError:
-            repo = None
+        if repo is None:
+            try:
+                repo = GitRepository(".")
+            except GitRepositoryError:
+                repo = None
         # Read all config files
-        for filename in config_files:
-            self._read_config_file(parser, repo, filename, git_treeish)
+        parser = self.read_config_files(repo, git_treeish)
         self.config.update(dict(parser.defaults()))
 
         # Make sure we read any legacy sections prior to the real subcommands
@@ -485,7 +555,7 @@ class GbpOptionParser(OptionParser):
             self.config['filter'] = []
 
     def __init__(self, command, prefix='', usage=None, sections=[],
-                 git_treeish=None):
+                 git_treeish=None, repo=None):
         """
         @param command: the command to build the config parser for
         @type command: C{str}
@@ -496,12 +566,16 @@ class GbpOptionParser(OptionParser):
         @param sections: additional (non optional) config file sections
             to parse
         @type sections: C{list} of C{str}
+        @param git_treeish: read the per-tree config files from this treeish
+        @type git_treeish: C{str}
+        @param repo: repository in the current directory, if already opened
+        @type repo: L{GitRepository}
         """
         self.command = command
         self.sections = sections
         self.prefix = prefix
         self.config = {}
-        self.parse_config_files(git_treeish)
+        self.parse_config_files(git_treeish, repo)
         self.valid_options = []
 
         if self.command.startswith('git-') or self.command.startswith('gbp-'):
@@ -691,6 +765,7 @@ class GbpOptionParserRpm(GbpOptionParser):
             'pq-branch'                 : 'development/%(branch)s',
             'export-sourcedir'          : 'SOURCES',
             'export-specdir'            : 'SPECS',
+            'export-incremental'        : 'False',
             'export-dir'                : '../rpmbuild',
             'builder'                   : 'rpmbuild',
             'spec-file'                 : '',
@@ -699,6 +774,8 @@ class GbpOptionParserRpm(GbpOptionParser):
             'arch'                      : '',
             'mock-root'                 : '',
             'mock-options'              : '',
+            'mock-pool-size'            : '0',
+            'mock-pool-dir'             : '~/.cache/git-buildpackage/mock-pool',
             'native'                    : 'auto',
             'spec-vcs-tag'              : '',
             'patch-export'              : 'False',
@@ -708,14 +785,25 @@ class GbpOptionParserRpm(GbpOptionParser):
             'patch-import'              : 'True',
             'import-files'              : ['.gbp.conf',
                                            'debian/gbp.conf'],
+            'import-in-index'           : 'False',
+            'check-patches'             : 'False',
+            '3way'                      : 'False',
             'merge'                     : 'False',
             'pristine-tarball-name'     : 'auto',
+            'pristine-tar-cache-dir'    : '',
+            'pristine-tar-cache-size'   : '1G',
+            'build-cache-dir'           : '',
+            'build-cache-size'          : '10G',
+            'build-cache-postbuild'     : 'True',
             'orig-prefix'               : 'auto',
             'changelog-file'            : 'auto',
             'changelog-revision'        : '',
             'spawn-editor'              : 'always',
             'editor-cmd'                : 'vim',
             'meta-bts'                  : '(Close|Closes|Fixes|Fix)',
+            'jobs'                      : '0',
+            'builder-jobs'              : '1',
+            'log-dir'                   : '',
                     })
 
     help = dict(GbpOptionParser.help)
@@ -748,6 +836,10 @@ class GbpOptionParserRpm(GbpOptionParser):
             'export-specdir':
                 "Subdir (under EXPORT_DIR) where package spec file is "
                 "exported default is '%(export-specdir)s'",
+            'export-incremental':
+                "Only write packaging files that changed since the previous "
+                "export to EXPORT_DIR and remove stale ones, default is "
+                "'%(export-incremental)s'",
              'mock':
                   ("Invoke mock for building using gbp-builder-mock, "
                    "default is '%(mock)s'"),
@@ -763,6 +855,13 @@ class GbpOptionParserRpm(GbpOptionParser):
              'mock-options':
                   ("Options to pass to mock, "
                    "default is '%(mock-options)s'"),
+             'mock-pool-size':
+                  ("Number of pre-initialized mock chroots to keep per mock "
+                   "root, 0 disables the pool, default is "
+                   "'%(mock-pool-size)s'"),
+             'mock-pool-dir':
+                  ("Directory for the lock and state files of the mock "
+                   "chroot pool, default is '%(mock-pool-dir)s'"),
             'native':
                 "Treat this package as native, default is '%(native)s'",
             'spec-vcs-tag':
@@ -789,9 +888,40 @@ class GbpOptionParserRpm(GbpOptionParser):
                 "Comma-separated list of additional file(s) to import from "
                 "packaging branch. These will appear as one monolithic patch "
                 "in the pq/development branch. Default is %(import-files)s",
+            'import-in-index':
+                "Apply the patches to a temporary index instead of the "
+                "working copy and check out the patch-queue branch only once "
+                "at the end, default is '%(import-in-index)s'",
+            'check-patches':
+                "Check that all patches apply before importing any, and "
+                "report all the ones that don't, default is "
+                "'%(check-patches)s'",
+            '3way':
+                "Fall back to a three-way merge if a patch does not apply "
+                "cleanly, default is '%(3way)s'",
             'pristine-tarball-name':
                 "Filename to record to pristine-tar, set to 'auto' to not "
                 "mangle the file name, default is '%(pristine-tarball-name)s'",
+            'pristine-tar-cache-dir':
+                "Directory for caching tarballs generated with pristine-tar, "
+                "empty value disables the cache, default is "
+                "'%(pristine-tar-cache-dir)s'",
+            'pristine-tar-cache-size':
+                "Maximum total size of the pristine-tar cache, least recently "
+                "used tarballs are removed when exceeded, 0 means unlimited, "
+                "default is '%(pristine-tar-cache-size)s'",
+            'build-cache-dir':
+                "Directory for caching build results, keyed by the exported "
+                "sources and builder arguments, empty value disables the "
+                "cache, default is '%(build-cache-dir)s'",
+            'build-cache-size':
+                "Maximum total size of the build cache, least recently used "
+                "build results are removed when exceeded, 0 means unlimited, "
+                "default is '%(build-cache-size)s'",
+            'build-cache-postbuild':
+                "Run the postbuild hook also when the build results are "
+                "taken from the build cache, default is "
+                "'%(build-cache-postbuild)s'",
             'orig-prefix':
                 "Prefix (dir) to be used when generating/importing tarballs, "
                 "default is '%(orig-prefix)s'",
@@ -808,6 +938,15 @@ class GbpOptionParserRpm(GbpOptionParser):
                 "default is '%(git-author)s'",
             'meta-bts':
                 "Meta tags for the bts commands, default is '%(meta-bts)s'",
+            'jobs':
+                "Number of packages to export in parallel, 0 means the "
+                "number of CPUs, default is '%(jobs)s'",
+            'builder-jobs':
+                "Number of builder invocations to run in parallel, default is "
+                "'%(builder-jobs)s'",
+            'log-dir':
+                "Directory for the per-package build logs, EXPORT_DIR is used "
+                "if empty, default is '%(log-dir)s'",
                  })
 
 class GbpOptionParserBB(GbpOptionParserRpm):
@@ -0,0 +1,402 @@
+# vim: set fileencoding=utf-8 :
+#
+# (C) 2026 agent <agent@local>
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, please see
+#    <http://www.gnu.org/licenses/>
+"""
+Server for running gbp commands in a long-running process
+
+The server listens on a Unix socket. The client sends the command line,
+working directory and environment of a gbp invocation as one JSON encoded
+line. The server forks a worker process for each request, which runs the
+command exactly like a one-shot invocation would, and relays the output of
+the worker back to the client in frames of the form::
+
+    <channel: '1' stdout, '2' stderr, 'x' exit code><length><data>
+
+Forking from a warm server saves the interpreter startup and module
+imports, and the server remembers the repository locations and config files
+it has seen.
+State is only ever passed from the server to the workers, never back, so
+one command can not affect the outcome of another.
+"""
+
+import errno
+import json
+import os
+import select
+import signal
+import socket
+import struct
+import sys
+from contextlib import contextmanager
+
+import six
+
+import gbp.log
+from gbp.errors import GbpError
+
+#: Environment variable pointing to the server socket
+SOCKET_ENV = 'GBP_DAEMON_SOCKET'
+
+#: Commands that may prompt the user or spawn an editor, always run locally
+INTERACTIVE_COMMANDS = ('dch', 'import-orig', 'import-orig-rpm', 'rpm-ch')
+
+_HEADER = struct.Struct('!cI')
+
+
+class GbpDaemonError(GbpError):
+    """Error in running the gbp daemon"""
+    pass
+
+
+def _to_str(obj):
+    """Convert decoded JSON strings back to native strings"""
+    if isinstance(obj, six.text_type) and not isinstance(obj, str):
+        return obj.encode('utf-8')
+    elif isinstance(obj, list):
+        return [_to_str(item) for item in obj]
+    elif isinstance(obj, dict):
+        return dict([(_to_str(key), _to_str(val)) for key, val in obj.items()])
+    return obj
+
+
+def _send_frame(sock, channel, data):
+    """Send one frame of output to the client"""
+    sock.sendall(_HEADER.pack(channel, len(data)) + data)
+
+
+def _recv_exactly(fobj, size):
+    """Read exactly size bytes, None on EOF"""
+    data = fobj.read(size)
+    if len(data) < size:
+        return None
+    return data
+
+
+def _isatty(stream):
+    """Whether a stream is connected to a terminal"""
+    try:
+        return stream.isatty()
+    except (AttributeError, ValueError):
+        return False
+
+
+def can_run_remote(argv):
+    """
+    Whether a command gives the same results in the server as when run
+    locally. The workers of the server have no terminal and read nothing
+    from stdin, so interactive commands and commands run from a terminal
+    are not passed to the server.
+
+    @param argv: command line of the command, including the program name
+    @type argv: C{list} of C{str}
+    @rtype: C{bool}
+    """
+    if len(argv) > 1 and argv[1].replace('_', '-') in INTERACTIVE_COMMANDS:
+        return False
+    return not any(_isatty(stream) for stream in
+                   (sys.stdin, sys.stdout, sys.stderr))
+
+
+def run_remote(socket_path, argv):
+    """
+    Run a gbp command in the server
+
+    @param socket_path: path of the server socket
+    @type socket_path: C{str}
+    @param argv: command line of the command, including the program name
+    @type argv: C{list} of C{str}
+    @return: exit code of the command or C{None} if the server could not be
+        reached or the command should be run locally
+    @rtype: C{int} or C{None}
+    """
+    if not can_run_remote(argv):
+        return None
+    try:
+        request = json.dumps({'argv': argv,
+                              'cwd': os.getcwd(),
+                              'env': dict(os.environ)})
+    except (TypeError, ValueError, UnicodeError):
+        # Not representable in JSON, e.g. non-UTF-8 environment
+        return None
+    try:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(socket_path)
+    except (OSError, socket.error):
+        return None
+
+    try:
+        sock.sendall(request + '\n')
+        rfile = sock.makefile('rb')
+        while True:
+            header = _recv_exactly(rfile, _HEADER.size)
+            if header is None:
+                break
+            channel, length = _HEADER.unpack(header)
+            data = _recv_exactly(rfile, length)
+            if data is None:
+                break
+            if channel == 'x':
+                return int(data)
+            stream = sys.stdout if channel == '1' else sys.stderr
+            stream.write(data)
+            stream.flush()
+    except socket.error as err:
+        sys.stderr.write("gbp: lost connection to the gbp daemon: %s\n" % err)
+        return 1
+    finally:
+        sock.close()
+    sys.stderr.write("gbp: gbp daemon closed the connection unexpectedly\n")
+    return 1
+
+
+@contextmanager
+def _request_context(request):
+    """Temporarily switch to the environment and directory of a request"""
+    saved_env = dict(os.environ)
+    saved_cwd = os.getcwd()
+    try:
+        os.environ.clear()
+        os.environ.update(request['env'])
+        os.chdir(request['cwd'])
+        yield
+    finally:
+        os.chdir(saved_cwd)
+        os.environ.clear()
+        os.environ.update(saved_env)
+
+
+class GbpDaemon(object):
+    """
+    Server running gbp commands for clients connecting to a Unix socket
+
+    @ivar socket_path: path of the listening socket
+    @type socket_path: C{str}
+    """
+    max_request_size = 1024 * 1024
+    reap_interval = 1.0
+
+    def __init__(self, socket_path):
+        self.socket_path = os.path.abspath(socket_path)
+        self._listener = None
+        self._handlers = set()
+
+    def _bind(self):
+        """Create the listening socket, only accessible by the user"""
+        if os.path.exists(self.socket_path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.socket_path)
+            except socket.error:
+                # Stale socket of a dead server
+                os.unlink(self.socket_path)
+            else:
+                probe.close()
+                raise GbpDaemonError("A gbp daemon is already listening on "
+                                     "'%s'" % self.socket_path)
+        self._listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        old_umask = os.umask(0o077)
+        try:
+            self._listener.bind(self.socket_path)
+        finally:
+            os.umask(old_umask)
+        self._listener.listen(16)
+
+    @staticmethod
+    def preload():
+        """Import all gbp commands so that workers don't need to"""
+        from gbp.scripts import supercommand
+        import gbp.scripts
+        path = os.path.dirname(gbp.scripts.__file__)
+        for cmd, _path in supercommand.get_available_commands(path):
+            try:
+                supercommand.import_command(cmd)
+            except Exception as err:
+                gbp.log.debug("Not preloading '%s': %s" % (cmd, err))
+
+    @staticmethod
+    def warm(request):
+        """
+        Prepare the caches inherited by the worker of a request: the
+        location of the repository the command is run in and the merged
+        config files
+        """
+        from six.moves import configparser
+        from gbp.config import GbpOptionParser
+        from gbp.git.repository import GitRepository, GitRepositoryError
+        try:
+            with _request_context(request):
+                repo = GitRepository(os.path.curdir)
+                GbpOptionParser.read_config_files(repo)
+        except (GitRepositoryError, OSError, configparser.Error):
+            pass
+
+    def _reap_handlers(self):
+        """
+        Reap finished request handlers. This is done from the accept loop
+        instead of a SIGCHLD handler: a signal would interrupt the git
+        commands run by L{warm}, and waiting for any child would reap them.
+        """
+        for pid in list(self._handlers):
+            try:
+                if os.waitpid(pid, os.WNOHANG)[0]:
+                    self._handlers.discard(pid)
+            except OSError as err:
+                if err.errno != errno.ECHILD:
+                    raise
+                self._handlers.discard(pid)
+
+    def _read_request(self, conn):
+        """Read and decode the request of a client"""
+        rfile = conn.makefile('rb')
+        line = rfile.readline(self.max_request_size)
+        rfile.close()
+        request = _to_str(json.loads(line))
+        if (not isinstance(request.get('argv'), list) or
+                not isinstance(request.get('env'), dict) or
+                not request.get('cwd')):
+            raise ValueError("Invalid request")
+        return request
+
+    @staticmethod
+    def _run_worker(request, out_w, err_w):
+        """Run the requested command, in the worker process"""
+        from gbp.scripts.supercommand import supercommand
+        devnull = os.open(os.devnull, os.O_RDONLY)
+        os.dup2(devnull, 0)
+        os.dup2(out_w, 1)
+        os.dup2(err_w, 2)
+        os.close(devnull)
+        # Make sure Python level output ends up in the redirected fds
+        sys.stdout, sys.stderr = sys.__stdout__, sys.__stderr__
+        # Log like a freshly started command, whatever the server did
+        for hdlr in list(gbp.log.LOGGER.handlers):
+            gbp.log.LOGGER.removeHandler(hdlr)
+        if isinstance(gbp.log.LOGGER, gbp.log.GbpLogger):
+            gbp.log.LOGGER.init_default_handlers()
+        retval = 1
+        try:
+            os.chdir(request['cwd'])
+            os.environ.clear()
+            os.environ.update(request['env'])
+            os.environ.pop(SOCKET_ENV, None)
+            sys.argv = request['argv']
+            retval = supercommand(request['argv'])
+        except SystemExit as err:
+            retval = err.code
+        except Exception:
+            import traceback
+            traceback.print_exc()
+        if not isinstance(retval, int):
+            retval = 0 if retval is None else 1
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(retval)
+
+    def _handle(self, conn, request):
+        """Run a request and relay its output, in the handler process"""
+        out_r, out_w = os.pipe()
+        err_r, err_w = os.pipe()
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            conn.close()
+            os.close(out_r)
+            os.close(err_r)
+            self._run_worker(request, out_w, err_w)
+        os.close(out_w)
+        os.close(err_w)
+
+        channels = {out_r: '1', err_r: '2'}
+        client_gone = False
+        while channels:
+            ready = select.select(list(channels), [], [])[0]
+            for fd in ready:
+                data = os.read(fd, 65536)
+                if not data:
+                    os.close(fd)
+                    del channels[fd]
+                elif not client_gone:
+                    try:
+                        _send_frame(conn, channels[fd], data)
+                    except socket.error:
+                        # Client died, so should the command
+                        client_gone = True
+                        os.kill(pid, signal.SIGTERM)
+        status = os.waitpid(pid, 0)[1]
+        if os.WIFSIGNALED(status):
+            retval = 128 + os.WTERMSIG(status)
+        else:
+            retval = os.WEXITSTATUS(status)
+        if not client_gone:
+            try:
+                _send_frame(conn, 'x', str(retval))
+            except socket.error:
+                pass
+
+    def _serve_one(self, conn):
+        """Serve one client connection"""
+        try:
+            request = self._read_request(conn)
+        except (ValueError, socket.error) as err:
+            gbp.log.warn("Invalid request: %s" % err)
+            conn.close()
+            return
+        gbp.log.debug("Running %s in '%s'" % (request['argv'],
+                                             request['cwd']))
+        self.warm(request)
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            retval = 0
+            try:
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                self._listener.close()
+                self._handle(conn, request)
+            except Exception as err:
+                gbp.log.err("Failed to handle request: %s" % err)
+                retval = 1
+            finally:
+                os._exit(retval)
+        self._handlers.add(pid)
+        conn.close()
+
+    def serve(self):
+        """Serve clients until interrupted"""
+        from gbp.git.repository import GitRepository
+
+        self._bind()
+        self.preload()
+        GitRepository.enable_dir_cache()
+        signal.signal(signal.SIGTERM, lambda _signum, _frame: sys.exit(0))
+        gbp.log.info("Listening on '%s'" % self.socket_path)
+        try:
+            while True:
+                self._reap_handlers()
+                try:
+                    if not select.select([self._listener], [], [],
+                                         self.reap_interval)[0]:
+                        continue
+                    conn = self._listener.accept()[0]
+                except (select.error, socket.error) as err:
+                    if err.args[0] == errno.EINTR:
+                        continue
+                    raise
+                self._serve_one(conn)
+        finally:
+            self._listener.close()
+            os.unlink(self.socket_path)
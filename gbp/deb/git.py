@@ -76,10 +76,10 @@ class DebianGitRepository(GitRepository):
             # dereference to a commit object
             return self.rev_parse("%s^0" % tag)
         elif self.has_tag(legacy_tag):
-            out, ret = self._git_getoutput('cat-file', args=['-p', legacy_tag])
+            out, _err, ret = self._git_inout('cat-file', ['-p', legacy_tag])
             if ret:
                 return None
-            for line in out:
+            for line in out.splitlines(True):
                 if line.endswith(" %s\n" % version):
                     # dereference to a commit object
                     return self.rev_parse("%s^0" % legacy_tag)
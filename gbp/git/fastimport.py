@@ -19,6 +19,7 @@
 
 import subprocess
 import time
+import gbp.profile
 from gbp.errors import GbpError
 
 class FastImport(object):
@@ -35,8 +36,11 @@ class FastImport(object):
         @type repo: L{GitRepository}
         """
         self._repo = repo
+        self._cmd = ['git', 'fast-import', '--quiet']
+        self._start = time.time()
+        self._bytes = 0
         try:
-            self._fi = subprocess.Popen([ 'git', 'fast-import', '--quiet'],
+            self._fi = subprocess.Popen(self._cmd,
                                         stdin=subprocess.PIPE, cwd=repo.path)
             self._out = self._fi.stdin
         except OSError as err:
@@ -45,18 +49,22 @@ class FastImport(object):
             raise GbpError(
                 "Invalid argument when spawning git fast-import: %s" % err)
 
+    def _write(self, data):
+        self._out.write(data)
+        self._bytes += len(data)
+
     def _do_data(self, fd, size):
-        self._out.write("data %s\n" % size)
+        self._write("data %s\n" % size)
         while True:
             data = fd.read(self._bufsize)
-            self._out.write(data)
+            self._write(data)
             if len(data) != self._bufsize:
                 break
-        self._out.write("\n")
+        self._write("\n")
 
     def _do_file(self, filename, mode, fd, size):
         name = "/".join(filename.split('/')[1:])
-        self._out.write("M %d inline %s\n" % (mode, name))
+        self._write("M %d inline %s\n" % (mode, name))
         self._do_data(fd, size)
 
     def add_file(self, filename, fd, size, mode=m_regular):
@@ -83,9 +91,9 @@ class FastImport(object):
         @param linktarget: the target the symlink points to
         @type linktarget: C{str}
         """
-        self._out.write("M %d inline %s\n" % (self.m_symlink, linkname))
-        self._out.write("data %s\n" % len(linktarget))
-        self._out.write("%s\n" % linktarget)
+        self._write("M %d inline %s\n" % (self.m_symlink, linkname))
+        self._write("data %s\n" % len(linktarget))
+        self._write("%s\n" % linktarget)
 
     def start_commit(self, branch, committer, msg):
         """
@@ -108,7 +116,7 @@ class FastImport(object):
         else:
             from_ = ''
 
-        self._out.write("""commit refs/heads/%(branch)s
+        self._write("""commit refs/heads/%(branch)s
 committer %(name)s <%(email)s> %(time)s
 data %(length)s
 %(msg)s%(from)s""" %
@@ -125,7 +133,7 @@ data %(length)s
         """
         Issue I{deleteall} to fastimport so we start from a empty tree
         """
-        self._out.write("deleteall\n")
+        self._write("deleteall\n")
 
     def close(self):
         """
@@ -135,6 +143,13 @@ data %(length)s
             self._out.close()
         if self._fi:
             self._fi.wait()
+            if self._start is not None:
+                gbp.profile.record_command(self._cmd, self._start,
+                                           time.time() - self._start,
+                                           cwd=self._repo.path,
+                                           returncode=self._fi.returncode,
+                                           stdin_bytes=self._bytes)
+                self._start = None
 
     def __del__(self):
         self.close()
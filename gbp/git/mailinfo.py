@@ -0,0 +1,501 @@
+# vim: set fileencoding=utf-8 :
+#
+# (C) 2026 agent <agent@local>
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, please see
+#    <http://www.gnu.org/licenses/>
+"""
+Extract the author, subject and message from a patch like I{git mailinfo}
+
+This is a reimplementation of the parts of I{git mailinfo} needed for
+reading patch headers, so that no subprocess is needed for every patch.
+Mails that need MIME decoding or charset conversion are not handled; for
+those L{MailinfoUnsupported} is raised and the caller should fall back to
+running git.
+"""
+
+import base64
+import binascii
+import re
+
+#: Headers extracted from the mail, in the order git outputs them
+HEADERS = ['From', 'Subject', 'Date']
+
+_WHITESPACE = ' \t\n\r\v\f'
+
+
+class MailinfoUnsupported(Exception):
+    """The mail needs features only I{git mailinfo} has"""
+    pass
+
+
+def cleanup_space(value):
+    """
+    Replace runs of whitespace with a single space
+
+    >>> cleanup_space('foo \\t bar\\n')
+    'foo bar '
+    """
+    return re.sub(r'\s+', ' ', value)
+
+
+def cleanup_subject(subject):
+    """
+    Remove reply markers and bracketed prefixes from a subject
+
+    >>> cleanup_subject('Re: [PATCH 1/2] [foo] Fix bar [baz]')
+    'Fix bar [baz]'
+    >>> cleanup_subject(' re:RE: : Reply')
+    'Reply'
+    >>> cleanup_subject('[PATCH] Really')
+    'Really'
+    >>> cleanup_subject('[unterminated prefix')
+    '[unterminated prefix'
+    """
+    pos = 0
+    while pos < len(subject):
+        char = subject[pos]
+        if char in 'rR':
+            if len(subject) > pos + 3 and subject[pos + 1] in 'eE' and \
+                    subject[pos + 2] == ':':
+                subject = subject[:pos] + subject[pos + 3:]
+                continue
+        elif char in ' \t:':
+            subject = subject[:pos] + subject[pos + 1:]
+            continue
+        elif char == '[':
+            end = subject.find(']', pos)
+            if end >= 0:
+                subject = subject[:pos] + subject[end + 1:]
+                continue
+        break
+    return subject.strip(_WHITESPACE)
+
+
+def is_scissors_line(line):
+    """
+    Is this a scissors line, i.e. "-- >8 --" or similar
+
+    >>> is_scissors_line('-- >8 --')
+    True
+    >>> is_scissors_line('------------------ 8< ------------------\\n')
+    True
+    >>> is_scissors_line('-- >8 -- cut here, all of the above is dropped')
+    False
+    >>> is_scissors_line('--------')
+    False
+    """
+    scissors = gap = perforation = 0
+    in_perforation = False
+    first = last = None
+    pos = 0
+    while pos < len(line):
+        char = line[pos]
+        if char in _WHITESPACE:
+            if in_perforation:
+                perforation += 1
+                gap += 1
+            pos += 1
+            continue
+        last = pos
+        if first is None:
+            first = pos
+        if char == '-':
+            in_perforation = True
+            perforation += 1
+        elif line[pos:pos + 2] in ('>8', '8<', '>%', '%<'):
+            in_perforation = True
+            perforation += 2
+            scissors += 2
+            pos += 1
+        else:
+            in_perforation = False
+        pos += 1
+    visible = last - first + 1 if first is not None else 0
+    return bool(scissors and 8 <= visible < perforation * 3 and
+                gap * 2 < perforation)
+
+
+def is_patch_break(line):
+    """
+    Does the patch (i.e. the end of the message) start at this line
+
+    >>> is_patch_break('diff --git a/foo b/foo\\n')
+    True
+    >>> is_patch_break('--- a/foo\\n')
+    True
+    >>> is_patch_break('---\\n')
+    True
+    >>> is_patch_break('----- foo\\n')
+    False
+    """
+    if line.startswith('diff -') or line.startswith('Index: '):
+        return True
+    if len(line) < 4 or not line.startswith('---'):
+        return False
+    if line[3] == ' ' and line[4:5] not in list(_WHITESPACE):
+        return True
+    for char in line[3:]:
+        if char == '\n':
+            return True
+        if char not in _WHITESPACE:
+            break
+    return False
+
+
+def _to_utf8(text, charset):
+    """Re-encode text to UTF-8"""
+    if not charset or charset.lower() in ('utf-8', 'utf8'):
+        return text
+    try:
+        return text.decode(charset).encode('utf-8')
+    except (LookupError, UnicodeError):
+        raise MailinfoUnsupported("Cannot convert from '%s'" % charset)
+
+
+def _decode_q(text):
+    """Decode the Q encoding of RFC 2047"""
+    return re.sub(r'=([0-9A-Fa-f]{2})|_',
+                  lambda match: chr(int(match.group(1), 16))
+                  if match.group(1) else ' ', text)
+
+
+def decode_header(value):
+    """
+    Decode RFC 2047 encoded-words in a header value to UTF-8. Whitespace
+    between adjacent encoded-words is dropped. Values with malformed
+    encoded-words are returned unchanged.
+
+    >>> decode_header('=?iso-8859-1?q?J=F6rg?= =?utf-8?b?TcO8bGxlcg==?= <j@m>')
+    'J\\xc3\\xb6rgM\\xc3\\xbcller <j@m>'
+    >>> decode_header('Fix =?utf-8?q?f=C3=B6=5Fo_bar?=')
+    'Fix f\\xc3\\xb6_o bar'
+    >>> decode_header('=?broken')
+    '=?broken'
+    """
+    out = []
+    pos = 0
+    while True:
+        start = value.find('=?', pos)
+        if start < 0:
+            break
+        gap = value[pos:start]
+        if gap.strip(_WHITESPACE) or pos == 0:
+            out.append(gap)
+        qmark = value.find('?', start + 2)
+        if qmark < 0 or qmark + 2 >= len(value) or value[qmark + 2] != '?':
+            return value
+        end = value.find('?=', qmark + 3)
+        if end < 0:
+            return value
+        charset = value[start + 2:qmark]
+        encoding = value[qmark + 1].lower()
+        text = value[qmark + 3:end]
+        if encoding == 'q':
+            text = _decode_q(text)
+        elif encoding == 'b':
+            try:
+                text = base64.b64decode(text + '=' * (-len(text) % 4))
+            except (TypeError, binascii.Error):
+                raise MailinfoUnsupported("Invalid base64 in header")
+        else:
+            return value
+        out.append(_to_utf8(text, charset))
+        pos = end + 2
+    out.append(value[pos:])
+    return ''.join(out)
+
+
+def _sane_name(name, email):
+    """Use the email if the name looks bogus"""
+    if not name or len(name) > 60 or re.search('[@<>]', name):
+        return email
+    return name
+
+
+def _unquote(value, pos, end):
+    """
+    Unquote a quoted string or comment starting at I{pos} until the closing
+    I{end} character, returns the text and the position after it
+    """
+    out = ''
+    while pos < len(value):
+        char = value[pos]
+        pos += 1
+        if char == '\\':
+            out += value[pos:pos + 1]
+            pos += 1
+        elif char == end:
+            return out + (end if end == ')' else ''), pos
+        elif char == '(' and end == ')':
+            text, pos = _unquote(value, pos, ')')
+            out += '(' + text
+        else:
+            out += char
+    return out, pos
+
+
+def unquote_quoted_pair(value):
+    """
+    Remove the quotes of quoted strings and the quoting backslashes in
+    quoted strings and comments, like git mailinfo does
+
+    >>> unquote_quoted_pair('"J. Random Hacker" <jrh@example.com>')
+    'J. Random Hacker <jrh@example.com>'
+    >>> unquote_quoted_pair(r'"Foo \\"Bar\\" Baz" (a \\(b\\) (c))')
+    'Foo "Bar" Baz (a (b) (c))'
+    """
+    out = ''
+    pos = 0
+    while pos < len(value):
+        char = value[pos]
+        pos += 1
+        if char == '"':
+            text, pos = _unquote(value, pos, '"')
+        elif char == '(':
+            text, pos = _unquote(value, pos, ')')
+            text = '(' + text
+        else:
+            text = char
+        out += text
+    return out
+
+
+def parse_from(value):
+    """
+    Split the value of a From header into name and email
+
+    >>> parse_from('Foo Bar <foo@example.com>')
+    ('Foo Bar', 'foo@example.com')
+    >>> parse_from('foo@example.com (Foo Bar)')
+    ('Foo Bar', 'foo@example.com')
+    >>> parse_from('foo@example.com')
+    ('foo@example.com', 'foo@example.com')
+    >>> parse_from('Foo Bar <foo>')
+    ('Foo Bar', 'foo')
+    >>> parse_from('Foo Bar')
+    ('', '')
+    >>> parse_from('"J. Random Hacker" <jrh@example.com>')
+    ('J. Random Hacker', 'jrh@example.com')
+    """
+    value = cleanup_space(value)
+    if '@' in value:
+        value = unquote_quoted_pair(value)
+    at_pos = value.find('@')
+    if at_pos < 0:
+        match = re.match(r'([^<]*)<([^>]*)>', value)
+        if not match:
+            return '', ''
+        name, email = match.group(1).strip(_WHITESPACE), match.group(2)
+        return _sane_name(name, email), email
+    start = at_pos
+    while start > 0:
+        char = value[start - 1]
+        if char in _WHITESPACE:
+            break
+        if char == '<':
+            value = value[:start - 1] + ' ' + value[start:]
+            break
+        start -= 1
+    end = start
+    while end < len(value) and value[end] not in _WHITESPACE + '>':
+        end += 1
+    email = value[start:end]
+    name = value[:start] + value[end + 1:]
+    name = cleanup_space(name).strip(_WHITESPACE)
+    if name.startswith('(') and name.endswith(')'):
+        name = name[1:-1]
+    return _sane_name(name, email), email
+
+
+def _header_match(line, header):
+    """Value of I{header} if the line is that header, C{None} otherwise"""
+    length = len(header)
+    if line[:length].lower() == header.lower() and \
+            line[length:length + 1] == ':' and \
+            line[length + 1:length + 2] and \
+            line[length + 1] in _WHITESPACE:
+        return line[length + 1:].lstrip(_WHITESPACE)
+    return None
+
+
+def _is_rfc2822_header(line):
+    """Does the line look like a mail header"""
+    if line.startswith('From ') or line.startswith('>From '):
+        return True
+    return re.match(r'[\x21-\x39\x3b-\x7e]*:', line) is not None
+
+
+class _LineReader(object):
+    """Line iterator with one line of lookahead"""
+    def __init__(self, lines):
+        self._lines = iter(lines)
+        self._next = None
+
+    def peek(self):
+        if self._next is None:
+            self._next = next(self._lines, '')
+        return self._next
+
+    def readline(self):
+        line = self.peek()
+        self._next = None
+        return line
+
+
+def _read_headers(reader):
+    """
+    Read the mail headers, unfolding continuation lines
+
+    @return: the headers and the first line of the body
+    @rtype: C{tuple} of (C{list} of C{str}, C{str})
+    """
+    headers = []
+    # Leading whitespace is skipped
+    line = reader.readline()
+    while line and not line.strip(_WHITESPACE):
+        line = reader.readline()
+    line = line.lstrip(_WHITESPACE) if line.strip(_WHITESPACE) else line
+    while line:
+        stripped = line.rstrip(_WHITESPACE)
+        if not stripped or not _is_rfc2822_header(stripped):
+            return headers, stripped + '\n'
+        while reader.peek()[:1] in (' ', '\t'):
+            stripped += ' ' + reader.readline()[1:].rstrip(_WHITESPACE)
+        headers.append(stripped)
+        line = reader.readline()
+    return headers, ''
+
+
+def _check_mime(headers):
+    """Refuse mails that need MIME decoding or charset conversion"""
+    for line in headers:
+        content_type = _header_match(line, 'Content-Type')
+        if content_type is not None:
+            if content_type.lower().startswith('multipart/'):
+                raise MailinfoUnsupported("Multipart message")
+            match = re.search(r'charset\s*=\s*"?([^";\s]+)', content_type,
+                              re.IGNORECASE)
+            if match and match.group(1).lower() not in ('utf-8', 'utf8',
+                                                        'us-ascii'):
+                raise MailinfoUnsupported("Charset '%s'" % match.group(1))
+        encoding = _header_match(line, 'Content-Transfer-Encoding')
+        if encoding is not None and \
+                encoding.strip().lower() not in ('7bit', '8bit', 'binary'):
+            raise MailinfoUnsupported("Transfer encoding '%s'" % encoding)
+
+
+def _store_header(line, values, overwrite):
+    """Store the value of an interesting header, returns True if it was"""
+    for header in HEADERS:
+        if header in values and not overwrite:
+            continue
+        value = _header_match(line, header)
+        if value is not None:
+            values[header] = decode_header(value)
+            return True
+    return False
+
+
+def mailinfo(lines, scissors=False):
+    """
+    Extract the author, subject, date and commit message from a patch,
+    like I{git mailinfo} does
+
+    @param lines: lines of the patch
+    @type lines: iterable of C{str}
+    @param scissors: remove everything before a scissors line from the
+        message, like I{git mailinfo --scissors}
+    @type scissors: C{bool}
+    @return: the info with lowercase keys, as output by git (I{author},
+        I{email}, I{subject} and I{date}), and the commit message
+    @rtype: C{tuple} of (C{dict}, C{str})
+    @raises MailinfoUnsupported: if the patch needs MIME decoding or
+        charset conversion
+    """
+    reader = _LineReader(lines)
+    headers, line = _read_headers(reader)
+    _check_mime(headers)
+    mail_headers = {}
+    for header in headers:
+        _store_header(header, mail_headers, True)
+
+    inbody_headers = {}
+    message = []
+    accum = ''
+    header_stage = True
+    has_patch = False
+    while line:
+        if header_stage:
+            if line == '\n':
+                if accum:
+                    _store_header(accum, inbody_headers, False)
+                    accum = ''
+                    header_stage = False
+                line = reader.readline()
+                continue
+            if accum and line[0] in ' \t' and \
+                    not (scissors and is_scissors_line(line)):
+                accum = accum.rstrip('\n') + line
+                line = reader.readline()
+                continue
+            if accum:
+                _store_header(accum, inbody_headers, False)
+                accum = ''
+            if line.startswith('[PATCH]') and line[7:8] and \
+                    line[7] in _WHITESPACE:
+                if 'Subject' not in inbody_headers:
+                    inbody_headers['Subject'] = line
+                line = reader.readline()
+                continue
+            if line.startswith('>From') and line[5:6] and \
+                    line[5] in _WHITESPACE:
+                raise MailinfoUnsupported("Format-patch separator in body")
+            if any([header not in inbody_headers and
+                    _header_match(line, header) is not None
+                    for header in HEADERS]):
+                accum = line
+                line = reader.readline()
+                continue
+            header_stage = False
+
+        if scissors and is_scissors_line(line):
+            message = []
+            inbody_headers = {}
+            header_stage = True
+        elif is_patch_break(line):
+            has_patch = True
+            break
+        else:
+            message.append(line)
+        line = reader.readline()
+    if accum:
+        _store_header(accum, inbody_headers, False)
+
+    info = {}
+    for header in HEADERS:
+        if has_patch and header in inbody_headers:
+            value = inbody_headers[header]
+        elif header in mail_headers:
+            value = mail_headers[header]
+        else:
+            continue
+        if header == 'From':
+            info['author'], info['email'] = parse_from(value)
+        elif header == 'Subject':
+            info['subject'] = cleanup_space(cleanup_subject(value))
+        else:
+            info[header.lower()] = cleanup_space(value)
+    for key in info:
+        info[key] = info[key].strip(_WHITESPACE)
+    return info, ''.join(message)
@@ -22,8 +22,10 @@ import os.path
 import re
 from collections import defaultdict
 import select
+import time
 
 import gbp.log as log
+import gbp.profile
 from gbp.git.modifier import GitModifier
 from gbp.git.commit import GitCommit
 from gbp.git.errors import GitError
@@ -101,8 +103,46 @@ class GitRepository(object):
                                               capture_stderr=True)
             self._path = os.path.abspath(out.strip())
 
+    # Locations of repositories opened earlier, see enable_dir_cache()
+    _dir_cache = None
+
+    @staticmethod
+    def enable_dir_cache():
+        """
+        Remember the locations of the repositories opened in this process so
+        that opening the same repository again doesn't need to run git.
+        Meant for long-running processes, like the gbp daemon.
+        """
+        GitRepository._dir_cache = {}
+
+    @staticmethod
+    def _dir_cache_stamp(git_dir):
+        """Modification time of the repository config, None if missing"""
+        try:
+            return os.stat(os.path.join(git_dir, 'config')).st_mtime
+        except OSError:
+            return None
+
+    def _dir_cache_lookup(self, key):
+        """Set repository locations from the cache, if valid"""
+        try:
+            bare, git_dir, path, stamp = GitRepository._dir_cache[key]
+        except (TypeError, KeyError):
+            return False
+        if (stamp is None or self._dir_cache_stamp(git_dir) != stamp or
+                not os.path.isdir(path)):
+            del GitRepository._dir_cache[key]
+            return False
+        self._bare, self._git_dir, self._path = bare, git_dir, path
+        return True
+
     def __init__(self, path):
         self._path = os.path.abspath(path)
+        # Git dir discovery depends on the environment, too
+        cache_key = (self._path, os.getenv('GIT_DIR'),
+                     os.getenv('GIT_WORK_TREE'))
+        if self._dir_cache_lookup(cache_key):
+            return
         try:
             # Check for bare repository
             out, dummy, ret = self._git_inout('rev-parse', ['--is-bare-repository'],
@@ -118,6 +158,11 @@ class GitRepository(object):
         except:
             raise GitRepositoryError("No Git repository at '%s' (or any parent dir)" % self.path)
 
+        if GitRepository._dir_cache is not None:
+            GitRepository._dir_cache[cache_key] = (
+                    self._bare, self._git_dir, self._path,
+                    self._dir_cache_stamp(self._git_dir))
+
 
     @staticmethod
     def __build_env(extra_env):
@@ -128,9 +173,13 @@ class GitRepository(object):
             env.update(extra_env)
         return env
 
-    def _git_getoutput(self, command, args=[], extra_env=None, cwd=None):
+    def _git_readlines(self, command, args=[], extra_env=None, cwd=None):
         """
-        Run a git command and return the output
+        Run a git command and return its output line by line
+
+        Output is read as it becomes available and handed out as a generator,
+        so callers only interested in the first few lines may stop consuming
+        early, which terminates the git command.
 
         @param command: git command to run
         @type command: C{str}
@@ -140,24 +189,28 @@ class GitRepository(object):
         @type extra_env: C{dict}
         @param cwd: directory to swith to when running the command, defaults to I{self.path}
         @type cwd: C{str}
-        @return: stdout, return code
-        @rtype: C{tuple} of C{list} of C{str} and C{int}
-
-        @deprecated: use L{gbp.git.repository.GitRepository._git_inout} instead.
+        @return: stdout lines, including the line terminator
+        @rtype: generator of C{str}
+        @raises GitRepositoryError: if the git command fails, the return code
+            is stored in the I{returncode} attribute
         """
-        output = []
-
         if not cwd:
             cwd = self.path
-
-        env = self.__build_env(extra_env)
-        cmd = ['git', command] + args
-        log.debug(cmd)
-        popen = subprocess.Popen(cmd, stdout=subprocess.PIPE, env=env, cwd=cwd)
-        while popen.poll() == None:
-            output += popen.stdout.readlines()
-        output += popen.stdout.readlines()
-        return output, popen.returncode
+        output = self.__git_inout(command, args, None, extra_env, cwd,
+                                  False, True)
+        partial = ''
+        try:
+            for stdout, _stderr in output:
+                if not stdout:
+                    continue
+                lines = (partial + stdout).split('\n')
+                partial = lines.pop()
+                for line in lines:
+                    yield line + '\n'
+            if partial:
+                yield partial
+        finally:
+            output.close()
 
     def _git_inout(self, command, args, input=None, extra_env=None, cwd=None,
                    capture_stderr=False, capture_stdout=True):
@@ -166,8 +219,9 @@ class GitRepository(object):
 
         @param command: git command to run
         @type command: C{str}
-        @param input: input to pipe to command
-        @type input: C{str}
+        @param input: input to pipe to command, a string or a file object
+            to read the input from
+        @type input: C{str} or C{file}
         @param args: list of arguments
         @type args: C{list}
         @param extra_env: extra environment variables to pass
@@ -235,8 +289,19 @@ class GitRepository(object):
         stdout_arg = subprocess.PIPE if capture_stdout else None
         stdin_arg = subprocess.PIPE if stdin else None
         stderr_arg = subprocess.PIPE if capture_stderr else None
+        stream = None
+        if stdin and not isinstance(stdin, six.string_types):
+            try:
+                # Real files are given to git as is
+                stdin.fileno()
+                stdin_arg = stdin
+                stdin = None
+            except (AttributeError, IOError):
+                stream = stdin
+                stdin = ''
 
         log.debug(cmd)
+        start = time.time()
         popen = subprocess.Popen(cmd,
                                  stdin=stdin_arg,
                                  stdout=stdout_arg,
@@ -247,26 +312,53 @@ class GitRepository(object):
         out_fds = [popen.stdout] if capture_stdout else []
         if capture_stderr:
             out_fds.append(popen.stderr)
-        in_fds = [popen.stdin] if stdin else []
+        in_fds = [popen.stdin] if stdin or stream else []
         w_ind = 0
-        while out_fds or in_fds:
-            ready = select.select(out_fds, in_fds, [])
-            # Write in chunks of 512 bytes
-            if ready[1]:
-                popen.stdin.write(stdin[w_ind:w_ind+512])
-                w_ind += 512
-                if w_ind > len(stdin):
-                    rm_polled_fd(popen.stdin, in_fds)
-            # Read in chunks of 4k
-            stdout = popen.stdout.read(4096) if popen.stdout in ready[0] else ''
-            stderr = popen.stderr.read(4096) if popen.stderr in ready[0] else ''
-            if popen.stdout in ready[0] and not stdout:
-                rm_polled_fd(popen.stdout, out_fds)
-            if popen.stderr in ready[0] and not stderr:
-                rm_polled_fd(popen.stderr, out_fds)
-            yield stdout, stderr
-
-        if popen.wait():
+        nbytes = {'stdin_bytes': len(stdin) if stdin else 0,
+                  'stdout_bytes': 0, 'stderr_bytes': 0}
+        try:
+            while out_fds or in_fds:
+                ready = select.select(out_fds, in_fds, [])
+                if ready[1] and stream:
+                    data = stream.read(4096)
+                    if data:
+                        popen.stdin.write(data)
+                        nbytes['stdin_bytes'] += len(data)
+                    else:
+                        rm_polled_fd(popen.stdin, in_fds)
+                # Write in chunks of 512 bytes
+                elif ready[1]:
+                    popen.stdin.write(stdin[w_ind:w_ind+512])
+                    w_ind += 512
+                    if w_ind > len(stdin):
+                        rm_polled_fd(popen.stdin, in_fds)
+                # Read whatever is available, max 4k, without blocking
+                stdout = os.read(popen.stdout.fileno(), 4096) \
+                            if popen.stdout in ready[0] else ''
+                stderr = os.read(popen.stderr.fileno(), 4096) \
+                            if popen.stderr in ready[0] else ''
+                if popen.stdout in ready[0] and not stdout:
+                    rm_polled_fd(popen.stdout, out_fds)
+                if popen.stderr in ready[0] and not stderr:
+                    rm_polled_fd(popen.stderr, out_fds)
+                nbytes['stdout_bytes'] += len(stdout)
+                nbytes['stderr_bytes'] += len(stderr)
+                yield stdout, stderr
+        except GeneratorExit:
+            # The caller stopped reading: close our ends of the pipes so
+            # that git terminates, and reap it
+            for file_obj in out_fds + in_fds:
+                file_obj.close()
+            popen.wait()
+            gbp.profile.record_command(cmd, start, time.time() - start,
+                                       cwd=cwd, returncode=popen.returncode,
+                                       **nbytes)
+            raise
+
+        popen.wait()
+        gbp.profile.record_command(cmd, start, time.time() - start, cwd=cwd,
+                                   returncode=popen.returncode, **nbytes)
+        if popen.returncode:
             err = GitRepositoryError('git-%s failed' % command)
             err.returncode = popen.returncode
             raise err
@@ -551,14 +643,14 @@ class GitRepository(object):
         """
         has_local = False       # local repo has new commits
         has_remote = False      # remote repo has new commits
-        out = self._git_getoutput('rev-list', ["--left-right",
-                                   "%s...%s" % (from_branch, to_branch),
-                                   "--"])[0]
+        out = self._git_inout('rev-list', ["--left-right",
+                              "%s...%s" % (from_branch, to_branch),
+                              "--"])[0]
 
         if not out: # both branches have the same commits
             return True, True
 
-        for line in out:
+        for line in out.splitlines():
             if line.startswith("<"):
                 has_local = True
             elif line.startswith(">"):
@@ -582,8 +674,8 @@ class GitRepository(object):
         """
         args = [ '--format=%(refname:short)' ]
         args += [ 'refs/remotes/' ] if remote else [ 'refs/heads/' ]
-        out = self._git_getoutput('for-each-ref', args)[0]
-        return [ ref.strip() for ref in out ]
+        out = self._git_inout('for-each-ref', args)[0]
+        return [ ref.strip() for ref in out.splitlines() ]
 
     def get_local_branches(self):
         """
@@ -641,8 +733,8 @@ class GitRepository(object):
         args.add('--contains')
         args.add(commit)
 
-        out, ret =  self._git_getoutput('branch', args.args)
-        for line in out:
+        out, _err, ret = self._git_inout('branch', args.args)
+        for line in out.splitlines():
             # remove prefix '*' for current branch before comparing
             line = line.replace('*', '')
             if line.strip() == branch:
@@ -694,9 +786,9 @@ class GitRepository(object):
         else:
             raise GitRepositoryError("Branch %s doesn't exist!" % local_branch)
 
-        out = self._git_getoutput('for-each-ref', args.args)[0]
+        out = self._git_inout('for-each-ref', args.args)[0]
 
-        return out[0].strip()
+        return out.strip()
 
 #{ Tags
 
@@ -752,8 +844,8 @@ class GitRepository(object):
         @return: C{True} if the repository has that tag, C{False} otherwise
         @rtype: C{bool}
         """
-        out, ret = self._git_getoutput('tag', [ '-l', tag ])
-        return [ False, True ][len(out)]
+        out, _err, ret = self._git_inout('tag', [ '-l', tag ])
+        return [ False, True ][len(out.splitlines())]
 
     def describe(self, commitish, pattern=None, longfmt=False, always=False,
                  abbrev=None, tags=False, exact_match=False):
@@ -838,7 +930,32 @@ class GitRepository(object):
         @rtype: C{list} of C{str}
         """
         args = [ '-l', pattern ] if pattern else []
-        return [ line.strip() for line in self._git_getoutput('tag', args)[0] ]
+        out = self._git_inout('tag', args)[0]
+        return [ line.strip() for line in out.splitlines() ]
+
+    def get_tag_commits(self, pattern=None):
+        """
+        Get the commits the tags point to, with one ref listing. Annotated
+        tags are dereferenced to the commit they tag.
+
+        @param pattern: only list tags matching I{pattern}
+        @type pattern: C{str}
+        @return: commit sha1 by tag name, tags not pointing to a commit are
+            left out
+        @rtype: C{dict}
+        """
+        args = ['--format=%(refname)%00%(objecttype)%00%(objectname)%00'
+                '%(*objecttype)%00%(*objectname)']
+        args += ['refs/tags/%s' % pattern] if pattern else ['refs/tags/']
+        out = self._git_inout('for-each-ref', args)[0]
+        commits = {}
+        for line in out.splitlines():
+            ref, objtype, sha1, peeled_type, peeled = line.split('\0')
+            if peeled_type:
+                objtype, sha1 = peeled_type, peeled
+            if objtype == 'commit':
+                commits[ref[len('refs/tags/'):]] = sha1
+        return commits
 
     def verify_tag(self, tag):
         """
@@ -884,9 +1001,9 @@ class GitRepository(object):
         args.add_true(ignore_untracked, '-uno')
         args.add_true(porcelain, '--porcelain')
 
-        out, ret = self._git_getoutput('status',
-                                       args.args,
-                                       extra_env={'LC_ALL': 'C'})
+        out, _err, ret = self._git_inout('status',
+                                         args.args,
+                                         extra_env={'LC_ALL': 'C'})
         if ret:
             raise GitRepositoryError("Can't get repository status")
         return out
@@ -911,7 +1028,7 @@ class GitRepository(object):
             # Get a more helpful error message.
             out = self._status(porcelain=False,
                                 ignore_untracked=ignore_untracked)
-            return (False, "".join(out))
+            return (False, out)
         else:
             return (True, '')
 
@@ -1067,6 +1184,38 @@ class GitRepository(object):
                                            capture_stderr=True)
         return [ True, False ][ret != 0]
 
+    def read_tree(self, treeish, index_file=None):
+        """
+        Replace the contents of the index with a tree, without touching the
+        working copy
+
+        @param treeish: the tree to read
+        @type treeish: C{str}
+        @param index_file: alternate index file to read the tree into
+        @type index_file: C{str}
+        """
+        extra_env = {'GIT_INDEX_FILE': index_file} if index_file else None
+        self._git_command('read-tree', [treeish], extra_env)
+
+    def update_index(self, entries, index_file=None):
+        """
+        Add existing objects to the index, without touching the working copy
+
+        @param entries: entries to add, as returned by L{list_tree}
+        @type entries: C{list} of [ mode, type, sha1, path ]
+        @param index_file: alternate index file to update
+        @type index_file: C{str}
+        """
+        extra_env = {'GIT_INDEX_FILE': index_file} if index_file else None
+        info = ''.join(['%s %s\t%s\n' % (mode, sha1, path)
+                        for mode, _type, sha1, path in entries])
+        _out, err, ret = self._git_inout('update-index', ['--index-info'],
+                                         input=info, extra_env=extra_env,
+                                         capture_stderr=True)
+        if ret:
+            raise GitRepositoryError("Failed to update index: %s" %
+                                     err.strip())
+
     def write_tree(self, index_file=None):
         """
         Create a tree object from the current index
@@ -1117,10 +1266,10 @@ class GitRepository(object):
         @return: type of the repository object
         @rtype: C{str}
         """
-        out, ret = self._git_getoutput('cat-file', args=['-t', obj])
+        out, _err, ret = self._git_inout('cat-file', ['-t', obj])
         if ret:
             raise GitRepositoryError("Not a Git repository object: '%s'" % obj)
-        return out[0].strip()
+        return out.strip()
 
     def list_tree(self, treeish, recurse=False, paths=None):
         """
@@ -1150,6 +1299,46 @@ class GitRepository(object):
                 tree.append(line.split(None, 3))
         return tree
 
+    def iter_objects(self, objects, missing_ok=False):
+        """
+        Read the contents of several objects using a single
+        I{git cat-file --batch} process.
+
+        @param objects: names of the objects to read
+        @type objects: C{list} of C{str}
+        @param missing_ok: yield C{(None, None)} for nonexistent objects
+            instead of raising an error
+        @type missing_ok: C{bool}
+        @return: type and contents of the objects, in the order given
+        @rtype: generator of C{tuple} of C{str}
+        """
+        if not objects:
+            return
+        stdin = ''.join(['%s\n' % obj for obj in objects])
+        buf = ''
+        for stdout, _stderr in self.__git_inout('cat-file', ['--batch'],
+                                                stdin, None, self.path,
+                                                False, True):
+            buf += stdout
+            while True:
+                header_end = buf.find('\n')
+                if header_end < 0:
+                    break
+                header = buf[:header_end].split()
+                if header[-1] == 'missing' and missing_ok:
+                    yield None, None
+                    buf = buf[header_end + 1:]
+                    continue
+                if header[-1] in ('missing', 'ambiguous'):
+                    raise GitRepositoryError("Object '%s' %s" %
+                                             (header[0], header[-1]))
+                obj_end = header_end + 1 + int(header[2])
+                # Contents are followed by a newline
+                if len(buf) <= obj_end:
+                    break
+                yield header[1], buf[header_end + 1:obj_end]
+                buf = buf[obj_end + 1:]
+
 #}
 
     def get_config(self, name):
@@ -1160,9 +1349,9 @@ class GitRepository(object):
         @return: fetched config value
         @rtype: C{str}
         """
-        value, ret = self._git_getoutput('config', [ name ])
+        value, _err, ret = self._git_inout('config', [ name ])
         if ret: raise KeyError
-        return value[0][:-1] # first line with \n ending removed
+        return value.split('\n', 1)[0] # first line with \n ending removed
 
     def get_author_info(self):
         """
@@ -1441,13 +1630,10 @@ class GitRepository(object):
                 args += [ '--%s' % t ]
             else:
                 raise GitRepositoryError("Unknown type '%s'" % t)
-        out, ret = self._git_getoutput('ls-files', args)
+        out, _err, ret = self._git_inout('ls-files', args)
         if ret:
             raise GitRepositoryError("Error listing files: '%d'" % ret)
-        if out:
-            return [ file for file in out[0].split('\0') if file ]
-        else:
-            return []
+        return [ file for file in out.split('\0') if file ]
 
 
     def write_file(self, filename, filters=True):
@@ -1641,10 +1827,13 @@ class GitRepository(object):
 
 #{ Commit Information
 
-    def get_commits(self, since=None, until=None, paths=None, num=0,
-                    first_parent=False, options=None):
+    def iter_commits(self, since=None, until=None, paths=None, num=0,
+                     first_parent=False, options=None):
         """
-        Get commits from since to until touching paths
+        Iterate over commits from since to until touching paths
+
+        Commits are yielded as soon as git outputs them, newest first, so
+        callers only interested in the first few can stop early.
 
         @param since: commit to start from
         @type since: C{str}
@@ -1659,6 +1848,8 @@ class GitRepository(object):
         @param first_parent: only follow first parent when seeing a
                              merge commit
         @type first_parent: C{bool}
+        @return: commit SHA1s
+        @rtype: generator of C{str}
         """
         args = GitArgs('--pretty=format:%H')
         args.add_true(num, '-%d' % num)
@@ -1673,12 +1864,26 @@ class GitRepository(object):
             paths = [ paths ]
         args.add_cond(paths, paths)
 
-        commits, ret = self._git_getoutput('log', args.args)
-        if ret:
+        try:
+            for commit in self._git_readlines('log', args.args):
+                yield commit.strip()
+        except GitRepositoryError:
             where = " on %s" % paths if paths else ""
             raise GitRepositoryError("Error getting commits %s..%s%s" %
                         (since, until, where))
-        return [ commit.strip() for commit in commits ]
+
+    def get_commits(self, since=None, until=None, paths=None, num=0,
+                    first_parent=False, options=None):
+        """
+        Get commits from since to until touching paths
+
+        See L{iter_commits} for the parameters.
+
+        @return: commit SHA1s, newest first
+        @rtype: C{list} of C{str}
+        """
+        return list(self.iter_commits(since, until, paths, num,
+                                      first_parent, options))
 
     def show(self, id):
         """git-show id"""
@@ -1725,6 +1930,32 @@ class GitRepository(object):
         """
         return self.get_commit_info(commit)['subject']
 
+    def iter_subjects(self, since=None, until=None):
+        """
+        Iterate over the subjects of the commits from since to until
+
+        @param since: commit to start from
+        @type since: C{str}
+        @param until: last commit to get
+        @type until: C{str}
+        @return: commit SHA1 and subject pairs, newest first
+        @rtype: generator of C{tuple} of C{str}
+        """
+        args = GitArgs('--pretty=format:%H %s')
+        if since:
+            args.add("%s..%s" % (since, until or 'HEAD'))
+        elif until:
+            args.add(until)
+        args.add("--")
+
+        try:
+            for line in self._git_readlines('log', args.args):
+                fields = line.rstrip('\n').split(' ', 1)
+                yield fields[0], fields[1] if len(fields) > 1 else ''
+        except GitRepositoryError:
+            raise GitRepositoryError("Error getting commit subjects %s..%s" %
+                                     (since, until))
+
     def get_commit_info(self, commitish):
         """
         Look up data of a specific commit-ish. Dereferences given commit-ish
@@ -1793,23 +2024,95 @@ class GitRepository(object):
         options.add('%s%s%s' % (start, '...' if symmetric else '..', end))
         options.add_cond(thread, '--thread=%s' % thread, '--no-thread')
 
-        output, ret = self._git_getoutput('format-patch', options.args)
-        return [ line.strip() for line in output ]
+        patches = []
+        try:
+            for line in self._git_readlines('format-patch', options.args):
+                patches.append(line.strip())
+        except GitRepositoryError:
+            pass
+        return patches
+
+    def apply_patch(self, patch, index=True, context=None, strip=None,
+                    cached=False, index_file=None, three_way=False):
+        """
+        Apply a patch using git apply
 
-    def apply_patch(self, patch, index=True, context=None, strip=None):
-        """Apply a patch using git apply"""
+        @param patch: the patch file or a file object to read the patch from
+        @type patch: C{str} or C{file}
+        @param cached: only apply the patch to the index, leaving the
+            working copy untouched
+        @type cached: C{bool}
+        @param index_file: alternate index file to apply the patch to
+        @type index_file: C{str}
+        @param three_way: fall back to a three-way merge if the patch does
+            not apply cleanly
+        @type three_way: C{bool}
+        """
         args = []
         if context:
             args += [ '-C', context ]
-        if index:
+        if cached:
+            args.append("--cached")
+        elif index:
             args.append("--index")
         if strip != None:
             args += [ '-p', str(strip) ]
-        args.append(patch)
-        self._git_command("apply", args)
+        if three_way:
+            args.append('--3way')
+        extra_env = {'GIT_INDEX_FILE': index_file} if index_file else None
+        if isinstance(patch, six.string_types):
+            args.append(patch)
+            self._git_command("apply", args, extra_env)
+            return
+        args.append('-')
+        _out, stderr, ret = self._git_inout("apply", args, input=patch,
+                                            extra_env=extra_env,
+                                            capture_stderr=True)
+        if ret:
+            raise GitRepositoryError("Error running git apply: %s" %
+                                     stderr.strip())
+
+    def am(self, mbox, strip=None, keep_non_patch=False, keep_cr=False,
+           patch_format=None, three_way=False):
+        """
+        Apply a series of patches from a mailbox using git am
+
+        @param mbox: the mailbox, a path or a file object to read it from
+        @type mbox: C{str} or C{file}
+        @param strip: path components to strip from the patches
+        @type strip: C{int}
+        @param keep_non_patch: only strip bracketed strings containing
+            "PATCH" from the subjects
+        @type keep_non_patch: C{bool}
+        @param keep_cr: don't remove carriage returns at the end of lines
+        @type keep_cr: C{bool}
+        @param patch_format: format of the mailbox, like I{mboxrd}
+        @type patch_format: C{str}
+        @param three_way: fall back to a three-way merge if a patch does not
+            apply cleanly
+        @type three_way: C{bool}
+        """
+        args = GitArgs('--no-scissors')
+        args.add_cond(three_way, '--3way', '--no-3way')
+        args.add_cond(strip is not None, '-p%s' % strip)
+        args.add_true(keep_non_patch, '--keep-non-patch')
+        args.add_true(keep_cr, '--keep-cr')
+        args.add_cond(patch_format, '--patch-format=%s' % patch_format)
+        if isinstance(mbox, six.string_types):
+            args.add(mbox)
+            mbox = None
+        _out, stderr, ret = self._git_inout('am', args.args, input=mbox,
+                                            capture_stderr=True)
+        if ret:
+            raise GitRepositoryError("Error running git am: %s" %
+                                     stderr.strip())
+
+    def abort_am(self):
+        """Abort a failed git am and restore the state before it"""
+        self._git_command('am', ['--abort'])
 
     def diff(self, obj1, obj2=None, paths=None, stat=False, summary=False,
-             text=False, ignore_submodules=True):
+             text=False, ignore_submodules=True, binary=False):
         """
         Diff two git repository objects
 
@@ -1827,6 +2130,8 @@ class GitRepository(object):
         @type text: C{bool}
         @param ignore_submodules: ignore changes to submodules
         @type ignore_submodules: C{bool}
+        @param binary: output binary diffs that git apply can apply
+        @type binary: C{bool}
         @return: diff
         @rtype: C{str}
         """
@@ -1838,6 +2143,7 @@ class GitRepository(object):
         options.add_true(summary, '--summary')
         options.add_true(text, '--text')
         options.add_true(ignore_submodules, '--ignore-submodules')
+        options.add_true(binary, '--binary')
         options.add(obj1)
         options.add_true(obj2, obj2)
         if paths:
@@ -1992,17 +2298,20 @@ class GitRepository(object):
         if recursive:
             args += ['-r']
 
-        out, ret =  self._git_getoutput('ls-tree', args, cwd=path)
-        for line in out:
-            mode, objtype, commit, name = line[:-1].split(None, 3)
-            # A submodules is shown as "commit" object in ls-tree:
-            if objtype == "commit":
-                nextpath = os.path.join(path, name)
-                submodules.append( (nextpath.replace(self.path,'').lstrip('/'),
-                                    commit) )
-                if recursive:
-                    submodules += self.get_submodules(commit, path=nextpath,
-                                                      recursive=recursive)
+        try:
+            for line in self._git_readlines('ls-tree', args, cwd=path):
+                mode, objtype, commit, name = line.rstrip('\n').split(None, 3)
+                # A submodules is shown as "commit" object in ls-tree:
+                if objtype == "commit":
+                    nextpath = os.path.join(path, name)
+                    submodules.append( (nextpath.replace(self.path,'').lstrip('/'),
+                                        commit) )
+                    if recursive:
+                        submodules += self.get_submodules(commit, path=nextpath,
+                                                          recursive=recursive)
+        except GitRepositoryError:
+            # Submodules that aren't checked out can't be listed
+            pass
         return submodules
 
 #{ Repository Creation
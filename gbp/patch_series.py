@@ -21,6 +21,7 @@ import re
 import subprocess
 import tempfile
 from gbp.errors import GbpError
+from gbp.git.mailinfo import mailinfo, MailinfoUnsupported
 
 
 class Patch(object):
@@ -55,19 +56,48 @@ class Patch(object):
         repr += ">"
         return repr
 
+    def open(self):
+        """
+        Open the patch for reading
+
+        @return: the patch contents
+        @rtype: file object
+        """
+        return open(self.path)
+
     def _read_info(self):
         """
         Read patch information into a structured form
 
+        The header is parsed in-process like I{git mailinfo} would do it,
+        only patches needing MIME decoding are handed over to git.
+        """
+        self.info = {}
+        self.long_desc = ''
+        try:
+            with self.open() as patch:
+                self.info, self.long_desc = mailinfo(patch)
+        except IOError:
+            # Nonexistent patches have no info
+            pass
+        except MailinfoUnsupported:
+            self._read_info_git()
+
+    def _read_info_git(self):
+        """
+        Read patch information into a structured form
+
         using I{git mailinfo}
         """
         self.info = {}
         body = tempfile.NamedTemporaryFile(prefix='gbp_')
-        pipe = subprocess.Popen("git mailinfo '%s' /dev/null 2>/dev/null < '%s'" %
-                                (body.name, self.path),
-                                shell=True,
-                                stdout=subprocess.PIPE).stdout
-        for line in pipe:
+        with self.open() as patch, open(os.devnull, 'w') as devnull:
+            popen = subprocess.Popen(['git', 'mailinfo', body.name,
+                                      os.devnull],
+                                     stdin=subprocess.PIPE,
+                                     stdout=subprocess.PIPE, stderr=devnull)
+            output = popen.communicate(patch.read())[0]
+        for line in output.splitlines():
             if ':' in line:
                 rfc_header, value = line.split(" ", 1)
                 header = rfc_header[:-1].lower()
@@ -77,7 +107,7 @@ class Patch(object):
             body.close()
         except IOError as msg:
             raise GbpError("Failed to read patch header of '%s': %s" %
-                           (self.patch, msg))
+                           (self.path, msg))
         finally:
             if os.path.exists(body.name):
                 os.unlink(body.name)
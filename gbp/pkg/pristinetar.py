@@ -16,19 +16,273 @@
 #    <http://www.gnu.org/licenses/>
 """Handle checkin and checkout of archives from the pristine-tar branch"""
 
+import errno
+import hashlib
 import os
+import re
+import shutil
+import time
 import gbp.log
 from gbp.command_wrappers import Command
+from gbp.git import GitRepositoryError
+
+
+def bre_to_re(regexp):
+    r"""
+    Convert a POSIX basic regular expression, as understood by
+    I{git log --grep}, into a Python regular expression
+
+    >>> print(bre_to_re(r'foo_1\.0\.orig\.tar\.\w\+'))
+    foo_1\.0\.orig\.tar\.\w+
+    >>> print(bre_to_re(r'a+b?(c)|{1} \(d\|e\)\{2\}'))
+    a\+b\?\(c\)\|\{1\} (d|e){2}
+    """
+    special = '+?(){}|'
+    converted = ''
+    i = 0
+    while i < len(regexp):
+        char = regexp[i]
+        if char == '\\' and i + 1 < len(regexp):
+            nextchar = regexp[i + 1]
+            converted += nextchar if nextchar in special else char + nextchar
+            i += 2
+            continue
+        converted += '\\' + char if char in special else char
+        i += 1
+    return converted
+
+
+class PristineTarCache(object):
+    """
+    Cache of tarballs regenerated by I{pristine-tar checkout}, keyed by the
+    pristine-tar commit and the archive name. Cached tarballs are verified
+    against their checksum before use and the least recently used ones are
+    evicted when the cache grows over I{max_size} bytes.
+    """
+    checksum_suffix = '.sha256'
+
+    def __init__(self, path, max_size=0):
+        """
+        @param path: cache directory
+        @type path: C{str}
+        @param max_size: maximum total size of the cached tarballs, in bytes,
+            0 means unlimited
+        @type max_size: C{int}
+        """
+        self.path = os.path.abspath(path)
+        self.max_size = max_size
+
+    def _entry(self, commit, archive):
+        return os.path.join(self.path, commit, os.path.basename(archive))
+
+    @staticmethod
+    def _checksum(filename):
+        sha = hashlib.sha256()
+        with open(filename, 'rb') as fobj:
+            for block in iter(lambda: fobj.read(65536), b''):
+                sha.update(block)
+        return sha.hexdigest()
+
+    @staticmethod
+    def _link_or_copy(src, dst):
+        """Hardlink src to dst, falling back to copying"""
+        if os.path.lexists(dst):
+            os.unlink(dst)
+        try:
+            os.link(src, dst)
+        except OSError:
+            shutil.copy2(src, dst)
+
+    def _remove(self, entry):
+        for fname in (entry, entry + self.checksum_suffix):
+            try:
+                os.unlink(fname)
+            except OSError as err:
+                # Removed by another build sharing the cache
+                if err.errno != errno.ENOENT:
+                    raise
+        try:
+            os.rmdir(os.path.dirname(entry))
+        except OSError:
+            pass
+
+    def get(self, commit, archive):
+        """
+        Put a cached copy of I{archive} in place
+
+        @param commit: pristine-tar commit the archive was checked out from
+        @type commit: C{str}
+        @param archive: path of the archive to create
+        @type archive: C{str}
+        @return: C{True} on a cache hit, C{False} otherwise
+        @rtype: C{bool}
+        """
+        entry = self._entry(commit, archive)
+        try:
+            with open(entry + self.checksum_suffix) as fobj:
+                checksum = fobj.read().strip()
+            if self._checksum(entry) != checksum:
+                gbp.log.warn("Dropping corrupted pristine-tar cache entry "
+                             "'%s'" % entry)
+                self._remove(entry)
+                return False
+            self._link_or_copy(entry, archive)
+            # Access time is what we evict by
+            os.utime(entry, (time.time(), os.stat(entry).st_mtime))
+        except (IOError, OSError):
+            return False
+        gbp.log.debug("Using cached pristine-tar checkout '%s'" % entry)
+        return True
+
+    def put(self, commit, archive):
+        """
+        Store a copy of the freshly checked out I{archive} in the cache
+
+        @param commit: pristine-tar commit the archive was checked out from
+        @type commit: C{str}
+        @param archive: path of the archive to store
+        @type archive: C{str}
+        """
+        entry = self._entry(commit, archive)
+        tmp = entry + '.tmp'
+        try:
+            if not os.path.exists(os.path.dirname(entry)):
+                os.makedirs(os.path.dirname(entry))
+            self._link_or_copy(archive, tmp)
+            with open(tmp + self.checksum_suffix, 'w') as fobj:
+                fobj.write('%s\n' % self._checksum(tmp))
+            os.rename(tmp, entry)
+            os.rename(tmp + self.checksum_suffix, entry + self.checksum_suffix)
+        except (IOError, OSError) as err:
+            gbp.log.warn("Failed to add '%s' to pristine-tar cache: %s" %
+                         (archive, err))
+            return
+        self._evict(keep=entry)
+
+    def _entries(self):
+        """
+        Get the cached tarballs as (atime, size, path) tuples, skipping the
+        ones that vanish while we look, i.e. are evicted by another build
+        """
+        entries = []
+        for commit in os.listdir(self.path):
+            commit_dir = os.path.join(self.path, commit)
+            try:
+                fnames = os.listdir(commit_dir)
+            except OSError as err:
+                if err.errno not in (errno.ENOENT, errno.ENOTDIR):
+                    raise
+                continue
+            for fname in fnames:
+                if fname.endswith(self.checksum_suffix) or \
+                        fname.endswith('.tmp'):
+                    continue
+                entry = os.path.join(commit_dir, fname)
+                try:
+                    stat = os.stat(entry)
+                except OSError as err:
+                    if err.errno != errno.ENOENT:
+                        raise
+                    continue
+                entries.append((stat.st_atime, stat.st_size, entry))
+        return entries
+
+    def _evict(self, keep=None):
+        """
+        Drop least recently used entries until we fit in max_size. Failing
+        to do so is not fatal, the tarball was already checked out.
+        """
+        if not self.max_size:
+            return
+        try:
+            entries = self._entries()
+            total = sum([size for _atime, size, _entry in entries])
+            for _atime, size, entry in sorted(entries):
+                if total <= self.max_size:
+                    break
+                if entry == keep:
+                    continue
+                gbp.log.debug("Evicting '%s' from pristine-tar cache" % entry)
+                self._remove(entry)
+                total -= size
+        except (IOError, OSError) as err:
+            gbp.log.warn("Failed to clean up pristine-tar cache '%s': %s" %
+                         (self.path, err))
+
 
 class PristineTar(Command):
     """The pristine-tar branch in a git repository"""
     cmd='/usr/bin/pristine-tar'
     branch = 'pristine-tar'
+    index_file = 'gbp_pristine_tar_index'
 
     def __init__(self, repo):
         self.repo = repo
+        # Pristine-tar commits (SHA1, subject), newest first, indexed at
+        # branch tip self._index_tip
+        self._index = []
+        self._index_tip = None
+        # Optional PristineTarCache for checkouts
+        self.cache = None
         super(PristineTar, self).__init__(self.cmd, cwd=repo.path, capture_stderr=True)
 
+    @property
+    def _index_path(self):
+        return os.path.join(self.repo.git_dir, self.index_file)
+
+    def _read_index(self):
+        """Read the on-disk index, returns the tip it's valid for"""
+        index = []
+        try:
+            with open(self._index_path) as idx:
+                tip = idx.readline().strip()
+                for line in idx:
+                    commit, subject = line.rstrip('\n').split(' ', 1)
+                    index.append((commit, subject))
+        except (IOError, ValueError):
+            return None
+        self._index = index
+        return tip
+
+    def _write_index(self, tip):
+        """Write the index out atomically, failing to do so isn't fatal"""
+        tmp_path = self._index_path + '.tmp'
+        try:
+            with open(tmp_path, 'w') as idx:
+                idx.write('%s\n' % tip)
+                for commit, subject in self._index:
+                    idx.write('%s %s\n' % (commit, subject))
+            os.rename(tmp_path, self._index_path)
+        except (IOError, OSError) as err:
+            gbp.log.debug("Failed to write pristine-tar index: %s" % err)
+
+    def _is_ancestor(self, commit, tip):
+        try:
+            return self.repo.get_merge_base(commit, tip) == commit
+        except GitRepositoryError:
+            return False
+
+    def _update_index(self):
+        """
+        Bring the index of pristine-tar commits up to date with the branch
+        tip. Only commits added since the index was last written are
+        scanned; if the branch was rewritten the index is rebuilt.
+        """
+        tip = self.repo.rev_parse('refs/heads/%s' % self.branch)
+        if tip == self._index_tip:
+            return
+        old_tip = self._read_index()
+        if old_tip != tip:
+            if old_tip and self._is_ancestor(old_tip, tip):
+                new = list(self.repo.iter_subjects(old_tip, tip))
+            else:
+                self._index = []
+                new = list(self.repo.iter_subjects(until=tip))
+            gbp.log.debug("Indexed %d new pristine-tar commit(s)" % len(new))
+            self._index = new + self._index
+            self._write_index(tip)
+        self._index_tip = tip
+
     def has_commit(self, archive_regexp):
         """
         Do we have a pristine-tar commit for a package matching I{archive_regexp}.
@@ -48,12 +302,30 @@ class PristineTar(Command):
         if not self.repo.has_pristine_tar_branch():
             return None
 
-        regex = ('pristine-tar .* %s' % archive_regexp)
-        commits = self.repo.grep_log(regex, self.branch)
-        if commits:
-            commit = commits[-1]
-            gbp.log.debug("Found pristine-tar commit at '%s'" % commit)
-            return commit
+        self._update_index()
+        regex = re.compile('pristine-tar .* %s' % bre_to_re(archive_regexp))
+        for commit, subject in self._index:
+            if regex.search(subject):
+                gbp.log.debug("Found pristine-tar commit at '%s'" % commit)
+                return commit
+        return None
+
+    def get_archive_commit(self, archive):
+        """
+        Get the pristine-tar commit of exactly the archive I{archive}, i.e.
+        the commit whose subject is the one pristine-tar writes for it
+
+        @param archive: file name of the archive
+        @type archive: C{str}
+        """
+        if not self.repo.has_pristine_tar_branch():
+            return None
+
+        self._update_index()
+        wanted = 'pristine-tar data for %s' % archive
+        for commit, subject in self._index:
+            if subject == wanted:
+                return commit
         return None
 
     def checkout(self, archive):
@@ -63,9 +335,18 @@ class PristineTar(Command):
         @param archive: the name of the orig archive
         @type archive: C{str}
         """
+        commit = None
+        if self.cache:
+            commit = self.get_archive_commit(os.path.basename(archive))
+            if commit and self.cache.get(commit, archive):
+                return
+
         self.run_error = 'Pristine-tar couldn\'t checkout "%s": {stderr}' % os.path.basename(archive)
         self.__call__(['checkout', archive])
 
+        if commit:
+            self.cache.put(commit, archive)
+
     def commit(self, archive, upstream):
         """
         Commit an archive I{archive} to the pristine tar branch using upstream
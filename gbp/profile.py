@@ -0,0 +1,306 @@
+# vim: set fileencoding=utf-8 :
+#
+# (C) 2026 agent <agent@local>
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, please see
+#    <http://www.gnu.org/licenses/>
+"""Per-phase timing, subprocess accounting and command tracing"""
+
+import json
+import os
+import time
+from contextlib import contextmanager
+
+import gbp.log
+
+
+class Phase(object):
+    """
+    Resource usage of one logical step of a gbp command
+
+    @ivar name: name of the phase, nested phases are separated by '/'
+    @type name: C{str}
+    @ivar wall: elapsed wall clock time in seconds
+    @type wall: C{float}
+    @ivar cpu: CPU time (user + system) spent by gbp itself
+    @type cpu: C{float}
+    @ivar child_cpu: CPU time (user + system) of waited-for subprocesses
+    @type child_cpu: C{float}
+    @ivar commands: number of subprocesses started
+    @type commands: C{int}
+    @ivar command_time: wall clock time spent running subprocesses
+    @type command_time: C{float}
+    """
+    def __init__(self, name):
+        self.name = name
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.child_cpu = 0.0
+        self.commands = 0
+        self.command_time = 0.0
+
+    def to_dict(self):
+        """Phase data as a dict, suitable for serializing"""
+        return {'name': self.name,
+                'wall': self.wall,
+                'cpu': self.cpu,
+                'child_cpu': self.child_cpu,
+                'commands': self.commands,
+                'command_time': self.command_time}
+
+
+class Profiler(object):
+    """
+    Collect per-phase timing and subprocess statistics
+
+    Subprocesses are accounted to all currently active phases, i.e. a
+    command run inside a nested phase shows up in the parent phase, too.
+
+    >>> profiler = Profiler()
+    >>> with profiler.phase('export'):
+    ...     with profiler.phase('patches'):
+    ...         profiler.record_command(['git', 'diff'], 0.5)
+    ...     profiler.record_command(['cp'], 0.25)
+    >>> [(p.name, p.commands, p.command_time) for p in profiler.phases]
+    [('export/patches', 1, 0.5), ('export', 2, 0.75)]
+    >>> profiler.total.commands
+    2
+    """
+    def __init__(self):
+        self.phases = []
+        self.total = Phase('total')
+        self._active = []
+        self._start = (time.time(), os.times())
+
+    @staticmethod
+    def _cpu_times(times):
+        """Split os.times() into own and children's CPU time"""
+        return times[0] + times[1], times[2] + times[3]
+
+    @contextmanager
+    def phase(self, name):
+        """Context manager for measuring one phase"""
+        if self._active:
+            name = '%s/%s' % (self._active[-1].name, name)
+        phase = Phase(name)
+        self._active.append(phase)
+        start_wall = time.time()
+        start_cpu, start_child_cpu = self._cpu_times(os.times())
+        try:
+            yield phase
+        finally:
+            cpu, child_cpu = self._cpu_times(os.times())
+            phase.wall = time.time() - start_wall
+            phase.cpu = cpu - start_cpu
+            phase.child_cpu = child_cpu - start_child_cpu
+            self._active.remove(phase)
+            self.phases.append(phase)
+
+    def record_command(self, argv, duration):
+        """Account a finished subprocess to the active phases"""
+        for phase in self._active + [self.total]:
+            phase.commands += 1
+            phase.command_time += duration
+
+    def finish(self):
+        """Update the totals"""
+        start_wall, start_times = self._start
+        cpu, child_cpu = self._cpu_times(os.times())
+        start_cpu, start_child_cpu = self._cpu_times(start_times)
+        self.total.wall = time.time() - start_wall
+        self.total.cpu = cpu - start_cpu
+        self.total.child_cpu = child_cpu - start_child_cpu
+
+    def to_dict(self):
+        """Profiling report as a dict, suitable for serializing"""
+        return {'phases': [phase.to_dict() for phase in self.phases],
+                'total': self.total.to_dict()}
+
+    def summary(self):
+        """Profiling report as a human readable table"""
+        fmt = "%-32s %9s %9s %9s %6s %9s"
+        lines = [fmt % ('phase', 'wall', 'cpu', 'child cpu', 'cmds',
+                        'cmd time')]
+        for phase in self.phases + [self.total]:
+            lines.append(fmt % (phase.name, '%.3f' % phase.wall,
+                                '%.3f' % phase.cpu, '%.3f' % phase.child_cpu,
+                                phase.commands, '%.3f' % phase.command_time))
+        return '\n'.join(lines)
+
+
+class Tracer(object):
+    """
+    Record every external command in Chrome trace-event format
+
+    The trace can be viewed with chrome://tracing or Perfetto. Commands are
+    recorded as complete ('X') events with argv, cwd, exit code and the
+    amount of data transferred as arguments.
+
+    >>> tracer = Tracer()
+    >>> tracer.add_command(['git', 'rev-parse', 'HEAD'], 10.0, 0.5,
+    ...                    cwd='/tmp', returncode=0, stdout_bytes=41)
+    >>> event = tracer.events[0]
+    >>> event['name'], event['cat'], event['ts'], event['dur']
+    ('git rev-parse', 'git', 10000000, 500000)
+    >>> event['args']['returncode'], event['args']['stdout_bytes']
+    (0, 41)
+    """
+    def __init__(self):
+        self.events = []
+        self._pid = os.getpid()
+
+    @staticmethod
+    def _event_name(argv):
+        """Short name for a command, i.e. the program and git subcommand"""
+        if isinstance(argv, str):
+            argv = argv.split()
+        if not argv:
+            return ''
+        prog = os.path.basename(argv[0])
+        if prog == 'git' and len(argv) > 1:
+            return 'git %s' % argv[1]
+        return prog
+
+    def add_event(self, name, category, start, duration, args=None):
+        """Add a complete event"""
+        self.events.append({'name': name,
+                            'cat': category,
+                            'ph': 'X',
+                            'ts': int(round(start * 1000000)),
+                            'dur': int(round(duration * 1000000)),
+                            'pid': self._pid,
+                            'tid': 0,
+                            'args': args or {}})
+
+    def add_command(self, argv, start, duration, **info):
+        """
+        Add an event for an external command
+
+        @param argv: command line of the command
+        @type argv: C{list} or C{str}
+        @param start: start time of the command (seconds since the epoch)
+        @type start: C{float}
+        @param duration: run time of the command in seconds
+        @type duration: C{float}
+        @param info: additional information about the command, e.g. I{cwd},
+            I{returncode}, I{stdin_bytes}, I{stdout_bytes}, I{stderr_bytes}
+        """
+        name = self._event_name(argv)
+        category = name.split(' ')[0]
+        if category not in ('git', 'pristine-tar'):
+            category = 'command'
+        args = dict(info)
+        args['argv'] = argv
+        self.add_event(name, category, start, duration, args)
+
+    def write(self, filename):
+        """Write the trace in Chrome trace-event JSON format"""
+        with open(filename, 'w') as fobj:
+            json.dump({'traceEvents': self.events,
+                       'displayTimeUnit': 'ms'}, fobj)
+            fobj.write('\n')
+
+
+_PROFILER = None
+_TRACER = None
+
+
+def enable():
+    """Start collecting profiling data"""
+    global _PROFILER
+    _PROFILER = Profiler()
+    return _PROFILER
+
+
+def disable():
+    """Stop collecting profiling data"""
+    global _PROFILER
+    _PROFILER = None
+
+
+def enabled():
+    """Is profiling enabled"""
+    return _PROFILER is not None
+
+
+def enable_trace():
+    """Start recording a trace of external commands"""
+    global _TRACER
+    _TRACER = Tracer()
+    return _TRACER
+
+
+def disable_trace():
+    """Stop recording a trace of external commands"""
+    global _TRACER
+    _TRACER = None
+
+
+@contextmanager
+def phase(name):
+    """
+    Measure one phase of a command, no-op unless profiling or tracing is
+    enabled
+    """
+    start = time.time()
+    try:
+        if _PROFILER is None:
+            yield None
+        else:
+            with _PROFILER.phase(name) as phs:
+                yield phs
+    finally:
+        if _TRACER is not None:
+            _TRACER.add_event(name, 'phase', start, time.time() - start)
+
+
+def record_command(argv, start, duration, **info):
+    """
+    Account a finished subprocess, no-op unless profiling or tracing is
+    enabled. See L{Tracer.add_command} for the arguments.
+    """
+    if _PROFILER is not None:
+        _PROFILER.record_command(argv, duration)
+    if _TRACER is not None:
+        _TRACER.add_command(argv, start, duration, **info)
+
+
+def report(filename):
+    """
+    Write the profiling report in JSON format and log a summary. Disables
+    profiling.
+    """
+    global _PROFILER
+    if _PROFILER is None:
+        return
+    profiler, _PROFILER = _PROFILER, None
+    profiler.finish()
+    gbp.log.info("Profile summary:\n%s" % profiler.summary())
+    try:
+        with open(filename, 'w') as fobj:
+            json.dump(profiler.to_dict(), fobj, indent=2, sort_keys=True)
+            fobj.write('\n')
+    except IOError as err:
+        gbp.log.err("Failed to write profiling report: %s" % err)
+
+
+def write_trace(filename):
+    """Write the trace of external commands to a file. Disables tracing."""
+    global _TRACER
+    if _TRACER is None:
+        return
+    tracer, _TRACER = _TRACER, None
+    try:
+        tracer.write(filename)
+    except IOError as err:
+        gbp.log.err("Failed to write command trace: %s" % err)
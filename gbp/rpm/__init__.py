@@ -19,6 +19,7 @@
 
 import os
 import re
+import shutil
 import tempfile
 from optparse import OptionParser
 from collections import defaultdict
@@ -275,11 +276,20 @@ class SpecFile(object):
 
     def write_spec_file(self):
         """
-        Write, possibly updated, spec to disk
+        Write, possibly updated, spec to disk. The file is replaced
+        atomically, through symlinks, see L{replace_file}.
         """
-        with open(os.path.join(self.specdir, self.specfile), 'w') as spec_file:
-            for line in self._content:
-                spec_file.write(str(line))
+        path = os.path.realpath(os.path.join(self.specdir, self.specfile))
+        tmp = path + '.tmp'
+        try:
+            with open(tmp, 'w') as spec_file:
+                for line in self._content:
+                    spec_file.write(str(line))
+            replace_file(tmp, path)
+        except (IOError, OSError):
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
 
     def _parse_tag(self, lineobj):
         """Parse tag line"""
@@ -610,8 +620,43 @@ class SpecFile(object):
                 text += str(line)
         return text
 
+    def get_changelog_offset(self):
+        """
+        Get the offset of the %changelog section content in the spec text
+
+        @return: offset, or C{None} if there is no %changelog section
+        @rtype: C{int}
+        """
+        if 'changelog' not in self._special_directives:
+            return None
+        offset = 0
+        end = self._special_directives['changelog'][0]['line']
+        for line in self._content:
+            offset += len(str(line))
+            if line is end:
+                return offset
+
+    def _text(self):
+        """The spec file contents, as they would be written"""
+        return ''.join([str(line) for line in self._content])
+
     def update_patches(self, patches, commands):
-        """Update spec with new patch tags and patch macros"""
+        """
+        Update spec with new patch tags and patch macros
+
+        @param patches: file names of the patches, in the order of application
+        @type patches: C{list} of C{str}
+        @param commands: conditionals of the patch macros, by file name
+        @type commands: C{dict}
+        @return: C{True} if the spec was changed
+        @rtype: C{bool}
+        """
+        old_text = self._text()
+        self._update_patches(patches, commands)
+        return self._text() != old_text
+
+    def _update_patches(self, patches, commands):
+        """Replace the non-ignored patch tags and patch macros"""
         # Remove non-ignored patches
         tag_prev = None
         macro_prev = None
@@ -803,6 +848,26 @@ class SpecFile(object):
         return orig
 
 
+def replace_file(tmp, path):
+    """
+    Replace a file with a new version written next to it. The file is
+    replaced atomically, unless it has other hard links: those are kept
+    by copying the new content over the old file.
+
+    @param tmp: the new version, in the same directory as I{path}
+    @type tmp: C{str}
+    @param path: the file to replace, symlinks already resolved
+    @type path: C{str}
+    """
+    if os.path.exists(path):
+        shutil.copymode(path, tmp)
+        if os.stat(path).st_nlink > 1:
+            shutil.copyfile(tmp, path)
+            os.unlink(tmp)
+            return
+    os.rename(tmp, path)
+
+
 def parse_srpm(srpmfile):
     """parse srpm by creating a SrcRpmFile object"""
     try:
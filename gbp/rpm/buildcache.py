@@ -0,0 +1,240 @@
+# vim: set fileencoding=utf-8 :
+#
+# (C) 2026 agent <agent@local>
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, please see
+#    <http://www.gnu.org/licenses/>
+"""Cache of built RPM packages, keyed by the inputs of the build"""
+
+import hashlib
+import os
+import shutil
+import time
+
+import gbp.log
+
+
+def file_checksum(filename):
+    """SHA-256 checksum of the contents of a file"""
+    sha = hashlib.sha256()
+    with open(filename, 'rb') as fobj:
+        for block in iter(lambda: fobj.read(65536), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def find_packages(topdir):
+    """
+    Find the (source) RPM packages under a build directory
+
+    @param topdir: directory to search
+    @type topdir: C{str}
+    @return: the state of the packages found, by path relative to I{topdir}
+    @rtype: C{dict} of C{tuple}
+    """
+    found = {}
+    for dirpath, _dirnames, filenames in os.walk(topdir):
+        for fname in filenames:
+            if fname.endswith('.rpm'):
+                path = os.path.join(dirpath, fname)
+                stat = os.stat(path)
+                found[os.path.relpath(path, topdir)] = (stat.st_mtime,
+                                                        stat.st_size,
+                                                        stat.st_ino)
+    return found
+
+
+def new_packages(topdir, before):
+    """
+    Packages that were created or rewritten after I{before} was taken with
+    L{find_packages}
+    """
+    after = find_packages(topdir)
+    return sorted([path for path, state in after.items()
+                   if before.get(path) != state])
+
+
+class BuildCache(object):
+    """
+    Content addressed cache of build results. An entry holds the packages
+    produced by one builder run and is keyed by a checksum of everything
+    the build depends on: the exported git tree, the exported spec file and
+    sources and the builder command line. The least recently used entries
+    are evicted when the cache grows over I{max_size} bytes.
+    """
+    manifest_name = 'MANIFEST'
+
+    def __init__(self, path, max_size=0):
+        """
+        @param path: cache directory
+        @type path: C{str}
+        @param max_size: maximum total size of the cached packages, in bytes,
+            0 means unlimited
+        @type max_size: C{int}
+        """
+        self.path = os.path.abspath(path)
+        self.max_size = max_size
+
+    @staticmethod
+    def build_key(tree, files, command):
+        """
+        Compute the cache key of a build
+
+        @param tree: SHA-1 of the exported git tree
+        @type tree: C{str}
+        @param files: exported files the build uses, paths by name
+        @type files: C{dict}
+        @param command: builder command line and everything else affecting
+            the build outcome
+        @type command: C{list} of C{str}
+        @return: the cache key
+        @rtype: C{str}
+
+        >>> BuildCache.build_key('1' * 40, {}, ['rpmbuild', '-ba'])
+        '8de0118848566d8eb7f5e62e55c6d9a0e3fe441725579e14c701550fa779363d'
+        """
+        sha = hashlib.sha256()
+        sha.update('tree %s\n' % tree)
+        for name in sorted(files):
+            sha.update('file %r %s\n' % (name, file_checksum(files[name])))
+        for arg in command:
+            sha.update('arg %r\n' % arg)
+        return sha.hexdigest()
+
+    def _entry(self, key):
+        return os.path.join(self.path, key)
+
+    @staticmethod
+    def _copy(src, dst):
+        """
+        Copy src to dst. Not hardlinked because builders rewrite their
+        output files in place, which would corrupt the cache.
+        """
+        if not os.path.isdir(os.path.dirname(dst)):
+            os.makedirs(os.path.dirname(dst))
+        if os.path.lexists(dst):
+            os.unlink(dst)
+        shutil.copy2(src, dst)
+
+    def _read_manifest(self, entry):
+        """Files of an entry, as (checksum, relative path) pairs"""
+        files = []
+        with open(os.path.join(entry, self.manifest_name)) as fobj:
+            for line in fobj:
+                checksum, path = line.rstrip('\n').split(' ', 1)
+                files.append((checksum, path))
+        return files
+
+    def get(self, key, topdir):
+        """
+        Restore the packages of a cached build into I{topdir}
+
+        @param key: cache key of the build, from L{build_key}
+        @type key: C{str}
+        @param topdir: build directory to restore the packages to
+        @type topdir: C{str}
+        @return: paths of the restored packages, relative to I{topdir}, or
+            C{None} on a cache miss
+        @rtype: C{list} of C{str}
+        """
+        entry = self._entry(key)
+        try:
+            files = self._read_manifest(entry)
+            if not files:
+                # A build without packages is no result to reuse
+                return None
+            for checksum, path in files:
+                if file_checksum(os.path.join(entry, path)) != checksum:
+                    gbp.log.warn("Dropping corrupted build cache entry '%s'" %
+                                 entry)
+                    shutil.rmtree(entry, ignore_errors=True)
+                    return None
+            for _checksum, path in files:
+                self._copy(os.path.join(entry, path),
+                           os.path.join(topdir, path))
+            # Access time of the manifest is what we evict by
+            manifest = os.path.join(entry, self.manifest_name)
+            os.utime(manifest, (time.time(), os.stat(manifest).st_mtime))
+        except (IOError, OSError, ValueError):
+            return None
+        gbp.log.debug("Restored %d package(s) from build cache entry '%s'" %
+                      (len(files), entry))
+        return [path for _checksum, path in files]
+
+    def put(self, key, topdir, packages):
+        """
+        Store the packages of a successful build in the cache
+
+        @param key: cache key of the build, from L{build_key}
+        @type key: C{str}
+        @param topdir: build directory the packages are in
+        @type topdir: C{str}
+        @param packages: paths of the packages, relative to I{topdir}
+        @type packages: C{list} of C{str}
+        """
+        if not packages:
+            gbp.log.debug("Build produced no packages, not caching it")
+            return
+        entry = self._entry(key)
+        tmp = '%s.tmp.%d' % (entry, os.getpid())
+        try:
+            os.makedirs(tmp)
+            with open(os.path.join(tmp, self.manifest_name), 'w') as manifest:
+                for path in packages:
+                    dst = os.path.join(tmp, path)
+                    self._copy(os.path.join(topdir, path), dst)
+                    manifest.write('%s %s\n' % (file_checksum(dst), path))
+            if os.path.exists(entry):
+                shutil.rmtree(entry)
+            os.rename(tmp, entry)
+        except (IOError, OSError) as err:
+            gbp.log.warn("Failed to add build results to build cache: %s" %
+                         err)
+            shutil.rmtree(tmp, ignore_errors=True)
+            return
+        gbp.log.debug("Stored %d package(s) in build cache entry '%s'" %
+                      (len(packages), entry))
+        self._evict(keep=entry)
+
+    def _size(self, entry):
+        """Total size of the packages of an entry"""
+        total = 0
+        for _checksum, path in self._read_manifest(entry):
+            total += os.path.getsize(os.path.join(entry, path))
+        return total
+
+    def _evict(self, keep=None):
+        """Drop least recently used entries until we fit in max_size"""
+        if not self.max_size:
+            return
+        entries = []
+        total = 0
+        for key in os.listdir(self.path):
+            entry = self._entry(key)
+            manifest = os.path.join(entry, self.manifest_name)
+            if '.tmp.' in key:
+                continue
+            try:
+                size = self._size(entry)
+                entries.append((os.stat(manifest).st_atime, size, entry))
+            except (IOError, OSError, ValueError):
+                continue
+            total += size
+        for _atime, size, entry in sorted(entries):
+            if total <= self.max_size:
+                break
+            if entry == keep:
+                continue
+            gbp.log.debug("Evicting '%s' from build cache" % entry)
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
@@ -112,18 +112,100 @@ class _ChangelogSection(object):
         return entry
 
 
+class _ChangelogSections(object):
+    """
+    List of the sections of a changelog. Sections of a parsed changelog are
+    only recorded as offsets into the raw changelog text and get parsed on
+    first access. Sections that were never accessed are written out
+    verbatim.
+    """
+
+    def __init__(self, parser=None, text='', offsets=None, verbatim=True):
+        """
+        @param parser: parser for the raw sections
+        @type parser: L{ChangelogParser}
+        @param text: raw changelog text
+        @type text: C{str}
+        @param offsets: start and end offsets of the sections in I{text}
+        @type offsets: C{list} of C{tuple}
+        @param verbatim: whether I{text} is identical to the parsed text, i.e.
+            it wasn't modified by line ending normalization
+        @type verbatim: C{bool}
+        """
+        self._parser = parser
+        self._text = text
+        self._verbatim = verbatim
+        self._offsets = list(offsets or [])
+        self._sections = [None] * len(self._offsets)
+
+    def __len__(self):
+        return len(self._sections)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[ind] for ind in range(*index.indices(len(self)))]
+        section = self._sections[index]
+        if section is None:
+            section = self._parser.parse_section(self.raw(index))
+            self._sections[index] = section
+        return section
+
+    def __setitem__(self, index, section):
+        self._sections[index] = section
+
+    def __iter__(self):
+        for ind in range(len(self)):
+            yield self[ind]
+
+    def insert(self, index, section):
+        """Insert a new section"""
+        self._sections.insert(index, section)
+        self._offsets.insert(index, None)
+
+    def append(self, section):
+        """Add a new section to the end"""
+        self.insert(len(self), section)
+
+    def raw(self, index):
+        """Text of one section, without parsing it"""
+        if self._sections[index] is None:
+            start, end = self._offsets[index]
+            return self._text[start:end]
+        return str(self._sections[index])
+
+    def __str__(self):
+        return ''.join([self.raw(ind) for ind in range(len(self))])
+
+    def split(self):
+        """
+        Split the changelog into a head of new and parsed sections and a tail
+        of sections that were never accessed
+
+        @return: the text of the head and the offset of the tail in the
+            parsed text, C{None} if the parsed text was not kept verbatim
+        @rtype: C{tuple} of (C{str}, C{int})
+        """
+        if not self._verbatim:
+            return str(self), None
+        index = len(self)
+        while index and self._sections[index - 1] is None:
+            index -= 1
+        offset = self._offsets[index][0] if index < len(self) else \
+            len(self._text)
+        return ''.join([self.raw(ind) for ind in range(index)]), offset
+
+
 class Changelog(object):
     """An RPM changelog"""
 
-    def __init__(self, pkgpolicy):
+    def __init__(self, pkgpolicy, sections=None):
         self._pkgpolicy = pkgpolicy
-        self.sections = []
+        if sections is None:
+            sections = _ChangelogSections()
+        self.sections = sections
 
     def __str__(self):
-        string = ""
-        for section in self.sections:
-            string += str(section)
-        return string
+        return str(self.sections)
 
     def create_entry(self, *args, **kwargs):
         """Create and return new entry object"""
@@ -141,28 +223,33 @@ class ChangelogParser(object):
 
     def __init__(self, pkgpolicy):
         self._pkgpolicy = pkgpolicy
-        self.section_match_re = pkgpolicy.Changelog.section_match_re
-        self.section_split_re = pkgpolicy.Changelog.section_split_re
-        self.header_split_re = pkgpolicy.Changelog.header_split_re
-        self.header_name_split_re = pkgpolicy.Changelog.header_name_split_re
-        self.body_name_re = pkgpolicy.Changelog.body_name_re
+        policy = pkgpolicy.Changelog
+        # Sections can only start at the beginning of a line
+        self.section_match_re = re.compile(r'^(?:%s)' %
+                                           policy.section_match_re, re.M)
+        self.section_split_re = re.compile(policy.section_split_re,
+                                           re.M | re.S)
+        self.header_split_re = re.compile(policy.header_split_re, re.M)
+        self.header_name_split_re = re.compile(policy.header_name_split_re)
+        self.body_name_re = re.compile(policy.body_name_re)
 
     def raw_parse_string(self, string):
-        """Parse changelog - only splits out raw changelog sections."""
-        changelog = Changelog(self._pkgpolicy)
-        ch_section = ""
-        for line in string.splitlines():
-            if re.match(self.section_match_re, line, re.M | re.S):
-                if ch_section:
-                    changelog.sections.append(ch_section)
-                ch_section = line + '\n'
-            elif ch_section:
-                ch_section += line + '\n'
-            else:
-                raise ChangelogError("First line in changelog is invalid")
-        if ch_section:
-            changelog.sections.append(ch_section)
-        return changelog
+        """
+        Parse changelog - only splits out raw changelog sections. The
+        sections are parsed lazily, on first access.
+        """
+        # Normalize line endings, every line is terminated by a newline
+        text = '\n'.join(string.splitlines())
+        if text:
+            text += '\n'
+        starts = [match.start() for match in
+                  self.section_match_re.finditer(text)]
+        if text and (not starts or starts[0] != 0):
+            raise ChangelogError("First line in changelog is invalid")
+        offsets = list(zip(starts, starts[1:] + [len(text)]))
+        return Changelog(self._pkgpolicy,
+                         _ChangelogSections(self, text, offsets,
+                                            verbatim=text == string))
 
     def raw_parse_file(self, changelog):
         """Parse changelog file - only splits out raw changelog sections."""
@@ -175,7 +262,7 @@ class ChangelogParser(object):
     def _parse_section_header(self, text):
         """Parse one changelog section header"""
         # Try to split out time stamp and "changelog name"
-        match = re.match(self.header_split_re, text, re.M)
+        match = self.header_split_re.match(text)
         if not match:
             raise ChangelogError("Unable to parse changelog header: %s" % text)
         try:
@@ -187,7 +274,7 @@ class ChangelogParser(object):
         # Parse "name" part which consists of name and/or email and an optional
         # revision
         name_text = match.group('ch_name')
-        match = re.match(self.header_name_split_re, name_text)
+        match = self.header_name_split_re.match(name_text)
         if not match:
             raise ChangelogError("Unable to parse changelog header: invalid "
                                  "name / revision '%s'" % name_text)
@@ -204,7 +291,7 @@ class ChangelogParser(object):
         entry_text = []
         author = default_author
         for line in text.splitlines():
-            match = re.match(self.body_name_re, line)
+            match = self.body_name_re.match(line)
             if match:
                 if entry_text:
                     entries.append(self._create_entry(author, entry_text))
@@ -229,7 +316,7 @@ class ChangelogParser(object):
     def parse_section(self, text):
         """Parse one section"""
         # Check that the first line(s) look like a changelog header
-        match = re.match(self.section_split_re, text, re.M | re.S)
+        match = self.section_split_re.match(text)
         if not match:
             raise ChangelogError("Doesn't look like changelog header: %s..." %
                                  text.splitlines()[0])
@@ -21,27 +21,54 @@ import tempfile
 import gbp.log
 from gbp.rpm.policy import RpmPkgPolicy
 
-try:
-    # Try to load special RPM lib to be used for GBP (only)
-    librpm = __import__(RpmPkgPolicy.python_rpmlib_module_name)
-except ImportError:
-    gbp.log.warn("Failed to import '%s' as rpm python module, using host's "
-                    "default rpm library instead" %
-                    RpmPkgPolicy.python_rpmlib_module_name)
-    import rpm as librpm
-
-# Module initialization
-_rpmlog = tempfile.NamedTemporaryFile(prefix='gbp_rpmlog')
-_rpmlogfd = _rpmlog.file
-librpm.setVerbosity(librpm.RPMLOG_INFO)
-librpm.setLogFile(_rpmlogfd)
+
+class _LibRpm(object):
+    """
+    Proxy for the rpm python module
+
+    The module is imported and initialized on first use, as importing it is
+    slow and not needed by all users of L{gbp.rpm}.
+    """
+    def __init__(self):
+        self._module = None
+        self._logfile = None
+
+    def _load(self):
+        """Import and initialize the rpm python module"""
+        try:
+            # Try to load special RPM lib to be used for GBP (only)
+            module = __import__(RpmPkgPolicy.python_rpmlib_module_name)
+        except ImportError:
+            gbp.log.warn("Failed to import '%s' as rpm python module, using "
+                         "host's default rpm library instead" %
+                         RpmPkgPolicy.python_rpmlib_module_name)
+            import rpm as module
+        self._logfile = tempfile.NamedTemporaryFile(prefix='gbp_rpmlog')
+        module.setVerbosity(module.RPMLOG_INFO)
+        module.setLogFile(self._logfile.file)
+        self._module = module
+
+    @property
+    def logfile(self):
+        """File object receiving the librpm log"""
+        if self._module is None:
+            self._load()
+        return self._logfile.file
+
+    def __getattr__(self, name):
+        if self._module is None:
+            self._load()
+        return getattr(self._module, name)
+
+
+librpm = _LibRpm()
 
 
 def get_librpm_log(truncate=True):
     """Get rpmlib log output"""
-    _rpmlogfd.seek(0)
-    log = [line.strip() for line in _rpmlogfd.readlines()]
+    logfd = librpm.logfile
+    logfd.seek(0)
+    log = [line.strip() for line in logfd.readlines()]
     if truncate:
-        _rpmlogfd.truncate(0)
+        logfd.truncate(0)
     return log
-
@@ -0,0 +1,189 @@
+# vim: set fileencoding=utf-8 :
+#
+# (C) 2026 agent <agent@local>
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, please see
+#    <http://www.gnu.org/licenses/>
+"""
+Pool of pre-initialized mock chroots
+
+Every mock root (i.e. distribution and architecture) has a fixed number of
+slots, each one a separate chroot selected with mock's I{--uniqueext}. A
+build leases a free slot, preferring one that has been initialized, and
+runs mock with I{--no-clean} in it. After the build the slot is
+re-initialized by a detached background process so that the next build
+finds it ready. The slots are guarded by file locks, so the pool is shared
+by all builds of the user, including parallel ones.
+"""
+
+import errno
+import fcntl
+import os
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+
+import gbp.log
+
+
+class MockPool(object):
+    """
+    Leases mock chroots to builds
+
+    @ivar path: directory for the lock, state and log files of the slots
+    @type path: C{str}
+    @ivar size: number of slots per mock root
+    @type size: C{int}
+    """
+    mock_cmd = 'mock'
+    poll_interval = 1.0
+
+    def __init__(self, path, size, mock_options=None):
+        """
+        @param path: directory for the lock, state and log files of the slots
+        @type path: C{str}
+        @param size: number of slots per mock root
+        @type size: C{int}
+        @param mock_options: extra options to pass to mock when initializing
+            the chroots
+        @type mock_options: C{list} of C{str}
+        """
+        self.path = os.path.abspath(path)
+        self.size = size
+        self.mock_options = mock_options or []
+
+    @staticmethod
+    def uniqueext(num):
+        """Mock I{--uniqueext} of a slot"""
+        return 'gbp%d' % num
+
+    def _slot_file(self, root, num, suffix):
+        return os.path.join(self.path, root, '%d.%s' % (num, suffix))
+
+    def _try_lock(self, root, num):
+        """Lock a slot, returns the lock file descriptor or None if busy"""
+        fd = os.open(self._slot_file(root, num, 'lock'),
+                     os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except IOError as err:
+            os.close(fd)
+            if err.errno in (errno.EAGAIN, errno.EACCES):
+                return None
+            raise
+        return fd
+
+    def _acquire(self, root):
+        """Wait for a free slot, initialized ones first"""
+        root_dir = os.path.join(self.path, root)
+        if not os.path.isdir(root_dir):
+            os.makedirs(root_dir)
+        waiting = False
+        while True:
+            slots = sorted(range(self.size), key=lambda num: not
+                           os.path.exists(self._slot_file(root, num, 'ready')))
+            for num in slots:
+                fd = self._try_lock(root, num)
+                if fd is not None:
+                    return num, fd
+            if not waiting:
+                gbp.log.info("Waiting for a free mock chroot for '%s'" % root)
+                waiting = True
+            time.sleep(self.poll_interval)
+
+    def _init_cmd(self, root, num):
+        return [self.mock_cmd, '-r', root,
+                '--uniqueext=%s' % self.uniqueext(num)] + \
+               self.mock_options + ['--init']
+
+    @staticmethod
+    def _close_fds(keep):
+        """Close all file descriptors above stderr except I{keep}"""
+        try:
+            maxfd = os.sysconf('SC_OPEN_MAX')
+        except (AttributeError, ValueError):
+            maxfd = 256
+        os.closerange(3, keep)
+        os.closerange(keep + 1, maxfd)
+
+    def _run_scrub(self, root, num, lock_fd):
+        """
+        Re-initialize a slot, in the detached scrubber process. Nothing but
+        the slot lock is inherited from the build, so that the scrubber
+        doesn't hold e.g. the pipes of a parallel build open.
+        """
+        with open(os.devnull) as devnull:
+            os.dup2(devnull.fileno(), 0)
+        with open(self._slot_file(root, num, 'log'), 'w') as log:
+            os.dup2(log.fileno(), 1)
+            os.dup2(log.fileno(), 2)
+        self._close_fds(lock_fd)
+        if subprocess.call(self._init_cmd(root, num), close_fds=True) == 0:
+            open(self._slot_file(root, num, 'ready'), 'w').close()
+
+    def _scrub(self, root, num, lock_fd):
+        """
+        Re-initialize a slot in the background. The lock is handed over to
+        the scrubber process which releases it when done.
+        """
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            retval = 1
+            try:
+                os.setsid()
+                if os.fork() == 0:
+                    self._run_scrub(root, num, lock_fd)
+                retval = 0
+            finally:
+                os._exit(retval)
+        os.close(lock_fd)
+        os.waitpid(pid, 0)
+        gbp.log.debug("Initializing mock chroot '%s' (%s) in the background" %
+                      (root, self.uniqueext(num)))
+
+    def _fill(self, root, exclude):
+        """Start initializing all free slots that are not ready"""
+        for num in range(self.size):
+            if num == exclude or \
+                    os.path.exists(self._slot_file(root, num, 'ready')):
+                continue
+            fd = self._try_lock(root, num)
+            if fd is not None:
+                self._scrub(root, num, fd)
+
+    @contextmanager
+    def lease(self, root):
+        """
+        Lease a chroot for the duration of a build
+
+        @param root: mock root (configuration) name
+        @type root: C{str}
+        @return: environment for gbp-builder-mock selecting the chroot
+        @rtype: C{dict}
+        """
+        num, lock_fd = self._acquire(root)
+        self._fill(root, exclude=num)
+        ready = self._slot_file(root, num, 'ready')
+        env = {'GBP_BUILDER_MOCK_UNIQUEEXT': self.uniqueext(num)}
+        if os.path.exists(ready):
+            os.unlink(ready)
+            env['GBP_BUILDER_MOCK_NO_CLEAN'] = '1'
+            gbp.log.info("Using pre-initialized mock chroot '%s' (%s)" %
+                         (root, self.uniqueext(num)))
+        try:
+            yield env
+        finally:
+            self._scrub(root, num, lock_fd)
@@ -0,0 +1,371 @@
+# vim: set fileencoding=utf-8 :
+#
+# (C) 2026 agent <agent@local>
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, please see
+#    <http://www.gnu.org/licenses/>
+"""Build several RPM packages in parallel"""
+
+import errno
+import multiprocessing
+import os
+import select
+import sys
+import time
+from contextlib import contextmanager
+from six.moves import configparser
+
+import gbp.log
+from gbp.config import GbpOptionParserRpm
+from gbp.errors import GbpError
+import gbp.scripts.buildpackage_rpm as buildpackage_rpm
+
+# Messages between the scheduler and the workers
+MSG_BUILD_REQUEST = 'B'
+MSG_BUILD_GRANTED = 'G'
+MSG_BUILD_DONE = 'D'
+
+
+class Package(object):
+    """
+    A package to be built and the state of its build
+
+    @ivar path: path to the packaging repository
+    @ivar name: name of the package, i.e. basename of the repository
+    @ivar log: build log file
+    @ivar argv: buildpackage-rpm command line for building the package
+    @ivar state: C{pending}, C{export}, C{wait}, C{build}, C{finish} or
+        C{done}
+    @ivar retval: exit code of the build
+    @ivar times: timestamps of the state changes
+    """
+    def __init__(self, path, log_dir):
+        self.path = os.path.abspath(path)
+        self.name = os.path.basename(self.path.rstrip('/'))
+        self.log = os.path.join(log_dir, '%s.log' % self.name)
+        self.argv = []
+        self.state = 'pending'
+        self.retval = None
+        self.times = {}
+        self.pid = None
+        self.from_worker = None
+        self.to_worker = None
+
+    def set_state(self, state):
+        """Move to a new state, recording the time"""
+        self.state = state
+        self.times[state] = time.time()
+
+    def duration(self, start, end):
+        """Time spent between two states"""
+        if start in self.times and end in self.times:
+            return self.times[end] - self.times[start]
+        return None
+
+
+def read_manifest(filename):
+    """
+    Read the list of packaging repositories to build. Paths are relative to
+    the directory of the manifest. Empty lines and lines starting with '#'
+    are ignored.
+
+    @param filename: manifest file
+    @type filename: C{str}
+    @return: paths of the repositories
+    @rtype: C{list} of C{str}
+    """
+    base = os.path.dirname(os.path.abspath(filename))
+    paths = []
+    try:
+        with open(filename) as manifest:
+            for line in manifest:
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    paths.append(os.path.join(base, line))
+    except IOError as err:
+        raise GbpError("Failed to read manifest '%s': %s" % (filename, err))
+    return paths
+
+
+@contextmanager
+def _builder_slot(to_scheduler, from_scheduler):
+    """Wait for the scheduler to let the builder run, in the worker"""
+    os.write(to_scheduler, MSG_BUILD_REQUEST)
+    if os.read(from_scheduler, 1) != MSG_BUILD_GRANTED:
+        raise GbpError("Lost connection to the build scheduler")
+    try:
+        yield
+    finally:
+        os.write(to_scheduler, MSG_BUILD_DONE)
+
+
+def _run_worker(package, to_scheduler, from_scheduler):
+    """Build one package with buildpackage-rpm, in the worker process"""
+    retval = 1
+    try:
+        logfd = os.open(package.log, os.O_WRONLY | os.O_CREAT | os.O_TRUNC,
+                        0o644)
+        devnull = os.open(os.devnull, os.O_RDONLY)
+        os.dup2(devnull, 0)
+        os.dup2(logfd, 1)
+        os.dup2(logfd, 2)
+        os.close(devnull)
+        os.close(logfd)
+        sys.stdout, sys.stderr = sys.__stdout__, sys.__stderr__
+        for handler, stream in zip(getattr(gbp.log.LOGGER,
+                                           'default_handlers', []),
+                                   (sys.stdout, sys.stderr)):
+            handler.stream = stream
+
+        os.chdir(package.path)
+        buildpackage_rpm.builder_slot = lambda: _builder_slot(to_scheduler,
+                                                              from_scheduler)
+        retval = buildpackage_rpm.main(package.argv)
+    except SystemExit as err:
+        retval = err.code
+    except Exception:
+        import traceback
+        traceback.print_exc()
+    if not isinstance(retval, int):
+        retval = 0 if retval is None else 1
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os._exit(retval)
+
+
+class BuildScheduler(object):
+    """
+    Run buildpackage-rpm for several packages in parallel
+
+    At most I{jobs} packages are exported (and their orig tarballs
+    generated) at a time. When a package is ready to be built, it waits for
+    one of the I{builder_jobs} builder slots, freeing its export slot for
+    the next package.
+    """
+    def __init__(self, packages, jobs, builder_jobs):
+        self.pending = list(packages)
+        self.jobs = jobs
+        self.builder_jobs = builder_jobs
+        self.running = {}
+        self.waiting = []
+
+    def _count(self, state):
+        """Number of running packages in the given state"""
+        return len([pkg for pkg in self.running.values() if
+                    pkg.state == state])
+
+    def _start(self, package):
+        """Fork a worker for a package"""
+        gbp.log.info("Starting %s" % package.name)
+        to_scheduler_r, to_scheduler_w = os.pipe()
+        to_worker_r, to_worker_w = os.pipe()
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            os.close(to_scheduler_r)
+            os.close(to_worker_w)
+            for other in self.running.values():
+                os.close(other.from_worker)
+                os.close(other.to_worker)
+            _run_worker(package, to_scheduler_w, to_worker_r)
+        os.close(to_scheduler_w)
+        os.close(to_worker_r)
+        package.pid = pid
+        package.from_worker = to_scheduler_r
+        package.to_worker = to_worker_w
+        package.set_state('export')
+        self.running[to_scheduler_r] = package
+
+    def _finish(self, package):
+        """Collect the exit status of a worker"""
+        os.close(package.from_worker)
+        os.close(package.to_worker)
+        del self.running[package.from_worker]
+        status = os.waitpid(package.pid, 0)[1]
+        if os.WIFSIGNALED(status):
+            package.retval = 128 + os.WTERMSIG(status)
+        else:
+            package.retval = os.WEXITSTATUS(status)
+        if package in self.waiting:
+            self.waiting.remove(package)
+        package.set_state('done')
+        if package.retval:
+            gbp.log.err("Building %s failed, see %s" % (package.name,
+                                                         package.log))
+        else:
+            gbp.log.info("Finished %s" % package.name)
+
+    def _handle(self, package, msg):
+        """Handle a message from a worker"""
+        if msg == MSG_BUILD_REQUEST:
+            package.set_state('wait')
+            self.waiting.append(package)
+        elif msg == MSG_BUILD_DONE:
+            package.set_state('finish')
+
+    def _schedule(self):
+        """Start builds and new workers as slots free up"""
+        while self.waiting and self._count('build') < self.builder_jobs:
+            package = self.waiting.pop(0)
+            package.set_state('build')
+            os.write(package.to_worker, MSG_BUILD_GRANTED)
+        while self.pending and self._count('export') < self.jobs:
+            self._start(self.pending.pop(0))
+
+    def run(self):
+        """Build all packages"""
+        self._schedule()
+        while self.running:
+            try:
+                ready = select.select(list(self.running), [], [])[0]
+            except select.error as err:
+                if err.args[0] == errno.EINTR:
+                    continue
+                raise
+            for fd in ready:
+                package = self.running[fd]
+                msgs = os.read(fd, 64)
+                if not msgs:
+                    self._finish(package)
+                for msg in msgs:
+                    self._handle(package, msg)
+            self._schedule()
+
+
+def _format_duration(seconds):
+    """Format a duration for the summary"""
+    return '-' if seconds is None else '%.1fs' % seconds
+
+
+def print_summary(packages):
+    """Print a summary table of the builds"""
+    width = max([len(pkg.name) for pkg in packages] + [len('Package')])
+    row = "%%-%ds  %%-6s  %%8s  %%8s  %%8s  %%8s  %%s" % width
+    gbp.log.info("Summary:")
+    gbp.log.info(row % ('Package', 'Result', 'Export', 'Wait', 'Build',
+                        'Total', 'Log'))
+    for pkg in packages:
+        gbp.log.info(row % (pkg.name,
+                            'ok' if pkg.retval == 0 else 'FAILED',
+                            _format_duration(pkg.duration('export', 'wait')),
+                            _format_duration(pkg.duration('wait', 'build')),
+                            _format_duration(pkg.duration('build', 'finish')),
+                            _format_duration(pkg.duration('export', 'done')),
+                            pkg.log))
+    failed = len([pkg for pkg in packages if pkg.retval])
+    gbp.log.info("%d package(s) built, %d failed" % (len(packages) - failed,
+                                                     failed))
+
+
+def build_parser(name):
+    """Construct command line parser"""
+    try:
+        parser = GbpOptionParserRpm(command=os.path.basename(name),
+                                    prefix='',
+                                    usage='%prog [options] [REPOSITORY ...] '
+                                          '[-- BUILDPACKAGE-RPM OPTIONS]')
+    except configparser.ParsingError as err:
+        gbp.log.err(err)
+        return None
+
+    parser.add_option("-v", "--verbose", action="store_true", dest="verbose",
+                      default=False, help="verbose command execution")
+    parser.add_config_file_option(option_name="color", dest="color",
+                                  type='tristate')
+    parser.add_config_file_option(option_name="color-scheme",
+                                  dest="color_scheme")
+    parser.add_option("--manifest", dest="manifest", metavar="FILE",
+                      help="read the repositories to build from FILE, one "
+                           "path per line")
+    parser.add_config_file_option(option_name="jobs", dest="jobs",
+                                  type='int')
+    parser.add_config_file_option(option_name="builder-jobs",
+                                  dest="builder_jobs", type='int')
+    parser.add_config_file_option(option_name="export-dir", dest="export_dir",
+                                  type="path",
+                                  help="Base directory for the builds, each "
+                                       "package is exported to its own "
+                                       "subdirectory, default is "
+                                       "'%(export-dir)s'")
+    parser.add_config_file_option(option_name="log-dir", dest="log_dir",
+                                  type="path")
+    return parser
+
+
+def parse_args(argv):
+    """Parse commandline arguments"""
+    if '--' in argv:
+        sep = argv.index('--')
+        argv, gbp_args = argv[:sep], argv[sep + 1:]
+    else:
+        gbp_args = []
+
+    parser = build_parser(argv[0])
+    if not parser:
+        return None, None, None
+
+    options, args = parser.parse_args(argv[1:])
+    gbp.log.setup(options.color, options.verbose, options.color_scheme)
+    return options, args, gbp_args
+
+
+def main(argv):
+    """Entry point for gbp-build-many-rpm"""
+    gbp.log.initialize()
+
+    options, args, gbp_args = parse_args(argv)
+    if not options:
+        return 1
+
+    try:
+        repos = list(args)
+        if options.manifest:
+            repos.extend(read_manifest(options.manifest))
+        if not repos:
+            raise GbpError("No repositories to build given. Try --help.")
+        if options.jobs < 0 or options.builder_jobs < 1:
+            raise GbpError("Invalid number of jobs")
+        jobs = options.jobs or multiprocessing.cpu_count()
+
+        export_dir = os.path.abspath(options.export_dir)
+        log_dir = os.path.abspath(options.log_dir or export_dir)
+        if not os.path.isdir(log_dir):
+            os.makedirs(log_dir)
+        packages = [Package(path, log_dir) for path in repos]
+        names = [pkg.name for pkg in packages]
+        for pkg in packages:
+            if not os.path.isdir(pkg.path):
+                raise GbpError("Repository '%s' not found" % pkg.path)
+            if names.count(pkg.name) > 1:
+                raise GbpError("Several repositories named '%s'" % pkg.name)
+
+            # Build as 'gbp buildpackage-rpm' with the given options would,
+            # each package exported to its own directory
+            pkg.argv = ['buildpackage-rpm', '--git-color=off',
+                        '--git-export-dir=%s' % os.path.join(export_dir,
+                                                             pkg.name)]
+            pkg.argv += gbp_args
+        BuildScheduler(packages, jobs, options.builder_jobs).run()
+    except (GbpError, OSError) as err:
+        gbp.log.err(err)
+        return 1
+
+    print_summary(packages)
+    return 1 if [pkg for pkg in packages if pkg.retval] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
+
+# vim:et:ts=4:sw=4:et:sts=4:ai:set list listchars=tab\:»·,trail\:·:
@@ -457,10 +457,11 @@ def md(a, b):
     return c
 
 
-def build_parser(name, prefix=None, git_treeish=None):
+def build_parser(name, prefix=None, git_treeish=None, repo=None):
     try:
         parser = GbpOptionParserDebian(command=os.path.basename(name),
-                                       prefix=prefix, git_treeish=git_treeish)
+                                       prefix=prefix, git_treeish=git_treeish,
+                                       repo=repo)
     except configparser.ParsingError as err:
         gbp.log.err(err)
         return None
@@ -546,7 +547,7 @@ def build_parser(name, prefix=None, git_treeish=None):
     return parser
 
 
-def parse_args(argv, prefix, git_treeish=None):
+def parse_args(argv, prefix, git_treeish=None, repo=None):
     """Parse config and command line arguments"""
     args = [ arg for arg in argv[1:] if arg.find('--%s' % prefix) == 0 ]
     dpkg_args = [ arg for arg in argv[1:] if arg.find('--%s' % prefix) == -1 ]
@@ -556,7 +557,8 @@ def parse_args(argv, prefix, git_treeish=None):
         if arg in dpkg_args:
             args.append(arg)
 
-    parser = build_parser(argv[0], prefix=prefix, git_treeish=git_treeish)
+    parser = build_parser(argv[0], prefix=prefix, git_treeish=git_treeish,
+                          repo=repo)
     if not parser:
         return None, None, None
     options, args = parser.parse_args(args)
@@ -602,18 +604,21 @@ def main(argv):
 
     gbp.log.initialize()
 
-    options, gbp_args, dpkg_args = parse_args(argv, prefix)
+    # Open the repository only once, config parsing can reuse it
+    try:
+        repo = DebianGitRepository(os.path.curdir)
+    except GitRepositoryError:
+        repo = None
+
+    options, gbp_args, dpkg_args = parse_args(argv, prefix, repo=repo)
 
     if not options:
         return 1
 
-    try:
-        repo = DebianGitRepository(os.path.curdir)
-    except GitRepositoryError:
+    if repo is None:
         gbp.log.err("%s is not a git repository" % (os.path.abspath('.')))
         return 1
-    else:
-        repo_dir = os.path.abspath(os.path.curdir)
+    repo_dir = os.path.abspath(os.path.curdir)
 
     # Determine tree-ish to be exported
     try:
@@ -623,7 +628,7 @@ def main(argv):
         return 1
     # Re-parse config options with using the per-tree config file(s) from the
     # exported tree-ish
-    options, gbp_args, builder_args = parse_args(argv, prefix, tree)
+    options, gbp_args, builder_args = parse_args(argv, prefix, tree, repo)
 
     try:
         init_tmpdir(options.tmp_dir, prefix='buildpackage_')
@@ -18,28 +18,38 @@
 #
 """Build an RPM package out of a Git repository"""
 
+from contextlib import contextmanager
 from datetime import datetime
 from six.moves import configparser
 import os
 import re
+import shlex
 import shutil
 import sys
 
 import gbp.log
 import gbp.notifications
+import gbp.profile
 import gbp.rpm as rpm
 from gbp.command_wrappers import Command, RunAtCommand, CommandExecFailed
 from gbp.config import GbpOptionParserRpm, GbpOptionGroup
 from gbp.errors import GbpError
 from gbp.format import format_str
 from gbp.pkg import compressor_opts
+from gbp.pkg.pristinetar import PristineTarCache
+from gbp.rpm.buildcache import BuildCache, find_packages, new_packages
 from gbp.rpm.git import GitRepositoryError, RpmGitRepository
+from gbp.rpm.mockpool import MockPool
 from gbp.rpm.policy import RpmPkgPolicy
 from gbp.tmpfile import init_tmpdir, del_tmpdir, tempfile
 from gbp.scripts.common.buildpackage import (index_name, wc_names,
                                              git_archive_submodules,
                                              git_archive_single, dump_tree,
-                                             write_wc, drop_index)
+                                             write_wc, drop_index,
+                                             export_blobs, current_exports,
+                                             has_export_attributes,
+                                             sync_export_dir,
+                                             update_export_manifest)
 from gbp.scripts.pq_rpm import parse_spec, update_patch_series
 from gbp.scripts.common.pq import is_pq_branch, pq_branch_name, pq_branch_base
 
@@ -48,6 +58,15 @@ class GbpAutoGenerateError(GbpError):
     pass
 
 
+@contextmanager
+def builder_slot():
+    """
+    Context the builder is run in. Replaced by gbp build-many-rpm for limiting
+    the number of builds running in parallel.
+    """
+    yield
+
+
 def makedir(path):
     """Create directory"""
     try:
@@ -126,6 +145,10 @@ def pristine_tar_build_orig(repo, orig_file, output_dir, options):
         if not repo.has_branch(repo.pristine_tar_branch):
             gbp.log.warn('Pristine-tar branch "%s" not found' %
                          repo.pristine_tar.branch)
+        if options.pristine_tar_cache_dir:
+            repo.pristine_tar.cache = PristineTarCache(
+                                        options.pristine_tar_cache_dir,
+                                        options.pristine_tar_cache_size)
         try:
             repo.pristine_tar.checkout(os.path.join(output_dir, orig_file))
             return True
@@ -287,6 +310,13 @@ def export_patches(repo, spec, export_treeish, options):
         raise GbpAutoGenerateError(str(err))
 
 
+def export_path(options, spec, fname):
+    """Path of a packaging file in the export dir, relative to it"""
+    if fname == spec.specfile:
+        return os.path.join(options.export_specdir, fname)
+    return os.path.join(options.export_sourcedir, fname)
+
+
 def is_native(repo, options):
     """Determine whether a package is native or non-native"""
     if options.native.is_auto():
@@ -315,6 +345,23 @@ def setup_builder(options, builder_args):
             '--define "_sourcedir %%_topdir/%s"' % options.export_sourcedir])
 
 
+def build_cache_key(repo, tree, spec, source_dir, options, builder_args):
+    """
+    Build cache key of the build: the exported tree, the exported spec
+    file and sources and the builder command line and environment
+    """
+    files = {'spec': os.path.join(spec.specdir, spec.specfile)}
+    for fname in os.listdir(source_dir):
+        path = os.path.join(source_dir, fname)
+        if os.path.isfile(path):
+            files['source/%s' % fname] = path
+    command = [options.builder] + builder_args
+    command += ['%s=%s' % (var, val) for var, val in sorted(os.environ.items())
+                if var.startswith('GBP_BUILDER_MOCK_')]
+    return BuildCache.build_key(repo.rev_parse('%s^{tree}' % tree), files,
+                                command)
+
+
 def packaging_tag_time_fields(repo, commit, tag_format_str, other_fields):
     """Update string format fields for packaging tag"""
     commit_info = repo.get_commit_info(commit)
@@ -392,6 +439,23 @@ def setup_mock(options):
             os.environ['GBP_BUILDER_MOCK_OPTIONS'] = options.mock_options
 
 
+@contextmanager
+def mock_chroot(options):
+    """
+    Lease a chroot from the mock chroot pool for the duration of the build,
+    yields the environment for gbp-builder-mock
+    """
+    if not options.use_mock or options.mock_pool_size <= 0:
+        yield {}
+        return
+    root = options.mock_root or '%s-%s' % (options.mock_dist,
+                                           options.mock_arch or os.uname()[4])
+    pool = MockPool(options.mock_pool_dir, options.mock_pool_size,
+                    shlex.split(options.mock_options))
+    with pool.lease(root) as env:
+        yield env
+
+
 def create_packaging_tag(repo, commit, name, version, options):
     """Create a packaging/release Git tag"""
     tag_name, tag_msg = packaging_tag_data(repo, commit, name, version, options)
@@ -411,11 +475,12 @@ def disable_hooks(options):
             setattr(options, hook, '')
 
 
-def build_parser(name, prefix=None, git_treeish=None):
+def build_parser(name, prefix=None, git_treeish=None, repo=None):
     """Construct config/option parser"""
     try:
         parser = GbpOptionParserRpm(command=os.path.basename(name),
-                                    prefix=prefix, git_treeish=git_treeish)
+                                    prefix=prefix, git_treeish=git_treeish,
+                                    repo=repo)
     except configparser.ParsingError as err:
         gbp.log.err(err)
         return None
@@ -443,6 +508,10 @@ def build_parser(name, prefix=None, git_treeish=None):
     parser.add_option("--git-verbose", action="store_true", dest="verbose",
                     default=False, help="verbose command execution")
     parser.add_config_file_option(option_name="tmp-dir", dest="tmp_dir")
+    parser.add_config_file_option(option_name="profile", dest="profile",
+                    type="path")
+    parser.add_config_file_option(option_name="trace", dest="trace",
+                    type="path")
     parser.add_config_file_option(option_name="color", dest="color",
                     type='tristate')
     parser.add_config_file_option(option_name="color-scheme",
@@ -476,6 +545,10 @@ def build_parser(name, prefix=None, git_treeish=None):
                     dest="pristine_tar")
     orig_group.add_boolean_config_file_option(option_name="pristine-tar-commit",
                     dest="pristine_tar_commit")
+    orig_group.add_config_file_option(option_name="pristine-tar-cache-dir",
+                    dest="pristine_tar_cache_dir", type="path")
+    orig_group.add_config_file_option(option_name="pristine-tar-cache-size",
+                    dest="pristine_tar_cache_size")
     orig_group.add_config_file_option(option_name="force-create",
                     dest="force_create", action="store_true",
                     help="force creation of upstream source tarball")
@@ -525,7 +598,18 @@ def build_parser(name, prefix=None, git_treeish=None):
     cmd_group.add_config_file_option(option_name="arch", dest="mock_arch")
     cmd_group.add_config_file_option(option_name="mock-root", dest="mock_root")
     cmd_group.add_config_file_option(option_name="mock-options", dest="mock_options")
+    cmd_group.add_config_file_option(option_name="mock-pool-size",
+                    dest="mock_pool_size", type="int")
+    cmd_group.add_config_file_option(option_name="mock-pool-dir",
+                    dest="mock_pool_dir", type="path")
     cmd_group.add_boolean_config_file_option(option_name="hooks", dest="hooks")
+    cmd_group.add_config_file_option(option_name="build-cache-dir",
+                    dest="build_cache_dir", type="path")
+    cmd_group.add_config_file_option(option_name="build-cache-size",
+                    dest="build_cache_size")
+    cmd_group.add_boolean_config_file_option(
+                    option_name="build-cache-postbuild",
+                    dest="build_cache_postbuild")
     export_group.add_option("--git-no-build", action="store_true",
                     dest="no_build",
                     help="Don't run builder or the associated hooks")
@@ -537,6 +621,9 @@ def build_parser(name, prefix=None, git_treeish=None):
                     dest="export_specdir", type="path")
     export_group.add_config_file_option(option_name="export-sourcedir",
                     dest="export_sourcedir", type="path")
+    export_group.add_boolean_config_file_option(
+                    option_name="export-incremental",
+                    dest="export_incremental")
     export_group.add_config_file_option("export", dest="export",
                     metavar="TREEISH",
                     help="export treeish object TREEISH, default is "
@@ -560,7 +647,7 @@ def build_parser(name, prefix=None, git_treeish=None):
     return parser
 
 
-def parse_args(argv, prefix, git_treeish=None):
+def parse_args(argv, prefix, git_treeish=None, repo=None):
     """Parse config and command line arguments"""
     args = [arg for arg in argv[1:] if arg.find('--%s' % prefix) == 0]
     builder_args = [arg for arg in argv[1:] if arg.find('--%s' % prefix) == -1]
@@ -570,7 +657,8 @@ def parse_args(argv, prefix, git_treeish=None):
         if arg in builder_args:
             args.append(arg)
 
-    parser = build_parser(argv[0], prefix=prefix, git_treeish=git_treeish)
+    parser = build_parser(argv[0], prefix=prefix, git_treeish=git_treeish,
+                          repo=repo)
     if not parser:
         return None, None, None
     options, args = parser.parse_args(args)
@@ -585,6 +673,9 @@ def parse_args(argv, prefix, git_treeish=None):
             return None, None, None
 
     options.patch_compress = rpm.string_to_int(options.patch_compress)
+    options.pristine_tar_cache_size = rpm.string_to_int(
+                                            options.pristine_tar_cache_size)
+    options.build_cache_size = rpm.string_to_int(options.build_cache_size)
 
     return options, args, builder_args
 
@@ -595,14 +686,18 @@ def main(argv):
     prefix = "git-"
     spec = None
 
-    options, gbp_args, builder_args = parse_args(argv, prefix)
+    # Open the repository only once, config parsing can reuse it
+    try:
+        repo = RpmGitRepository(os.path.curdir)
+    except GitRepositoryError:
+        repo = None
+
+    options, gbp_args, builder_args = parse_args(argv, prefix, repo=repo)
 
     if not options:
         return 1
 
-    try:
-        repo = RpmGitRepository(os.path.curdir)
-    except GitRepositoryError:
+    if repo is None:
         gbp.log.err("%s is not a git repository" % (os.path.abspath('.')))
         return 1
 
@@ -614,23 +709,29 @@ def main(argv):
         return 1
     # Re-parse config options with using the per-tree config file(s) from the
     # exported tree-ish
-    options, gbp_args, builder_args = parse_args(argv, prefix, tree)
+    options, gbp_args, builder_args = parse_args(argv, prefix, tree, repo)
+    if options.profile:
+        gbp.profile.enable()
+    if options.trace:
+        gbp.profile.enable_trace()
 
     branch = get_current_branch(repo)
 
     try:
         init_tmpdir(options.tmp_dir, prefix='buildpackage-rpm_')
 
-        tree, spec = guess_export_params(repo, options)
+        with gbp.profile.phase('prepare'):
+            tree, spec = guess_export_params(repo, options)
 
-        Command(options.cleaner, shell=True)()
-        if not options.ignore_new:
-            ret, out = repo.is_clean(options.ignore_untracked)
-            if not ret:
-                gbp.log.err("You have uncommitted changes in your source tree:")
-                gbp.log.err(out)
-                raise GbpError("Use --git-ignore-new or --git-ignore-untracked "
-                               "to ignore.")
+            Command(options.cleaner, shell=True)()
+            if not options.ignore_new:
+                ret, out = repo.is_clean(options.ignore_untracked)
+                if not ret:
+                    gbp.log.err("You have uncommitted changes in your source "
+                                "tree:")
+                    gbp.log.err(out)
+                    raise GbpError("Use --git-ignore-new or "
+                                   "--git-ignore-untracked to ignore.")
 
         if not options.ignore_new and not options.ignore_branch:
             if branch != options.packaging_branch:
@@ -639,14 +740,36 @@ def main(argv):
                 raise GbpError("Use --git-ignore-branch to ignore or "
                                "--git-packaging-branch to set the branch name.")
 
-        # Dump from git to a temporary directory:
+        # Dump from git to a temporary directory. In an incremental export
+        # only the files that differ from the previous export are dumped,
+        # the spec file is always needed.
         packaging_tree = '%s:%s' % (tree, options.packaging_dir)
         dump_dir = tempfile.mkdtemp(prefix='packaging_')
+        incremental = options.export_incremental and not options.tag_only
+        unchanged = {}
         gbp.log.debug("Dumping packaging files to '%s'" % dump_dir)
-        if not dump_tree(repo, dump_dir, packaging_tree, False, False):
-            raise GbpError
+        with gbp.profile.phase('dump'):
+            # Export attributes need git archive, i.e. a full dump
+            if incremental and not has_export_attributes(repo,
+                                                         packaging_tree):
+                current = {}
+                for relpath, sha1 in \
+                        current_exports(options.export_dir).items():
+                    fname = os.path.basename(relpath)
+                    if fname != spec.specfile and \
+                            relpath == export_path(options, spec, fname):
+                        current[fname] = sha1
+                try:
+                    _written, unchanged = export_blobs(repo, dump_dir,
+                                                       packaging_tree,
+                                                       current)
+                except (GitRepositoryError, IOError, OSError) as err:
+                    raise GbpError("Error when dumping tree: %s" % err)
+            elif not dump_tree(repo, dump_dir, packaging_tree, False, False):
+                raise GbpError
         # Re-parse spec from dump dir to get version etc.
-        spec = rpm.SpecFile(os.path.join(dump_dir, spec.specfile))
+        with gbp.profile.phase('spec-parse'):
+            spec = rpm.SpecFile(os.path.join(dump_dir, spec.specfile))
 
         if not options.tag_only:
             # Setup builder opts
@@ -660,7 +783,15 @@ def main(argv):
                     patch_tree = get_tree(repo, options.patch_export_rev)
                 else:
                     patch_tree = tree
-                export_patches(repo, spec, patch_tree, options)
+                with gbp.profile.phase('patch-export'):
+                    old_patches = set([os.path.basename(patch.path) for patch
+                                       in spec.patchseries(unapplied=True)])
+                    export_patches(repo, spec, patch_tree, options)
+                    # Patches dropped from the series are not exported
+                    for patch in spec.patchseries(unapplied=True):
+                        old_patches.discard(os.path.basename(patch.path))
+                    for fname in old_patches:
+                        unchanged.pop(fname, None)
 
             # Prepare final export dirs
             export_dir = makedir(options.export_dir)
@@ -671,16 +802,26 @@ def main(argv):
             # Move packaging files to final export dir
             gbp.log.debug("Exporting packaging files from '%s' to '%s'" %
                           (dump_dir, export_dir))
+            export_files = {}
             for fname in os.listdir(dump_dir):
-                src = os.path.join(dump_dir, fname)
-                if fname == spec.specfile:
-                    dst = os.path.join(spec_dir, fname)
-                else:
-                    dst = os.path.join(source_dir, fname)
-                try:
-                    shutil.copy2(src, dst)
-                except IOError as err:
-                    raise GbpError("Error exporting packaging files: %s" % err)
+                export_files[export_path(options, spec, fname)] = \
+                    os.path.join(dump_dir, fname)
+            current = dict([(export_path(options, spec, fname), sha1) for
+                            fname, sha1 in unchanged.items()])
+            try:
+                with gbp.profile.phase('export'):
+                    if incremental:
+                        written, removed = sync_export_dir(export_files,
+                                                           export_dir,
+                                                           current)
+                        gbp.log.debug("Incremental export: %d file(s) "
+                                      "written, %d removed" %
+                                      (written, removed))
+                    else:
+                        for dst, src in export_files.items():
+                            shutil.copy2(src, os.path.join(export_dir, dst))
+            except (IOError, OSError) as err:
+                raise GbpError("Error exporting packaging files: %s" % err)
             spec.specdir = os.path.abspath(spec_dir)
 
             if options.orig_prefix != 'auto':
@@ -693,31 +834,35 @@ def main(argv):
                 options.orig_prefix = spec.orig_src['prefix']
 
             # Get/build the orig tarball
-            if is_native(repo, options):
-                if spec.orig_src and not options.no_create_orig:
-                    # Just build source archive from the exported tree
-                    gbp.log.info("Creating (native) source archive %s from '%s'"
-                                 % (spec.orig_src['filename'], tree))
-                    if spec.orig_src['compression']:
-                        gbp.log.debug("Building source archive with "
-                                      "compression '%s -%s'" %
-                                      (spec.orig_src['compression'],
-                                       options.comp_level))
-                    if not git_archive(repo, spec, source_dir, tree,
-                                       options.orig_prefix, options.comp_level,
-                                       options.with_submodules):
-                        raise GbpError("Cannot create source tarball at '%s'" %
-                                       source_dir)
-            # Non-native packages: create orig tarball from upstream
-            elif spec.orig_src:
-                prepare_upstream_tarball(repo, spec, options, source_dir)
+            with gbp.profile.phase('orig'):
+                if is_native(repo, options):
+                    if spec.orig_src and not options.no_create_orig:
+                        # Just build source archive from the exported tree
+                        gbp.log.info("Creating (native) source archive %s "
+                                     "from '%s'" % (spec.orig_src['filename'],
+                                                    tree))
+                        if spec.orig_src['compression']:
+                            gbp.log.debug("Building source archive with "
+                                          "compression '%s -%s'" %
+                                          (spec.orig_src['compression'],
+                                           options.comp_level))
+                        if not git_archive(repo, spec, source_dir, tree,
+                                           options.orig_prefix,
+                                           options.comp_level,
+                                           options.with_submodules):
+                            raise GbpError("Cannot create source tarball at "
+                                           "'%s'" % source_dir)
+                # Non-native packages: create orig tarball from upstream
+                elif spec.orig_src:
+                    prepare_upstream_tarball(repo, spec, options, source_dir)
 
             # Run postexport hook
             if options.postexport:
-                RunAtCommand(options.postexport, shell=True,
-                             extra_env={'GBP_GIT_DIR': repo.git_dir,
-                                        'GBP_TMP_DIR': export_dir}
-                             )(dir=export_dir)
+                with gbp.profile.phase('postexport'):
+                    RunAtCommand(options.postexport, shell=True,
+                                 extra_env={'GBP_GIT_DIR': repo.git_dir,
+                                            'GBP_TMP_DIR': export_dir}
+                                 )(dir=export_dir)
             # Do actual build
             if not options.no_build and not options.tag_only:
                 if options.prebuild:
@@ -732,10 +877,30 @@ def main(argv):
                                         spec.specfile))
                 else:
                     builder_args.append(spec.specfile)
-                RunAtCommand(options.builder, builder_args, shell=True,
-                             extra_env={'GBP_BUILD_DIR': export_dir}
-                             )(dir=export_dir)
-                if options.postbuild:
+                cache, cache_key, cached = None, None, None
+                if options.build_cache_dir:
+                    cache = BuildCache(options.build_cache_dir,
+                                       options.build_cache_size)
+                    cache_key = build_cache_key(repo, tree, spec, source_dir,
+                                                options, builder_args)
+                    cached = cache.get(cache_key, export_dir)
+                if cached is not None:
+                    gbp.log.info("Using cached build results, not running "
+                                 "the builder")
+                else:
+                    packages = find_packages(export_dir)
+                    with builder_slot(), mock_chroot(options) as mock_env:
+                        with gbp.profile.phase('build'):
+                            RunAtCommand(options.builder, builder_args,
+                                         shell=True,
+                                         extra_env=dict(mock_env,
+                                                GBP_BUILD_DIR=export_dir)
+                                         )(dir=export_dir)
+                    if cache:
+                        cache.put(cache_key, export_dir,
+                                  new_packages(export_dir, packages))
+                if options.postbuild and (cached is None or
+                                          options.build_cache_postbuild):
                     changes = os.path.abspath("%s/%s.changes" % (source_dir,
                                                                  spec.name))
                     gbp.log.debug("Looking for changes file %s" % changes)
@@ -746,8 +911,9 @@ def main(argv):
         # Tag (note: tags the exported version)
         if options.tag or options.tag_only:
             gbp.log.info("Tagging %s" % rpm.compose_version_str(spec.version))
-            tag = create_packaging_tag(repo, tree, spec.name, spec.version,
-                                       options)
+            with gbp.profile.phase('tag'):
+                tag = create_packaging_tag(repo, tree, spec.name, spec.version,
+                                           options)
             vcs_info = get_vcs_info(repo, tag)
             if options.posttag:
                 sha = repo.rev_parse("%s^{}" % tag)
@@ -759,8 +925,14 @@ def main(argv):
             vcs_info = get_vcs_info(repo, tree)
 
         # Put 'VCS:' tag to .spec
-        spec.set_tag('VCS', None, format_str(options.spec_vcs_tag, vcs_info))
-        spec.write_spec_file()
+        with gbp.profile.phase('spec-write'):
+            spec.set_tag('VCS', None, format_str(options.spec_vcs_tag,
+                                                 vcs_info))
+            spec.write_spec_file()
+            if incremental:
+                update_export_manifest(options.export_dir,
+                                       export_path(options, spec,
+                                                   spec.specfile))
 
     except CommandExecFailed:
         retval = 1
@@ -789,6 +961,11 @@ def main(argv):
                 gbp.log.err("Failed to send notification")
                 retval = 1
 
+    if options.profile:
+        gbp.profile.report(options.profile)
+    if options.trace:
+        gbp.profile.write_trace(options.trace)
+
     return retval
 
 if __name__ == '__main__':
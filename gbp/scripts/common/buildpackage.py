@@ -18,13 +18,17 @@
 #
 """Common functionality for Debian and RPM buildpackage scripts"""
 
+import hashlib
 import os, os.path
 import pipes
+import re
 import tempfile
 import subprocess
 import shutil
 import subprocess
 
+from six.moves import zip
+
 from gbp.command_wrappers import (CatenateTarArchive, CatenateZipArchive)
 from gbp.errors import GbpError
 from gbp.git.repository import GitRepository, GitRepositoryError
@@ -149,16 +153,85 @@ def untar_data(outdir, data):
 
 
 #{ Functions to handle export-dir
+def has_export_attributes(repo, treeish):
+    """
+    Check if git archive would export a tree-ish differently from its
+    blobs, i.e. if the tree or the repository sets the export-ignore or
+    export-subst attribute on some files
+
+    @param treeish: tree-ish, possibly of the form I{<rev>:<path>}
+    @type treeish: C{str}
+    @rtype: C{bool}
+    """
+    attrs = []
+    try:
+        with open(os.path.join(repo.git_dir, 'info', 'attributes')) as fobj:
+            attrs.append(fobj.read())
+    except IOError:
+        pass
+    rev, sep, path = treeish.partition(':')
+    path = os.path.normpath(os.path.join(path, '.gitattributes'))
+    for typ, content in repo.iter_objects(['%s:%s' % (rev, path)],
+                                          missing_ok=True):
+        if typ == 'blob':
+            attrs.append(content)
+    return any(re.search(r'\bexport-(ignore|subst)\b', data) for data in attrs)
+
+
+def export_blobs(repo, export_dir, treeish, current=None):
+    """
+    Write the blobs at the top level of a git tree-ish to export_dir,
+    reading them one at a time through one batched object reader. Unlike
+    git archive this doesn't apply export attributes, see
+    L{has_export_attributes}.
+
+    @param current: git blob SHA1s of files that are already up to date,
+        by file name. Blobs with the same SHA1 are not written.
+    @type current: C{dict}
+    @return: names of the files written, and the blob SHA1s of the files
+        that were up to date
+    @rtype: C{tuple} of C{list} and C{dict}
+    """
+    current = current or {}
+    umask = os.umask(0)
+    os.umask(umask)
+    blobs = []
+    unchanged = {}
+    for mode, typ, sha1, name in repo.list_tree(treeish):
+        if typ != 'blob':
+            continue
+        if current.get(name) == sha1:
+            unchanged[name] = sha1
+        else:
+            blobs.append((mode, sha1, name))
+    objects = repo.iter_objects([sha1 for _mode, sha1, _name in blobs])
+    for (mode, _sha1, name), (_type, content) in zip(blobs, objects):
+        path = os.path.join(export_dir, name)
+        if os.path.lexists(path):
+            os.unlink(path)
+        if mode == '120000':
+            os.symlink(content, path)
+        else:
+            with open(path, 'wb') as fobj:
+                fobj.write(content)
+            perms = 0o777 if mode == '100755' else 0o666
+            os.chmod(path, perms & ~umask)
+    return [name for _mode, _sha1, name in blobs], unchanged
+
+
 def dump_tree(repo, export_dir, treeish, with_submodules, recursive=True):
     """Dump a git tree-ish to output_dir"""
     if not os.path.exists(export_dir):
         os.makedirs(export_dir)
-    if recursive:
-        paths = ''
-    else:
-        paths = [nam for _mod, typ, _sha, nam in repo.list_tree(treeish) if
-                    typ == 'blob']
     try:
+        if recursive:
+            paths = ''
+        elif not has_export_attributes(repo, treeish):
+            export_blobs(repo, export_dir, treeish)
+            return True
+        else:
+            paths = [nam for _mod, typ, _sha, nam in repo.list_tree(treeish)
+                     if typ == 'blob']
         data = repo.archive('tar', '', None, treeish, paths)
         untar_data(export_dir, data)
         if recursive and with_submodules and repo.has_submodules():
@@ -173,9 +246,137 @@ def dump_tree(repo, export_dir, treeish, with_submodules, recursive=True):
     except GitRepositoryError as err:
         gbp.log.err("Git error when dumping tree: %s" % err)
         return False
+    except (IOError, OSError) as err:
+        gbp.log.err("Error when dumping tree: %s" % err)
+        return False
     return True
 
 
+def git_blob_sha1(filename):
+    """
+    Calculate the SHA1 git would give to the contents of I{filename} as a
+    blob object, i.e. the same as I{git hash-object --no-filters}
+
+    >>> import tempfile
+    >>> with tempfile.NamedTemporaryFile() as tmp:
+    ...     tmp.write('foo\\n')
+    ...     tmp.flush()
+    ...     git_blob_sha1(tmp.name)
+    '257cc5642cb1a054f08cc83f2d943e56fd3ebe99'
+    """
+    sha = hashlib.sha1()
+    sha.update('blob %d\0' % os.path.getsize(filename))
+    with open(filename, 'rb') as fobj:
+        for block in iter(lambda: fobj.read(65536), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+export_manifest_name = '.gbp-export-manifest'
+
+
+def _read_export_manifest(export_dir):
+    """Read export manifest, returns a dict of relpath: (sha1, size, mtime)"""
+    manifest = {}
+    try:
+        with open(os.path.join(export_dir, export_manifest_name)) as fobj:
+            for line in fobj:
+                sha1, size, mtime, relpath = line.rstrip('\n').split(' ', 3)
+                manifest[relpath] = (sha1, int(size), float(mtime))
+    except (IOError, ValueError):
+        return {}
+    return manifest
+
+
+def _write_export_manifest(export_dir, manifest):
+    """Atomically write out the export manifest"""
+    path = os.path.join(export_dir, export_manifest_name)
+    with open(path + '.tmp', 'w') as fobj:
+        for relpath, (sha1, size, mtime) in sorted(manifest.items()):
+            fobj.write('%s %d %r %s\n' % (sha1, size, mtime, relpath))
+    os.rename(path + '.tmp', path)
+
+
+def current_exports(export_dir):
+    """
+    Get the files of the previous export that are still as they were
+    exported, i.e. listed in the export manifest and not touched since
+
+    @return: git blob SHA1s of the files, by path relative to I{export_dir}
+    @rtype: C{dict}
+    """
+    current = {}
+    manifest = _read_export_manifest(export_dir)
+    for relpath, (sha1, size, mtime) in manifest.items():
+        try:
+            stat = os.stat(os.path.join(export_dir, relpath))
+        except OSError:
+            continue
+        if (stat.st_size, stat.st_mtime) == (size, mtime):
+            current[relpath] = sha1
+    return current
+
+
+def sync_export_dir(files, export_dir, current=None):
+    """
+    Incrementally copy files to the export dir. A manifest of the git blob
+    SHA1s of the exported files is kept in the export dir and only files
+    whose content differs from the previous export, or whose exported copy
+    was touched since, are written. Files exported previously but not
+    present in I{files} or I{current} anymore are removed.
+
+    @param files: files to export, destination path relative to
+        I{export_dir} mapped to the source path
+    @type files: C{dict}
+    @param export_dir: the export directory
+    @type export_dir: C{str}
+    @param current: files to keep as they are, see L{current_exports}
+    @type current: C{dict}
+    @return: number of files written and removed
+    @rtype: C{tuple} of C{int}
+    """
+    old_manifest = _read_export_manifest(export_dir)
+    manifest = {}
+    for relpath in current or {}:
+        if relpath not in files and relpath in old_manifest:
+            manifest[relpath] = old_manifest[relpath]
+    written = 0
+    for relpath, src in files.items():
+        dst = os.path.join(export_dir, relpath)
+        sha1 = git_blob_sha1(src)
+        old = old_manifest.get(relpath)
+        if old and old[0] == sha1 and os.path.exists(dst):
+            stat = os.stat(dst)
+            if (stat.st_size, stat.st_mtime) == old[1:]:
+                manifest[relpath] = old
+                continue
+        shutil.copy2(src, dst)
+        stat = os.stat(dst)
+        manifest[relpath] = (sha1, stat.st_size, stat.st_mtime)
+        written += 1
+
+    removed = 0
+    for relpath in set(old_manifest) - set(manifest):
+        dst = os.path.join(export_dir, relpath)
+        if os.path.lexists(dst):
+            os.unlink(dst)
+            removed += 1
+    _write_export_manifest(export_dir, manifest)
+    return written, removed
+
+
+def update_export_manifest(export_dir, relpath):
+    """
+    Record a file re-written in the export dir after L{sync_export_dir}
+    in the export manifest
+    """
+    manifest = _read_export_manifest(export_dir)
+    path = os.path.join(export_dir, relpath)
+    stat = os.stat(path)
+    manifest[relpath] = (git_blob_sha1(path), stat.st_size, stat.st_mtime)
+    _write_export_manifest(export_dir, manifest)
+
+
 def wc_index(repo):
     """Get path of the temporary index file used for exporting working copy"""
     return os.path.join(repo.git_dir, "gbp_index")
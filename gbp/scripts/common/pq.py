@@ -18,19 +18,21 @@
 #
 """Common functionality for Debian and RPM patchqueue management"""
 
+import multiprocessing
 import re
 import os
+import shutil
 import subprocess
+import tempfile
 import datetime
 import pwd
 import socket
 import time
-from email.message import Message
-from email.generator import Generator
-from email.header import Header
-from email.charset import Charset, QP
+from io import BytesIO
+from multiprocessing.pool import ThreadPool
 
 from gbp.git import GitRepositoryError
+from gbp.git.mailinfo import is_patch_break
 from gbp.git.modifier import GitModifier, GitTz
 from gbp.errors import GbpError
 import gbp.log
@@ -221,6 +223,12 @@ def patch_path_filter(file_status, exclude_regex=None):
 
 def write_patch_file(filename, commit_info, diff):
     """Write patch file"""
+    # The email package is slow to import and only needed here
+    from email.message import Message
+    from email.generator import Generator
+    from email.header import Header
+    from email.charset import Charset, QP
+
     if not diff:
         gbp.log.debug("I won't generate empty diff %s" % filename)
         return None
@@ -413,8 +421,8 @@ def apply_single_patch(repo, branch, patch, fallback_author, options):
     gbp.log.info("Applied %s" % os.path.basename(patch.path))
 
 
-def apply_and_commit_patch(repo, patch, fallback_author, topic=None, name=None):
-    """apply a single patch 'patch', add topic 'topic' and commit it"""
+def _patch_commit_info(patch, fallback_author, topic, name):
+    """Author and commit message for the commit of a patch"""
     author = {'name': patch.author,
               'email': patch.email,
               'date': patch.date}
@@ -429,17 +437,435 @@ def apply_and_commit_patch(repo, patch, fallback_author, topic=None, name=None):
         else:
             gbp.log.warn("Patch '%s' has no authorship information" % patch_fn)
 
-    repo.apply_patch(patch.path, strip=patch.strip)
-    tree = repo.write_tree()
     msg = "%s\n\n%s" % (patch.subject, patch.long_desc)
     if topic:
         msg += "\nGbp-Pq: Topic %s" % topic
     if name:
         msg += "\nGbp-Pq: Name %s" % name
+    return author, msg
+
+
+def apply_and_commit_patch(repo, patch, fallback_author, topic=None, name=None):
+    """apply a single patch 'patch', add topic 'topic' and commit it"""
+    author, msg = _patch_commit_info(patch, fallback_author, topic, name)
+    _apply_and_commit(repo, patch, author, msg)
+
+
+def _apply_and_commit(repo, patch, author, msg, three_way=False):
+    """Apply a patch and commit it with the given author and message"""
+    with patch.open() as stream:
+        repo.apply_patch(stream, strip=patch.strip, three_way=three_way)
+    tree = repo.write_tree()
     commit = repo.commit_tree(tree, msg, [repo.head], author=author)
     repo.update_ref('HEAD', commit, msg="gbp-pq import %s" % patch.path)
 
 
+def commit_patch_in_index(repo, patch, parent, index_file, fallback_author,
+                          topic=None, name=None, three_way=False):
+    """
+    Apply a single patch to a (temporary) index only and commit it on top of
+    I{parent}, without touching the working copy or any refs. The index
+    must match I{parent}.
+
+    @return: the new commit
+    @rtype: C{str}
+    """
+    author, msg = _patch_commit_info(patch, fallback_author, topic, name)
+    with patch.open() as stream:
+        repo.apply_patch(stream, strip=patch.strip, cached=True,
+                         index_file=index_file, three_way=three_way)
+    tree = repo.write_tree(index_file)
+    return repo.commit_tree(tree, msg, [parent], author=author)
+
+
+class _ChunkReader(object):
+    """File object reading the chunks of data yielded by a generator"""
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self._buf = ''
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buf) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buf += chunk
+        if size < 0:
+            size = len(self._buf)
+        data, self._buf = self._buf[:size], self._buf[size:]
+        return data
+
+
+def _mboxrd_escape(line):
+    """
+    Quote a line for an mboxrd mailbox
+
+    >>> _mboxrd_escape('From here\\n')
+    '>From here\\n'
+    >>> _mboxrd_escape('>>From here\\n')
+    '>>>From here\\n'
+    >>> _mboxrd_escape('Frommer\\n')
+    'Frommer\\n'
+    """
+    if re.match(r'>*From ', line):
+        return '>' + line
+    return line
+
+
+def _stripspace(msg):
+    """
+    A commit message cleaned up like git stripspace does: trailing
+    whitespace and leading and trailing empty lines removed, consecutive
+    empty lines collapsed
+
+    >>> _stripspace('\\nfoo  \\n\\n\\n\\nbar\\n\\n')
+    'foo\\n\\nbar\\n'
+    >>> _stripspace('foo\\n\\nbar\\n')
+    'foo\\n\\nbar\\n'
+    """
+    lines = []
+    empty = False
+    for line in msg.split('\n'):
+        line = line.rstrip(' \t\r')
+        if not line:
+            empty = True
+            continue
+        if empty and lines:
+            lines.append('')
+        lines.append(line)
+        empty = False
+    return ''.join([line + '\n' for line in lines])
+
+
+def _mbox_message(patch, author, msg):
+    """
+    The message of a patch in a mailbox, formatted for git am. Git am cleans
+    up the commit message with stripspace, see L{_am_group}.
+    """
+    subject, _sep, body = msg.partition('\n\n')
+    yield 'From %s Mon Sep 17 00:00:00 2001\n' % ('0' * 40)
+    yield 'From: %s <%s>\n' % (author['name'], author['email'])
+    if author['date']:
+        yield 'Date: %s\n' % author['date']
+    yield 'Subject: %s\n' % subject
+    yield 'MIME-Version: 1.0\n'
+    yield 'Content-Type: text/plain; charset=UTF-8\n'
+    yield 'Content-Transfer-Encoding: 8bit\n\n'
+    for line in body.splitlines(True):
+        yield _mboxrd_escape(line)
+    yield '\n---\n'
+    in_patch = False
+    with patch.open() as stream:
+        for line in stream:
+            in_patch = in_patch or is_patch_break(line)
+            if in_patch:
+                yield _mboxrd_escape(line)
+    yield '\n'
+
+
+def _am_groups(series, fallback_author, topic, names):
+    """
+    Split a series into groups of patches that can be applied with one git
+    am run: patches with the same strip level and authorship information.
+    Patches without authorship are applied one by one.
+    """
+    group = []
+    for num, patch in enumerate(series):
+        name = names[num] if names else None
+        author, msg = _patch_commit_info(patch, fallback_author, topic, name)
+        if not (author['name'] and author['email']):
+            if group:
+                yield group
+            yield [(patch, author, msg)]
+            group = []
+            continue
+        if group and group[0][0].strip != patch.strip:
+            yield group
+            group = []
+        group.append((patch, author, msg))
+    if group:
+        yield group
+
+
+def _am_group(repo, group, three_way):
+    """Apply a group of patches with one git am run"""
+    def mbox():
+        for patch, author, msg in group:
+            gbp.log.debug("Applying %s" % patch.path)
+            for chunk in _mbox_message(patch, author, msg):
+                yield chunk
+
+    head = repo.head
+    try:
+        repo.am(_ChunkReader(mbox()), strip=group[0][0].strip,
+                keep_non_patch=True, keep_cr=True, patch_format='mboxrd',
+                three_way=three_way)
+    except GitRepositoryError as err:
+        applied = len(repo.get_commits(since=head, until='HEAD'))
+        repo.abort_am()
+        raise GbpError("Failed to apply '%s': %s" % (group[applied][0].path,
+                                                     err))
+
+    # Re-create the commits whose message git am altered, and everything on
+    # top of them, with the exact message
+    altered = [num for num, (_patch, _author, msg) in enumerate(group) if
+               _stripspace(msg) != msg]
+    if not altered:
+        return
+    commits = list(reversed(repo.get_commits(since=head, until='HEAD')))
+    parent = commits[altered[0] - 1] if altered[0] else head
+    for commit, (patch, author, msg) in zip(commits[altered[0]:],
+                                            group[altered[0]:]):
+        tree = repo.rev_parse('%s^{tree}' % commit)
+        parent = repo.commit_tree(tree, msg, [parent], author=author)
+    repo.update_ref('HEAD', parent, msg="gbp-pq import %s" % patch.path)
+
+
+def apply_and_commit_series(repo, series, fallback_author, topic=None,
+                            names=None, three_way=False):
+    """
+    Apply a series of patches and commit them, creating the same commits as
+    L{apply_and_commit_patch} would for each patch. The patches are fed to
+    git am as one mailbox, with one git am run per strip level. Commits whose
+    message git am would clean up are re-created with the original message.
+    HEAD is reset to where it was if a patch fails to apply.
+
+    @param series: the patches to apply
+    @type series: L{PatchSeries}
+    @param fallback_author: author of the patches that have no author
+    @type fallback_author: L{GitModifier}
+    @param topic: topic of the patches
+    @type topic: C{str}
+    @param names: names of the patches, in the order of the series
+    @type names: C{list} of C{str}
+    @param three_way: fall back to a three-way merge if a patch does not
+        apply cleanly
+    @type three_way: C{bool}
+    """
+    orig_head = repo.head
+    try:
+        for group in _am_groups(series, fallback_author, topic, names):
+            patch, author, msg = group[0]
+            if not (author['name'] and author['email']):
+                gbp.log.debug("Applying %s" % patch.path)
+                try:
+                    _apply_and_commit(repo, patch, author, msg, three_way)
+                except GitRepositoryError as err:
+                    raise GbpError("Failed to apply '%s': %s" % (patch.path,
+                                                                 err))
+            else:
+                _am_group(repo, group, three_way)
+    except (GbpError, GitRepositoryError):
+        repo.force_head(orig_head, hard=True)
+        raise
+
+
+def _strip_path(path, strip):
+    """
+    Strip leading components from a path in a patch
+
+    >>> _strip_path('a/foo/bar', 1)
+    'foo/bar'
+    >>> _strip_path('foo', 1)
+    """
+    parts = path.split('/', strip)
+    return parts[strip] if len(parts) > strip else None
+
+
+def patch_paths(patch):
+    """
+    The paths a patch touches, as far as can be told from the diff headers
+
+    @param patch: the patch
+    @type patch: L{Patch}
+    @rtype: C{set} of C{str}
+    """
+    strip = 1 if patch.strip is None else patch.strip
+    paths = set()
+    with patch.open() as stream:
+        for line in stream:
+            if line.startswith('--- ') or line.startswith('+++ '):
+                path = line[4:].rstrip('\r\n').split('\t')[0].strip()
+                if path != '/dev/null':
+                    paths.add(_strip_path(path, strip))
+            elif line.startswith('diff --git '):
+                for path in line[11:].split():
+                    paths.add(_strip_path(path, 1))
+            elif re.match('(rename|copy) (from|to) ', line):
+                paths.add(line.split(' ', 2)[2].rstrip('\r\n'))
+    paths.discard(None)
+    return paths
+
+
+def _independent_groups(series):
+    """
+    Split a series into groups of patches that touch disjoint sets of
+    files, keeping the order of the patches within a group
+    """
+    order = dict([(id(patch), num) for num, patch in enumerate(series)])
+    groups = []
+    for patch in series:
+        paths = patch_paths(patch)
+        touching = [group for group in groups if group[1] & paths]
+        merged = [[], paths]
+        for group in touching:
+            merged[0].extend(group[0])
+            merged[1] |= group[1]
+            groups.remove(group)
+        merged[0].sort(key=lambda patch: order[id(patch)])
+        merged[0].append(patch)
+        groups.append(merged)
+    return [group[0] for group in groups]
+
+
+def _check_group(repo, group, treeish, three_way, tmpdir):
+    """
+    Apply a group of patches to a temporary index
+
+    @return: the patches that don't apply, with the errors, and the patches
+        that only apply with a three-way merge
+    @rtype: C{tuple} of (C{list} of C{tuple}, C{list})
+    """
+    index_file = os.path.join(tmpdir, 'index')
+    repo.read_tree(treeish, index_file)
+    failed = []
+    merged = []
+    for patch in group:
+        try:
+            with patch.open() as stream:
+                repo.apply_patch(stream, strip=patch.strip, cached=True,
+                                 index_file=index_file)
+            continue
+        except GitRepositoryError as err:
+            error = err
+        if three_way:
+            # A failed three-way merge leaves conflicts in the index
+            shutil.copy(index_file, index_file + '.orig')
+            try:
+                with patch.open() as stream:
+                    repo.apply_patch(stream, strip=patch.strip, cached=True,
+                                     index_file=index_file, three_way=True)
+                merged.append(patch)
+                continue
+            except GitRepositoryError:
+                shutil.copy(index_file + '.orig', index_file)
+        failed.append((patch, error))
+    return failed, merged
+
+
+def check_series(repo, series, treeish, three_way=False, jobs=None):
+    """
+    Check if a series of patches applies on top of a tree, without touching
+    the working copy, the index or any refs. Patches touching different
+    files are checked concurrently, in separate temporary indexes.
+
+    @param series: the patches to check
+    @type series: L{PatchSeries}
+    @param treeish: the tree to apply the patches to
+    @type treeish: C{str}
+    @param three_way: try a three-way merge for patches that don't apply
+        cleanly
+    @type three_way: C{bool}
+    @param jobs: number of concurrent checks, the number of CPUs by default
+    @type jobs: C{int}
+    @return: all the patches that don't apply, with the errors, and the
+        patches that only apply with a three-way merge, in series order
+    @rtype: C{tuple} of (C{list} of C{tuple}, C{list})
+    """
+    def check(num):
+        group_dir = os.path.join(tmpdir, str(num))
+        os.mkdir(group_dir)
+        return _check_group(repo, groups[num], treeish, three_way, group_dir)
+
+    groups = _independent_groups(series)
+    tmpdir = tempfile.mkdtemp(prefix='check_')
+    pool = ThreadPool(jobs or multiprocessing.cpu_count())
+    try:
+        results = pool.map(check, range(len(groups)))
+    finally:
+        pool.close()
+        pool.join()
+        shutil.rmtree(tmpdir, ignore_errors=True)
+    order = dict([(id(patch), num) for num, patch in enumerate(series)])
+    failed = sum([result[0] for result in results], [])
+    merged = sum([result[1] for result in results], [])
+    failed.sort(key=lambda item: order[id(item[0])])
+    merged.sort(key=lambda patch: order[id(patch)])
+    return failed, merged
+
+
+def _parse_commit(raw):
+    """
+    Parents, author and message of a raw commit object
+
+    >>> parents, author, msg = _parse_commit(
+    ...     "tree 1234\\nparent abcd\\n"
+    ...     "author A U Thor <a@example.com> 1234567890 +0100\\n"
+    ...     "committer C <c@example.com> 1234567890 +0100\\n\\n"
+    ...     "Subject\\n\\nGbp-Pq: Name foo.patch\\n")
+    >>> parents
+    ['abcd']
+    >>> author
+    ('A U Thor', 'a@example.com', '1234567890 +0100')
+    >>> msg
+    'Subject\\n\\nGbp-Pq: Name foo.patch\\n'
+    """
+    header, _sep, msg = raw.partition('\n\n')
+    parents = []
+    author = None
+    for line in header.split('\n'):
+        key, _sep, value = line.partition(' ')
+        if key == 'parent':
+            parents.append(value)
+        elif key == 'author':
+            match = re.match(r'(.*) <(.*)> (\S+ \S+)$', value)
+            if match:
+                author = match.groups()
+    return parents, author, msg
+
+
+def replay_commits(repo, commits, onto):
+    """
+    Replay commits on top of another commit, like git rebase does, but in a
+    temporary index without touching the working copy or any refs. The
+    changes of each commit are applied with a three-way merge fallback and
+    the commits are re-created with their original author and message.
+    Commits whose changes are already in I{onto} are dropped.
+
+    @param commits: the commits to replay, oldest first
+    @type commits: C{list} of C{str}
+    @param onto: the commit to replay the commits onto
+    @type onto: C{str}
+    @return: the new tip and the commits that were not replayed because
+        the first of them conflicts
+    @rtype: C{tuple} of (C{str}, C{list} of C{str})
+    """
+    index_file = os.path.join(tempfile.mkdtemp(prefix='replay_'), 'index')
+    repo.read_tree(onto, index_file)
+    tip = onto
+    tip_tree = repo.rev_parse('%s^{tree}' % onto)
+    raw_commits = [raw for _type, raw in repo.iter_objects(commits)]
+    for num, commit in enumerate(commits):
+        parents, author, msg = _parse_commit(raw_commits[num])
+        diff = repo.diff(parents[0], commit, ignore_submodules=False,
+                         binary=True)
+        if diff:
+            try:
+                repo.apply_patch(BytesIO(diff), cached=True,
+                                 index_file=index_file, three_way=True)
+            except GitRepositoryError:
+                return tip, commits[num:]
+        tree = repo.write_tree(index_file)
+        if tree == tip_tree:
+            gbp.log.info("Dropping %s, its changes are already upstream" %
+                         commit)
+            continue
+        author = GitModifier(*author) if author else {}
+        tip = repo.commit_tree(tree, msg, [tip], author=author)
+        tip_tree = tree
+    return tip, []
+
+
 def drop_pq(repo, branch, options, name_keys=None):
     if is_pq_branch(branch, options):
         gbp.log.err("On a patch-queue branch, can't drop it.")
@@ -0,0 +1,85 @@
+# vim: set fileencoding=utf-8 :
+#
+# (C) 2026 agent <agent@local>
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, please see
+#    <http://www.gnu.org/licenses/>
+"""Serve gbp commands from a long-running process"""
+
+from six.moves import configparser
+import os
+import socket
+import sys
+
+import gbp.log
+from gbp.config import GbpOptionParser
+from gbp.daemon import GbpDaemon, SOCKET_ENV
+from gbp.errors import GbpError
+
+
+def build_parser(name):
+    """Construct command line parser"""
+    try:
+        parser = GbpOptionParser(command=os.path.basename(name), prefix='',
+                                 usage='%prog [options] - serve gbp commands '
+                                       'over a Unix socket')
+    except configparser.ParsingError as err:
+        gbp.log.err(err)
+        return None
+
+    parser.add_option("--socket", dest="socket", metavar="PATH",
+                      default=os.getenv(SOCKET_ENV),
+                      help="Unix socket to listen on, default is the value "
+                           "of the %s environment variable" % SOCKET_ENV)
+    parser.add_option("-v", "--verbose", action="store_true", dest="verbose",
+                      default=False, help="verbose command execution")
+    parser.add_config_file_option(option_name="color", dest="color",
+                                  type='tristate')
+    parser.add_config_file_option(option_name="color-scheme",
+                                  dest="color_scheme")
+    return parser
+
+
+def parse_args(argv):
+    """Parse command line arguments"""
+    parser = build_parser(argv[0])
+    if not parser:
+        return None, None
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    """Entry point for gbp-daemon"""
+    gbp.log.initialize()
+
+    (options, args) = parse_args(argv)
+    if not options:
+        return 1
+
+    gbp.log.setup(options.color, options.verbose, options.color_scheme)
+
+    if not options.socket:
+        gbp.log.err("No socket given, use --socket or set %s" % SOCKET_ENV)
+        return 1
+
+    try:
+        GbpDaemon(options.socket).serve()
+    except (GbpError, socket.error) as err:
+        gbp.log.err(err)
+        return 1
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -38,8 +38,9 @@ from gbp.config import (GbpOptionParserRpm, GbpOptionGroup,
                        no_upstream_branch_msg)
 from gbp.errors import GbpError
 import gbp.log
+import gbp.profile
 from gbp.scripts.pq_rpm import safe_patches, rm_patch_files, get_packager
-from gbp.scripts.common.pq import apply_and_commit_patch
+from gbp.scripts.common.pq import apply_and_commit_series
 from gbp.pkg import parse_archive_filename
 
 no_packaging_branch_msg = """
@@ -132,19 +133,16 @@ def import_spec_patches(repo, spec):
         return
 
     gbp.log.info("Importing patches to '%s' branch" % repo.get_branch())
-    orig_head = repo.rev_parse("HEAD")
     packager = get_packager(spec)
 
     # Put patches in a safe place
     queue = safe_patches(queue)
-    for patch in queue:
-        gbp.log.debug("Applying %s" % patch.path)
-        try:
-            apply_and_commit_patch(repo, patch, packager)
-        except (GbpError, GitRepositoryError):
-            repo.force_head(orig_head, hard=True)
-            raise PatchImportError("Patch(es) didn't apply, you need apply "
-                                   "and commit manually")
+    try:
+        apply_and_commit_series(repo, queue, packager)
+    except (GbpError, GitRepositoryError) as err:
+        gbp.log.err(err)
+        raise PatchImportError("Patch(es) didn't apply, you need apply "
+                               "and commit manually")
 
     # Remove patches from spec and packaging directory
     gbp.log.info("Removing imported patch files from spec and packaging dir")
@@ -196,6 +194,10 @@ def build_parser(name):
     parser.add_config_file_option(option_name="color-scheme",
                                   dest="color_scheme")
     parser.add_config_file_option(option_name="tmp-dir", dest="tmp_dir")
+    parser.add_config_file_option(option_name="profile", dest="profile",
+                      type="path")
+    parser.add_config_file_option(option_name="trace", dest="trace",
+                      type="path")
     parser.add_config_file_option(option_name="vendor", action="store",
                     dest="vendor")
     parser.add_option("--download", action="store_true", dest="download",
@@ -271,6 +273,10 @@ def main(argv):
     if len(args) != 1:
         gbp.log.err("Need to give exactly one package to import. Try --help.")
         return 1
+    if options.profile:
+        gbp.profile.enable()
+    if options.trace:
+        gbp.profile.enable_trace()
     try:
         dirs['tmp_base'] = init_tmpdir(options.tmp_dir, 'import-srpm_')
     except GbpError as err:
@@ -279,7 +285,8 @@ def main(argv):
     try:
         srpm = args[0]
         if options.download:
-            srpm = download_source(srpm)
+            with gbp.profile.phase('download'):
+                srpm = download_source(srpm)
 
         # Real srpm, we need to unpack, first
         true_srcrpm = False
@@ -288,7 +295,8 @@ def main(argv):
             true_srcrpm = True
             dirs['pkgextract'] = tempfile.mkdtemp(prefix='pkgextract_')
             gbp.log.info("Extracting src rpm to '%s'" % dirs['pkgextract'])
-            src.unpack(dirs['pkgextract'])
+            with gbp.profile.phase('unpack'):
+                src.unpack(dirs['pkgextract'])
             preferred_spec = src.name + '.spec'
             srpm = dirs['pkgextract']
         elif os.path.isdir(srpm):
@@ -364,7 +372,8 @@ def main(argv):
         if spec.orig_src:
             orig_tarball = os.path.join(dirs['src'], spec.orig_src['filename'])
             sources = RpmUpstreamSource(orig_tarball)
-            sources = sources.unpack(dirs['origsrc'], options.filters)
+            with gbp.profile.phase('unpack-orig'):
+                sources = sources.unpack(dirs['origsrc'], options.filters)
         else:
             sources = None
 
@@ -430,7 +439,8 @@ def main(argv):
                     parents = [repo.rev_parse("%s^{}" % options.vcs_tag)]
                 else:
                     parents = None
-                src_commit = repo.commit_dir(sources.unpacked,
+                with gbp.profile.phase('import-upstream'):
+                    src_commit = repo.commit_dir(sources.unpacked,
                         "Imported %s" % msg,
                         branch,
                         other_parents=parents,
@@ -448,7 +458,8 @@ def main(argv):
                     if options.pristine_tar:
                         archive_fmt = parse_archive_filename(orig_tarball)[1]
                         if archive_fmt == 'tar':
-                            repo.pristine_tar.commit(orig_tarball,
+                            with gbp.profile.phase('pristine-tar'):
+                                repo.pristine_tar.commit(orig_tarball,
                                                     'refs/heads/%s' %
                                                      options.upstream_branch)
                         else:
@@ -475,7 +486,8 @@ def main(argv):
                                      packaging_tag_str_fields['version'])
 
             if options.orphan_packaging or not sources:
-                commit = repo.commit_dir(dirs['packaging_base'],
+                with gbp.profile.phase('import-packaging'):
+                    commit = repo.commit_dir(dirs['packaging_base'],
                         "Imported %s" % msg,
                         branch,
                         author=author,
@@ -493,7 +505,8 @@ def main(argv):
                 for fname in os.listdir(dirs['packaging']):
                     shutil.copy2(os.path.join(dirs['packaging'], fname),
                                  pkgsubdir)
-                commit = repo.commit_dir(sources.unpacked,
+                with gbp.profile.phase('import-packaging'):
+                    commit = repo.commit_dir(sources.unpacked,
                         "Imported %s" % msg,
                         branch,
                         other_parents=[src_commit],
@@ -506,7 +519,8 @@ def main(argv):
                 if options.patch_import:
                     spec = SpecFile(os.path.join(repo.path,
                                         options.packaging_dir, spec.specfile))
-                    import_spec_patches(repo, spec)
+                    with gbp.profile.phase('patch-import'):
+                        import_spec_patches(repo, spec)
                     commit = options.packaging_branch
 
             # Create packaging tag
@@ -548,6 +562,10 @@ def main(argv):
     if not ret and not skipped:
         gbp.log.info("Version '%s' imported under '%s'" %
                      (packaging_tag_str_fields['version'], spec.name))
+    if options.profile:
+        gbp.profile.report(options.profile)
+    if options.trace:
+        gbp.profile.write_trace(options.trace)
     return ret
 
 if __name__ == '__main__':
@@ -21,14 +21,25 @@
 from six.moves import configparser
 import bz2
 import errno
-import gzip
+import filecmp
 import os
 import re
 import shutil
 import subprocess
 import sys
+import threading
+import zlib
+from six.moves.queue import Queue, Full
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
 
 import gbp.log
+import gbp.profile
 from gbp.tmpfile import init_tmpdir, del_tmpdir, tempfile
 from gbp.config import GbpOptionParserRpm, optparse_split_cb
 from gbp.rpm.git import GitRepositoryError, RpmGitRepository
@@ -41,7 +52,8 @@ from gbp.rpm import (SpecFile, NoSpecError, guess_spec, guess_spec_repo,
                      spec_from_repo, string_to_int)
 from gbp.scripts.common.pq import (is_pq_branch, pq_branch_name, pq_branch_base,
             parse_gbp_commands, format_patch, format_diff,
-            apply_and_commit_patch, drop_pq)
+            apply_and_commit_patch, apply_and_commit_series, check_series,
+            commit_patch_in_index, drop_pq, replay_commits)
 from gbp.scripts.common.buildpackage import dump_tree
 
 
@@ -123,7 +135,7 @@ def generate_patches(repo, start, squash, end, outdir, options):
             squash[0] = end_commit
         squash_sha1 = repo.rev_parse("%s^0" % squash[0])
         if start_sha1 != squash_sha1:
-            if not squash_sha1 in repo.get_commits(start, end_commit):
+            if not squash_sha1 in repo.iter_commits(start, end_commit):
                 raise GbpError("Given squash point '%s' not in the history "
                                "of end commit '%s'" % (squash[0], end_commit))
             # Shorten SHA1s
@@ -222,9 +234,43 @@ def rm_patch_files(spec):
                 gbp.log.debug("Patch %s does not exist." % patch.path)
 
 
+def sync_patch_files(spec, gendir, patches):
+    """
+    Move newly generated patches from I{gendir} to the spec dir. Patch files
+    whose content did not change are left untouched, keeping their mtime, and
+    patches no longer in the series are deleted. Doesn't delete patches marked
+    as not maintained by gbp.
+
+    @return: names of the patch files that were added or rewritten
+    @rtype: C{list} of C{str}
+    """
+    updated = []
+    for patch in spec.patchseries(unapplied=True):
+        if os.path.basename(patch.path) not in patches:
+            gbp.log.debug("Removing '%s'" % patch.path)
+            try:
+                os.unlink(patch.path)
+            except OSError as err:
+                if err.errno != errno.ENOENT:
+                    raise GbpError("Failed to remove patch: %s" % err)
+    for name in patches:
+        src = os.path.join(gendir, name)
+        dst = os.path.join(spec.specdir, name)
+        if os.path.isfile(dst) and filecmp.cmp(src, dst, shallow=False):
+            gbp.log.debug("Patch '%s' is unchanged" % name)
+            continue
+        try:
+            os.rename(src, dst)
+        except OSError as err:
+            raise GbpError("Failed to write patch: %s" % err)
+        updated.append(name)
+    return updated
+
+
 def update_patch_series(repo, spec, start, end, options):
     """
     Export patches to packaging directory and update spec file accordingly.
+    Only the patch files and the spec file that actually change are written.
     """
     squash = options.patch_squash.split(':', 1)
     if len(squash) == 1:
@@ -232,13 +278,20 @@ def update_patch_series(repo, spec, start, end, options):
     else:
         squash[1] += '.diff'
 
-    # Unlink old patch files and generate new patches
-    rm_patch_files(spec)
+    # Generate new patches next to the old ones and replace the changed ones
+    gendir = tempfile.mkdtemp(dir=spec.specdir, prefix='.gbp-patches-')
+    try:
+        patches, commands = generate_patches(repo, start, squash, end, gendir,
+                                             options)
+        updated = sync_patch_files(spec, gendir, patches)
+    finally:
+        shutil.rmtree(gendir)
+    gbp.log.debug("%d of %d patches updated" % (len(updated), len(patches)))
 
-    patches, commands = generate_patches(repo, start, squash, end,
-                                         spec.specdir, options)
-    spec.update_patches(patches, commands)
-    spec.write_spec_file()
+    if spec.update_patches(patches, commands):
+        spec.write_spec_file()
+    else:
+        gbp.log.debug("Patch series unchanged, not rewriting the spec file")
     return patches
 
 
@@ -300,7 +353,9 @@ def export_patches(repo, options):
     if not repo.has_treeish(export_treeish):
         raise GbpError('Invalid treeish object %s' % export_treeish)
 
-    update_patch_series(repo, spec, upstream_commit, export_treeish, options)
+    with gbp.profile.phase('patch-export'):
+        update_patch_series(repo, spec, upstream_commit, export_treeish,
+                            options)
 
     GitCommand('status')(['--', spec.specdir])
 
@@ -308,43 +363,221 @@ def export_patches(repo, options):
         drop_pq(repo, base, options)
 
 
+class PatchReader(object):
+    """
+    File object decompressing a patch in a background thread, so that
+    decompression runs in parallel with whatever consumes the patch
+    """
+    chunk_size = 65536
+    max_chunks = 64
+
+    def __init__(self, fobj, comp, on_close=None):
+        """
+        @param fobj: the (compressed) patch, read from the current position
+        @type fobj: C{file}
+        @param comp: compression of the patch, C{None} for no compression
+        @type comp: C{str}
+        @param on_close: function to call when the reader has been closed
+            and is done with I{fobj}
+        @type on_close: C{callable}
+        """
+        self._queue = Queue(self.max_chunks)
+        self._buf = ''
+        self._eof = False
+        self._closed = threading.Event()
+        self._on_close = on_close
+        self._proc = None
+        self._thread = threading.Thread(target=self._run, args=(fobj, comp))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _raw_chunks(self, fobj):
+        return iter(lambda: fobj.read(self.chunk_size), b'')
+
+    def _chunks(self, fobj, comp):
+        """Decompressed contents of the patch"""
+        if comp is None:
+            for chunk in self._raw_chunks(fobj):
+                yield chunk
+            return
+        if comp in ('xz', 'lzma') and lzma is None:
+            # No lzma module in this Python, use xz which handles both
+            self._proc = subprocess.Popen(['xz', '-dc'], stdin=fobj,
+                                          stdout=subprocess.PIPE)
+            for chunk in self._raw_chunks(self._proc.stdout):
+                yield chunk
+            if self._proc.wait():
+                raise GbpError("xz failed")
+            return
+        while True:
+            if comp == 'gzip':
+                decomp = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            elif comp == 'bzip2':
+                decomp = bz2.BZ2Decompressor()
+            elif comp in ('xz', 'lzma'):
+                decomp = lzma.LZMADecompressor()
+            else:
+                raise GbpError("Unsupported patch compression '%s', giving up"
+                               % comp)
+            for chunk in self._raw_chunks(fobj):
+                try:
+                    data = decomp.decompress(chunk)
+                except EOFError:
+                    unused = chunk
+                    break
+                yield data
+                if decomp.unused_data:
+                    unused = decomp.unused_data
+                    break
+            else:
+                return
+            # Concatenated streams are decompressed one after another
+            fobj.seek(-len(unused), os.SEEK_CUR)
+
+    def _put(self, item):
+        """Queue data for the reader, False if the reader is gone"""
+        while not self._closed.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                pass
+        return False
+
+    def _run(self, fobj, comp):
+        try:
+            for chunk in self._chunks(fobj, comp):
+                if chunk and not self._put(chunk):
+                    return
+            self._put(None)
+        except Exception as err:
+            self._put(err)
+
+    def _fill(self, size):
+        """Buffer at least size bytes, or everything if size is negative"""
+        while not self._eof and (size < 0 or len(self._buf) < size):
+            item = self._queue.get()
+            if item is None:
+                self._eof = True
+            elif isinstance(item, Exception):
+                self._eof = True
+                if isinstance(item, (IOError, EOFError, zlib.error)):
+                    raise GbpError("Failed to decompress patch: %s" % item)
+                raise item
+            else:
+                self._buf += item
+
+    def read(self, size=-1):
+        """Read at most size bytes"""
+        self._fill(size)
+        if size < 0:
+            size = len(self._buf)
+        data, self._buf = self._buf[:size], self._buf[size:]
+        return data
+
+    def readline(self):
+        """Read one line"""
+        while '\n' not in self._buf and not self._eof:
+            self._fill(len(self._buf) + 1)
+        end = self._buf.find('\n') + 1 or len(self._buf)
+        line, self._buf = self._buf[:end], self._buf[end:]
+        return line
+
+    def __iter__(self):
+        return iter(self.readline, '')
+
+    def close(self):
+        """Stop decompressing and wait for the thread to finish"""
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        if self._proc and self._proc.poll() is None:
+            self._proc.kill()
+        self._thread.join()
+        if self._proc:
+            self._proc.stdout.close()
+            self._proc.wait()
+        if self._on_close:
+            self._on_close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_args):
+        self.close()
+
+
+class SafePatch(Patch):
+    """
+    A patch of the packaging that can be read even after the packaging
+    directory has gone from the working copy: the raw patch file is copied
+    to a temporary directory and decompressed on the fly when read. The copy
+    is only kept open while the patch is being read.
+
+    @ivar name: file name of the uncompressed patch
+    @type name: C{str}
+    """
+    def __init__(self, patch, safedir):
+        base, _archive_fmt, self.comp = parse_archive_filename(patch.path)
+        if self.comp:
+            self.name = os.path.basename(base)
+        else:
+            self.name = os.path.basename(patch.path)
+        path = os.path.join(safedir, self.name)
+        shutil.copyfile(patch.path, path)
+        super(SafePatch, self).__init__(path, patch.topic, patch.strip)
+        self.next = None
+        self._reader = None
+        self._lock = threading.Lock()
+        self._read_info()
+
+    def _new_reader(self):
+        fobj = open(self.path, 'rb')
+        return PatchReader(fobj, self.comp, fobj.close)
+
+    def prefetch(self):
+        """Start decompressing the patch in the background"""
+        with self._lock:
+            if self._reader is None:
+                self._reader = self._new_reader()
+
+    def open(self):
+        """
+        Open the (decompressed) patch for reading, and start decompressing
+        the next patch of the series
+        """
+        with self._lock:
+            reader, self._reader = self._reader, None
+        if reader is None:
+            reader = self._new_reader()
+        if self.next:
+            self.next.prefetch()
+        return reader
+
+
 def safe_patches(queue):
     """
-    Safe the current patches in a temporary directory
+    Safe the current patches so that they can be applied after switching
+    branches. The patches are copied to a temporary directory as they are,
+    and they are decompressed while applying.
 
     @param queue: an existing patch queue
-    @return: safed queue (with patches in tmpdir)
-    @rtype: tuple
+    @return: safed queue
+    @rtype: L{PatchSeries}
     """
-
-    tmpdir = tempfile.mkdtemp(prefix='patchimport_')
+    safedir = tempfile.mkdtemp(prefix='patchimport_')
     safequeue = PatchSeries()
-
-    if len(queue) > 0:
-        gbp.log.debug("Safeing patches '%s' in '%s'" %
-                        (os.path.dirname(queue[0].path), tmpdir))
     for patch in queue:
-        base, _archive_fmt, comp = parse_archive_filename(patch.path)
-        uncompressors = {'gzip': gzip.open, 'bzip2': bz2.BZ2File}
-        if comp in uncompressors:
-            gbp.log.debug("Uncompressing '%s'" % os.path.basename(patch.path))
-            src = uncompressors[comp](patch.path, 'r')
-            dst_name = os.path.join(tmpdir, os.path.basename(base))
-        elif comp:
+        _base, _archive_fmt, comp = parse_archive_filename(patch.path)
+        if comp and comp not in ('gzip', 'bzip2', 'xz', 'lzma'):
             raise GbpError("Unsupported patch compression '%s', giving up"
                            % comp)
-        else:
-            src = open(patch.path, 'r')
-            dst_name = os.path.join(tmpdir, os.path.basename(patch.path))
-
-        dst = open(dst_name, 'w')
-        dst.writelines(src)
-        src.close()
-        dst.close()
-
-        safequeue.append(patch)
-        safequeue[-1].path = dst_name
-
+        patchdir = os.path.join(safedir, '%04d' % len(safequeue))
+        os.mkdir(patchdir)
+        safe = SafePatch(patch, patchdir)
+        if safequeue:
+            safequeue[-1].next = safe
+        safequeue.append(safe)
     return safequeue
 
 
@@ -380,6 +613,82 @@ def import_extra_files(repo, commitish, files, patch_ignore=True):
     return added
 
 
+def import_extra_files_in_index(repo, commitish, files, parent, index_file):
+    """
+    Commit branch-specific gbp.conf files on top of I{parent} in a
+    (temporary) index, the counterpart of L{import_extra_files}
+
+    @return: the new commit or I{parent} if there was nothing to import
+    @rtype: C{str}
+    """
+    paths = [path for path in files if path]
+    if not paths:
+        return parent
+    existing = [entry[3] for entry in repo.list_tree(parent, True, paths)]
+    entries = [entry for entry in repo.list_tree(commitish, True, paths)
+               if entry[3] not in existing]
+    if not entries:
+        return parent
+    added = [entry[3] for entry in entries]
+    gbp.log.info("Importing additional file(s) from branch '%s'" % commitish)
+    gbp.log.debug('Adding/commiting %s' % added)
+    repo.update_index(entries, index_file)
+    commit_msg = ("Auto-import file(s) from branch '%s':\n    %s\n" %
+                  (commitish, '    '.join(added)))
+    commit_msg += "\nGbp: Ignore"
+    return repo.commit_tree(repo.write_tree(index_file), commit_msg, [parent])
+
+
+def import_patches_in_index(repo, base, upstream_commit, queue, packager,
+                            options):
+    """
+    Create the patch-queue commits without touching the working copy: the
+    patches are applied to a temporary index and the commits are chained on
+    top of each other in memory
+
+    @return: the tip of the new patch-queue
+    @rtype: C{str}
+    """
+    index_file = os.path.join(tempfile.mkdtemp(prefix='index_'), 'index')
+    repo.read_tree(upstream_commit, index_file)
+    commit = import_extra_files_in_index(repo, base, options.import_files,
+                                         upstream_commit, index_file)
+    for patch in queue:
+        gbp.log.debug("Applying %s" % patch.path)
+        commit = commit_patch_in_index(repo, patch, commit, index_file,
+                                       packager, None, patch.name,
+                                       options.three_way)
+    return commit
+
+
+def check_patches(repo, queue, upstream_commit, options):
+    """
+    Check that all patches apply before importing any, and report all the
+    ones that don't
+    """
+    gbp.log.info("Checking that the patches apply onto '%s'" % upstream_commit)
+    failed, merged = check_series(repo, queue, upstream_commit,
+                                  options.three_way)
+    for patch in merged:
+        gbp.log.info("%s applies with a three-way merge" % patch.name)
+    for patch, err in failed:
+        gbp.log.err("%s does not apply: %s" % (patch.name, err))
+    if failed:
+        raise GbpError("%d of %d patches do not apply" % (len(failed),
+                                                          len(queue)))
+
+
+def _dump_patches(repo, options, spec, spec_treeish):
+    """Put patches in a safe place"""
+    if spec_treeish:
+        packaging_tmp = tempfile.mkdtemp(prefix='dump_')
+        packaging_tree = '%s:%s' % (spec_treeish, options.packaging_dir)
+        dump_tree(repo, packaging_tmp, packaging_tree, with_submodules=False,
+                  recursive=False)
+        spec.specdir = packaging_tmp
+    return safe_patches(spec.patchseries())
+
+
 def import_spec_patches(repo, options):
     """
     apply a series of patches in a spec/packaging dir to branch
@@ -411,6 +720,15 @@ def import_spec_patches(repo, options):
     if repo.has_branch(pq_branch) and not options.force:
         raise GbpError("Patch-queue branch '%s' already exists. "
                        "Try 'switch' instead." % pq_branch)
+    with gbp.profile.phase('dump'):
+        queue = _dump_patches(repo, options, spec, spec_treeish)
+    if options.check_patches:
+        with gbp.profile.phase('check'):
+            check_patches(repo, queue, upstream_commit, options)
+    if options.import_in_index:
+        return import_spec_patches_in_index(repo, options, spec, queue, base,
+                                            upstream_commit, packager,
+                                            pq_branch)
     try:
         if repo.get_branch() == pq_branch:
             repo.force_head(upstream_commit, hard=True)
@@ -420,15 +738,6 @@ def import_spec_patches(repo, options):
         raise GbpError("Cannot create patch-queue branch '%s': %s" %
                         (pq_branch, err))
 
-    # Put patches in a safe place
-    if spec_treeish:
-        packaging_tmp = tempfile.mkdtemp(prefix='dump_')
-        packaging_tree = '%s:%s' % (spec_treeish, options.packaging_dir)
-        dump_tree(repo, packaging_tmp, packaging_tree, with_submodules=False,
-                  recursive=False)
-        spec.specdir = packaging_tmp
-    in_queue = spec.patchseries()
-    queue = safe_patches(in_queue)
     # Do import
     try:
         gbp.log.info("Switching to branch '%s'" % pq_branch)
@@ -439,10 +748,10 @@ def import_spec_patches(repo, options):
             return
         gbp.log.info("Trying to apply patches from branch '%s' onto '%s'" %
                         (base, upstream_commit))
-        for patch in queue:
-            gbp.log.debug("Applying %s" % patch.path)
-            name = os.path.basename(patch.path)
-            apply_and_commit_patch(repo, patch, packager, None, name)
+        with gbp.profile.phase('apply'):
+            apply_and_commit_series(repo, queue, packager,
+                                    names=[patch.name for patch in queue],
+                                    three_way=options.three_way)
     except (GbpError, GitRepositoryError) as err:
         repo.set_branch(base)
         repo.delete_branch(pq_branch)
@@ -452,6 +761,38 @@ def import_spec_patches(repo, options):
                                                               pq_branch))
 
 
+def import_spec_patches_in_index(repo, options, spec, queue, base,
+                                 upstream_commit, packager, pq_branch):
+    """
+    Import the patches without touching the working copy until the whole
+    patch-queue has been created, it is then checked out once. Nothing is
+    changed if the import fails.
+    """
+    try:
+        gbp.log.info("Trying to apply patches from branch '%s' onto '%s'" %
+                        (base, upstream_commit))
+        with gbp.profile.phase('apply'):
+            commit = import_patches_in_index(repo, base, upstream_commit,
+                                             queue, packager, options)
+    except (GbpError, GitRepositoryError) as err:
+        raise GbpError('Import failed: %s' % err)
+
+    gbp.log.info("Switching to branch '%s'" % pq_branch)
+    try:
+        if repo.get_branch() == pq_branch:
+            repo.force_head(commit, hard=True)
+        else:
+            repo.create_branch(pq_branch, commit, force=True)
+            repo.set_branch(pq_branch)
+    except GitRepositoryError as err:
+        if repo.get_branch() != pq_branch and repo.has_branch(pq_branch):
+            repo.delete_branch(pq_branch)
+        raise GbpError('Import failed: %s' % err)
+
+    gbp.log.info("Patches listed in '%s' imported on '%s'" % (spec.specfile,
+                                                              pq_branch))
+
+
 def rebase_pq(repo, options):
     """Rebase pq branch on the correct upstream version (from spec file)."""
     current = repo.get_branch()
@@ -465,7 +806,28 @@ def rebase_pq(repo, options):
                                            options.upstream_tag)
 
     switch_to_pq_branch(repo, base, options)
-    GitCommand("rebase")([upstream_commit])
+    pq_branch = repo.get_branch()
+    if not repo.is_clean()[0]:
+        # Let git rebase complain about the local changes
+        GitCommand("rebase")([upstream_commit])
+        return
+    merge_base = repo.get_merge_base(upstream_commit, pq_branch)
+    if merge_base == repo.rev_parse(upstream_commit):
+        gbp.log.info("'%s' is already based on '%s'" % (pq_branch,
+                                                        upstream_commit))
+        return
+    commits = repo.get_commits(since=merge_base, until=pq_branch,
+                               options=['--no-merges'])[::-1]
+    tip, conflicting = replay_commits(repo, commits, upstream_commit)
+    if not conflicting:
+        repo.force_head(tip, hard=True)
+        gbp.log.info("Rebased '%s' onto '%s'" % (pq_branch, upstream_commit))
+        return
+    # Let the user resolve the conflicts like with a plain git rebase
+    gbp.log.info("%s does not apply cleanly, rebasing the remaining %d "
+                 "commit(s) in the working copy" % (conflicting[0],
+                                                    len(conflicting)))
+    GitCommand("rebase")(['--onto', tip, '%s^' % conflicting[0], pq_branch])
 
 
 def switch_pq(repo, options):
@@ -662,6 +1024,10 @@ switch         Switch to patch-queue branch and vice versa.""")
     parser.add_config_file_option(option_name="color-scheme",
             dest="color_scheme")
     parser.add_config_file_option(option_name="tmp-dir", dest="tmp_dir")
+    parser.add_config_file_option(option_name="profile", dest="profile",
+            type="path")
+    parser.add_config_file_option(option_name="trace", dest="trace",
+            type="path")
     parser.add_config_file_option(option_name="upstream-tag",
             dest="upstream_tag")
     parser.add_config_file_option(option_name="spec-file", dest="spec_file")
@@ -675,6 +1041,12 @@ switch         Switch to patch-queue branch and vice versa.""")
     parser.add_config_file_option(option_name="import-files",
             dest="import_files", type="string", action="callback",
             callback=optparse_split_cb)
+    parser.add_boolean_config_file_option(option_name="import-in-index",
+            dest="import_in_index")
+    parser.add_boolean_config_file_option(option_name="check-patches",
+            dest="check_patches")
+    parser.add_boolean_config_file_option(option_name="3way",
+            dest="three_way")
     parser.add_config_file_option("patch-compress",
                                   dest="patch_compress")
     parser.add_config_file_option("patch-squash", dest="patch_squash")
@@ -744,23 +1116,29 @@ def main(argv):
         gbp.log.warn("Switching to topdir before running commands")
         os.chdir(repo.path)
 
+    if options.profile:
+        gbp.profile.enable()
+    if options.trace:
+        gbp.profile.enable_trace()
+
     try:
         # Create base temporary directory for this run
         init_tmpdir(options.tmp_dir, prefix='pq-rpm_')
-        if action == "export":
-            export_patches(repo, options)
-        elif action == "import":
-            import_spec_patches(repo, options)
-        elif action == "drop":
-            drop_pq_rpm(repo, options)
-        elif action == "rebase":
-            rebase_pq(repo, options)
-        elif action == "apply":
-            apply_single_patch(repo, patchfile, options)
-        elif action == "switch":
-            switch_pq(repo, options)
-        elif action == "convert":
-            convert_package(repo, options)
+        with gbp.profile.phase(action):
+            if action == "export":
+                export_patches(repo, options)
+            elif action == "import":
+                import_spec_patches(repo, options)
+            elif action == "drop":
+                drop_pq_rpm(repo, options)
+            elif action == "rebase":
+                rebase_pq(repo, options)
+            elif action == "apply":
+                apply_single_patch(repo, patchfile, options)
+            elif action == "switch":
+                switch_pq(repo, options)
+            elif action == "convert":
+                convert_package(repo, options)
     except CommandExecFailed:
         retval = 1
     except GitRepositoryError as err:
@@ -773,6 +1151,11 @@ def main(argv):
     finally:
         del_tmpdir()
 
+    if options.profile:
+        gbp.profile.report(options.profile)
+    if options.trace:
+        gbp.profile.write_trace(options.trace)
+
     return retval
 
 if __name__ == '__main__':
@@ -23,16 +23,18 @@ from datetime import datetime
 import os.path
 import pwd
 import re
+import shutil
 import sys
 import socket
 
 import gbp.command_wrappers as gbpc
 import gbp.log
+import gbp.profile
 from gbp.config import GbpOptionParserRpm, GbpOptionGroup
 from gbp.errors import GbpError
 from gbp.git.modifier import GitModifier
 from gbp.rpm import (guess_spec, NoSpecError, SpecFile, split_version_str,
-                     compose_version_str)
+                     compose_version_str, replace_file)
 from gbp.rpm.changelog import Changelog, ChangelogParser, ChangelogError
 from gbp.rpm.git import GitRepositoryError, RpmGitRepository
 from gbp.rpm.policy import RpmPkgPolicy
@@ -44,17 +46,62 @@ from gbp.tmpfile import init_tmpdir, del_tmpdir
 ChangelogEntryFormatter = RpmPkgPolicy.ChangelogEntryFormatter
 
 
+def splice_file(path, text, start=0, end=None):
+    """
+    Atomically replace a part of a file with new text. The rest of the file
+    is block copied from the old file. Symlinks are followed and hard links
+    kept, see L{gbp.rpm.replace_file}.
+
+    @param path: file to update, created if it doesn't exist
+    @type path: C{str}
+    @param text: the new text
+    @type text: C{str}
+    @param start: start offset of the replaced part
+    @type start: C{int}
+    @param end: end offset of the replaced part, C{None} replaces everything
+        up to the end of the file
+    @type end: C{int}
+    """
+    path = os.path.realpath(path)
+    tmp = path + '.tmp'
+    try:
+        with open(tmp, 'wb') as new:
+            if start or end is not None:
+                with open(path, 'rb') as old:
+                    remaining = start
+                    while remaining:
+                        block = old.read(min(remaining, 65536))
+                        if not block:
+                            break
+                        new.write(block)
+                        remaining -= len(block)
+                    new.write(text)
+                    if end is not None:
+                        old.seek(end)
+                        shutil.copyfileobj(old, new)
+            else:
+                new.write(text)
+        replace_file(tmp, path)
+    except (IOError, OSError) as err:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise GbpError("Failed to write %s: %s" % (path, err))
+
+
 class ChangelogFile(object):
     """Container for changelog file, whether it be a standalone changelog
        or a spec file"""
 
     def __init__(self, file_path):
         parser = ChangelogParser(RpmPkgPolicy)
+        # Offset of the changelog text in the file, if there is one
+        self._offset = None
 
         if os.path.splitext(file_path)[1] == '.spec':
             gbp.log.debug("Using spec file '%s' as changelog" % file_path)
             self._file = SpecFile(file_path)
             self.changelog = parser.raw_parse_string(self._file.get_changelog())
+            self._offset = self._file.get_changelog_offset()
         else:
             self._file = os.path.abspath(file_path)
             if not os.path.exists(file_path):
@@ -64,20 +111,41 @@ class ChangelogFile(object):
             else:
                 gbp.log.debug("Using changelog file '%s'" % file_path)
                 self.changelog = parser.raw_parse_file(self._file)
+                self._offset = 0
+        self._stat = self._file_stat()
 
-        # Parse topmost section and try to determine the start commit
+        # Parse topmost section to catch errors early, the other sections
+        # are only parsed if accessed
         if self.changelog.sections:
-            self.changelog.sections[0] = parser.parse_section(
-                    self.changelog.sections[0])
+            self.changelog.sections[0] # pylint: disable=W0104
+
+    def _file_stat(self):
+        """Size and mtime of the file, for detecting modifications"""
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return (stat.st_size, stat.st_mtime)
 
     def write(self):
-        """Write changelog file to disk"""
-        if isinstance(self._file, SpecFile):
+        """
+        Write changelog file to disk. Only the new and modified sections at
+        the top of the changelog are written out, the unchanged tail of the
+        file is copied as is.
+        """
+        head, tail = self.changelog.sections.split()
+        if (tail is not None and self._offset is not None and
+                self._stat and self._file_stat() == self._stat):
+            gbp.log.debug("Updating the changelog in %s" % self.path)
+            splice_file(self.path, head, self._offset, self._offset + tail)
+            # Offsets of the parsed text are shifted in the new file
+            self._offset += len(head) - tail
+        elif isinstance(self._file, SpecFile):
             self._file.set_changelog(str(self.changelog))
             self._file.write_spec_file()
         else:
-            with open(self._file, 'w') as fobj:
-                fobj.write(str(self.changelog))
+            splice_file(self._file, str(self.changelog))
+        self._stat = self._file_stat()
 
     @property
     def path(self):
@@ -182,8 +250,51 @@ def parse_changelog_file(repo, spec, options):
     return ChangelogFile(changelog_path)
 
 
-def guess_commit(section, repo, options):
-    """Guess the last commit documented in a changelog header"""
+class CommitIndex(object):
+    """
+    Lookup tables for finding the commits documented in changelog sections.
+    The commits of all tags are read with one ref listing and the commits
+    found by timestamp are cached. Can be shared by L{guess_commit} calls as
+    long as the repository doesn't change.
+    """
+
+    def __init__(self, repo):
+        self.repo = repo
+        self._tags = None
+        self._by_time = {}
+
+    def tag_commit(self, tag):
+        """Commit a tag points to, C{None} if the tag is not found"""
+        if self._tags is None:
+            self._tags = self.repo.get_tag_commits()
+        return self._tags.get(tag)
+
+    def version_commit(self, tag_format, str_fields):
+        """Commit of the packaging tag of a version"""
+        try:
+            tag = RpmGitRepository.version_to_tag(tag_format, str_fields)
+        except GbpError:
+            return None
+        return self.tag_commit(tag)
+
+    def commit_before(self, timestamp):
+        """Last commit before a timestamp"""
+        if timestamp not in self._by_time:
+            commits = self.repo.iter_commits(num=1,
+                                             options="--until='%s'" % timestamp)
+            self._by_time[timestamp] = next(commits, None)
+        return self._by_time[timestamp]
+
+
+def guess_commit(section, repo, options, index=None):
+    """
+    Guess the last commit documented in a changelog header
+
+    @param index: lookup tables to use, shared between calls. Without one
+        each lookup is done with a single git command, which is faster for
+        one-off guesses.
+    @type index: L{CommitIndex}
+    """
 
     if not section:
         return None
@@ -198,6 +309,10 @@ def guess_commit(section, repo, options):
     # First, try to find tag-name, if present
     if 'tagname' in fields:
         gbp.log.debug("Trying to find tagname %s" % fields['tagname'])
+        commit = index.tag_commit(fields['tagname']) if index else None
+        if commit:
+            return commit
+        # Not a tag but maybe some other revision, e.g. git-describe output
         try:
             return repo.rev_parse("%s^0" % fields['tagname'])
         except GitRepositoryError:
@@ -217,8 +332,10 @@ def guess_commit(section, repo, options):
         tag_str_fields['upstreamversion'] = fields['upstreamversion']
         if 'release' in fields:
             tag_str_fields['release'] = fields['release']
-    commit = repo.find_version(options.packaging_tag,
-                                   tag_str_fields)
+    if index:
+        commit = index.version_commit(options.packaging_tag, tag_str_fields)
+    else:
+        commit = repo.find_version(options.packaging_tag, tag_str_fields)
     if commit:
         return commit
     else:
@@ -227,12 +344,15 @@ def guess_commit(section, repo, options):
 
     # As a last resort we look at the timestamp
     timestamp = header['time'].isoformat()
-    last = repo.get_commits(num=1, options="--until='%s'" % timestamp)
+    if index:
+        last = index.commit_before(timestamp)
+    else:
+        commits = repo.get_commits(num=1, options="--until='%s'" % timestamp)
+        last = commits[0] if commits else None
     if last:
         gbp.log.info("Using commit (%s) before the last changelog timestamp "
                      "(%s)" % (last, timestamp))
-        return last[0]
-    return None
+    return last
 
 
 def get_start_commit(changelog, repo, options):
@@ -413,6 +533,10 @@ def build_parser(name):
     parser.add_config_file_option(option_name="color-scheme",
                     dest="color_scheme")
     parser.add_config_file_option(option_name="tmp-dir", dest="tmp_dir")
+    parser.add_config_file_option(option_name="profile", dest="profile",
+                    type="path")
+    parser.add_config_file_option(option_name="trace", dest="trace",
+                    type="path")
     parser.add_config_file_option(option_name="vendor", action="store",
                     dest="vendor")
     parser.add_config_file_option(option_name="git-log", dest="git_log",
@@ -505,6 +629,12 @@ def main(argv):
     if not options:
         return 1
 
+    if options.profile:
+        gbp.profile.enable()
+    if options.trace:
+        gbp.profile.enable_trace()
+
+    retval = 0
     try:
         init_tmpdir(options.tmp_dir, prefix='rpm-ch_')
 
@@ -512,45 +642,58 @@ def main(argv):
         editor_cmd = determine_editor(options)
 
         repo = RpmGitRepository('.')
-        check_repo_state(repo, options)
+        with gbp.profile.phase('prepare'):
+            check_repo_state(repo, options)
 
         # Find and parse spec file
-        spec = parse_spec_file(repo, options)
+        with gbp.profile.phase('spec-parse'):
+            spec = parse_spec_file(repo, options)
 
         # Find and parse changelog file
-        ch_file = parse_changelog_file(repo, spec, options)
+        with gbp.profile.phase('changelog-parse'):
+            ch_file = parse_changelog_file(repo, spec, options)
 
         # Get new entries
-        entries = generate_new_entries(ch_file.changelog, repo, options, args)
+        with gbp.profile.phase('entries'):
+            entries = generate_new_entries(ch_file.changelog, repo, options,
+                                           args)
 
         # Do the actual update
-        tag, tag_msg, author, committer = update_changelog(ch_file.changelog,
-                                                           entries, repo, spec,
-                                                           options)
+        with gbp.profile.phase('update'):
+            tag, tag_msg, author, committer = update_changelog(
+                                ch_file.changelog, entries, repo, spec,
+                                options)
         # Write to file
-        ch_file.write()
+        with gbp.profile.phase('write'):
+            ch_file.write()
 
         if editor_cmd and not options.message:
             gbpc.Command(editor_cmd, [ch_file.path])()
 
         if options.commit:
-            edit = True if editor_cmd else False
-            msg = create_commit_message(spec, options)
-            commit_changelog(repo, ch_file, msg, author, committer, edit)
-            if options.tag:
-                if options.retag and repo.has_tag(tag):
-                    repo.delete_tag(tag)
-                repo.create_tag(tag, tag_msg, 'HEAD', options.sign_tags,
-                                options.keyid)
+            with gbp.profile.phase('commit'):
+                edit = True if editor_cmd else False
+                msg = create_commit_message(spec, options)
+                commit_changelog(repo, ch_file, msg, author, committer, edit)
+                if options.tag:
+                    if options.retag and repo.has_tag(tag):
+                        repo.delete_tag(tag)
+                    repo.create_tag(tag, tag_msg, 'HEAD', options.sign_tags,
+                                    options.keyid)
 
     except (GbpError, GitRepositoryError, ChangelogError, NoSpecError) as err:
         if len(err.__str__()):
             gbp.log.err(err)
-        return 1
+        retval = 1
     finally:
         del_tmpdir()
 
-    return 0
+    if options.profile:
+        gbp.profile.report(options.profile)
+    if options.trace:
+        gbp.profile.write_trace(options.trace)
+
+    return retval
 
 if __name__ == "__main__":
     sys.exit(main(sys.argv))
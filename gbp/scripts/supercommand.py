@@ -19,6 +19,7 @@
 
 from __future__ import print_function
 
+import ast
 import glob
 import os
 import re
@@ -87,20 +88,68 @@ def get_available_commands(path):
     return cmds
 
 
+def extract_docstring(filename):
+    """
+    Get the docstring of a module without importing it
+    """
+    with open(filename) as module:
+        tree = ast.parse(module.read(), filename)
+    return ast.get_docstring(tree, clean=False)
+
+
+def get_command_docs(path):
+    """
+    Get the docstrings of the commands available in path
+
+    The docstrings are taken from the command manifest generated at build
+    time, commands missing from it are parsed (but not imported) instead.
+    """
+    try:
+        from gbp.command_manifest import command_docs
+    except ImportError:
+        command_docs = {}
+    docs = {}
+    for cmd, filename in get_available_commands(path):
+        if cmd in command_docs:
+            docs[cmd] = command_docs[cmd]
+        else:
+            docs[cmd] = extract_docstring(filename)
+    return docs
+
+
+def write_command_manifest(path, filename):
+    """
+    Write the manifest of the command docstrings used by
+    L{list_available_commands}
+
+    @param path: directory of the command modules
+    @type path: C{str}
+    @param filename: manifest file to write
+    @type filename: C{str}
+    """
+    docs = dict([(cmd, extract_docstring(fname)) for cmd, fname in
+                 get_available_commands(path)])
+    with open(filename, 'w') as manifest:
+        manifest.write('"Docstrings of the gbp commands"\n')
+        manifest.write('command_docs = {\n')
+        for cmd, doc in sorted(docs.items()):
+            manifest.write('    %r: %r,\n' % (cmd, doc))
+        manifest.write('}\n')
+
+
 def list_available_commands():
     mod = __import__('gbp.scripts', fromlist='main', level=0)
     path = os.path.dirname(mod.__file__)
     maxlen = 0
 
     print("Available commands in %s\n" % path)
-    cmds = sorted(get_available_commands(path))
+    docs = get_command_docs(path)
+    cmds = sorted(docs)
     for cmd in cmds:
-        if len(cmd[0]) > maxlen:
-            maxlen = len(cmd[0])
+        if len(cmd) > maxlen:
+            maxlen = len(cmd)
     for cmd in cmds:
-        mod = import_command(cmd[0])
-        doc = mod.__doc__
-        print("    %s - %s" % (cmd[0].rjust(maxlen), doc))
+        print("    %s - %s" % (cmd.rjust(maxlen), docs[cmd]))
     print('')
 
 
@@ -132,6 +181,14 @@ def supercommand(argv=None):
         list_available_commands()
         return 0
 
+    # Let a gbp daemon run the command if one is available
+    socket_path = os.getenv('GBP_DAEMON_SOCKET')
+    if socket_path and cmd != 'daemon':
+        from gbp.daemon import run_remote
+        retval = run_remote(socket_path, argv)
+        if retval is not None:
+            return retval
+
     try:
         module = import_command(cmd)
     except ImportError as e:
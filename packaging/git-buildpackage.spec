@@ -240,6 +240,7 @@ done
 %{python_sitelib}/gbp/scripts/__init__.py*
 %{python_sitelib}/gbp/scripts/clone.py*
 %{python_sitelib}/gbp/scripts/config.py*
+%{python_sitelib}/gbp/scripts/daemon.py*
 %{python_sitelib}/gbp/scripts/pull.py*
 %{python_sitelib}/gbp/scripts/supercommand.py*
 %{python_sitelib}/gbp/scripts/common/*.py*
@@ -267,6 +268,7 @@ done
 %{_mandir}/man1/gbp-import-srpm.1*
 %{_mandir}/man1/gbp-rpm-ch.1*
 %{_mandir}/man1/gbp-import-orig-rpm.1*
+%{_mandir}/man1/gbp-build-many-rpm.1*
 %endif
 
 
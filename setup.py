@@ -19,6 +19,7 @@
 
 import subprocess
 from setuptools import setup, find_packages
+from setuptools.command.build_py import build_py
 import os
 
 
@@ -43,6 +44,17 @@ def fetch_version():
     return version
 
 
+class build_py_manifest(build_py):
+    """Also write the docstrings of the commands to gbp/command_manifest.py"""
+    def run(self):
+        build_py.run(self)
+        if not self.dry_run:
+            from gbp.scripts.supercommand import write_command_manifest
+            write_command_manifest('gbp/scripts',
+                                   os.path.join(self.build_lib, 'gbp',
+                                                'command_manifest.py'))
+
+
 def readme():
     with open('README') as file:
         return file.read()
@@ -70,4 +82,5 @@ setup(name = "gbp",
       entry_points = {
           'console_scripts': [ 'gbp = gbp.scripts.supercommand:supercommand' ],
       },
+      cmdclass = {'build_py': build_py_manifest},
 )
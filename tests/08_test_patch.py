@@ -42,3 +42,20 @@ class TestPatch(unittest.TestCase):
                          "It can span several lines.\n",
                          p.long_desc)
         self.assertEqual('Sat, 24 Dec 2011 12:05:53 +0100', p.date)
+
+    def test_inbody_headers(self):
+        """In-body headers override the mail headers of a patch"""
+        p = Patch(os.path.join(self.data_dir, "inbody.patch"))
+        self.assertEqual('Inbody subject continued', p.subject)
+        self.assertEqual('Other Author', p.author)
+        self.assertEqual('other@example.com', p.email)
+        self.assertEqual('Mon, 1 Jan 2001 00:00:00 +0000', p.date)
+        self.assertEqual("Body text\nwith lines  \n\n", p.long_desc)
+
+    def test_mime_fallback(self):
+        """Patches needing charset conversion are parsed by git"""
+        p = Patch(os.path.join(self.data_dir, "latin1.patch"))
+        self.assertEqual('Latin-1 body', p.subject)
+        self.assertEqual('J\xc3\xb6rg', p.author)
+        self.assertEqual('joerg@example.com', p.email)
+        self.assertEqual('K\xc3\xa4se\n', p.long_desc)
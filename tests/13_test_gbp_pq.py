@@ -19,6 +19,7 @@ from . import context
 from . import testutils
 
 import os
+import subprocess
 # Try unittest2 for CentOS
 try:
     import unittest2 as unittest
@@ -26,8 +27,11 @@ except ImportError:
     import unittest
 
 from gbp.scripts.pq import generate_patches, export_patches
+from gbp.scripts.pq_rpm import safe_patches
 import gbp.scripts.common.pq as pq
 import gbp.patch_series
+from gbp.errors import GbpError
+from gbp.git.modifier import GitModifier
 
 
 class TestApplyAndCommit(testutils.DebianGitTestRepo):
@@ -60,6 +64,26 @@ class TestApplyAndCommit(testutils.DebianGitTestRepo):
         info = self.repo.get_commit_info('HEAD')
         self.assertIn('Gbp-Pq: Name foobar', info['body'])
 
+    def test_commit_patch_in_index(self):
+        """Test applying a patch to a temporary index only"""
+        patch = gbp.patch_series.Patch(_patch_path('foo.patch'))
+        index_file = os.path.join(self.repo.git_dir, 'test_index')
+        head = self.repo.head
+
+        self.repo.read_tree(head, index_file)
+        commit = pq.commit_patch_in_index(self.repo, patch, head, index_file,
+                                          None, name='foo.patch')
+        self.assertEqual(self.repo.head, head)
+        self.assertNotIn('foo', os.listdir(self.repo.path))
+        self.assertNotIn('foo', self.repo.list_files())
+        self.assertNotIn('foo', [entry[3] for entry in
+                                 self.repo.list_tree(head)])
+        self.assertIn('foo', [entry[3] for entry in
+                              self.repo.list_tree(commit)])
+        self.assertEqual(self.repo.rev_parse('%s^' % commit), head)
+        info = self.repo.get_commit_info(commit)
+        self.assertIn('Gbp-Pq: Name foo.patch', info['body'])
+
     @unittest.skipIf(not os.path.exists('/usr/bin/dpkg'), 'Dpkg not found')
     def test_debian_missing_author(self):
         """
@@ -91,6 +115,252 @@ class TestApplyAndCommit(testutils.DebianGitTestRepo):
         self.assertIn('foo', self.repo.list_files())
 
 
+class TestApplyAndCommitSeries(testutils.DebianGitTestRepo):
+    """Test L{gbp.pq}'s apply_and_commit_series"""
+
+    def setUp(self):
+        testutils.DebianGitTestRepo.setUp(self)
+        self.add_file('bar')
+
+    def _patch(self, name, content, strip=None):
+        path = os.path.join(str(self.tmpdir), name)
+        with open(path, 'w') as patch:
+            patch.write(content)
+        return gbp.patch_series.Patch(path, strip=strip)
+
+    def test_apply_series(self):
+        """Test applying a series with different strip levels"""
+        series = [gbp.patch_series.Patch(_patch_path('foo.patch')),
+                  self._patch('baz.patch',
+                              "From: A U Thor <a@example.com>\n"
+                              "Subject: Add baz\n\n"
+                              "From the description\n"
+                              "---\n"
+                              "--- /dev/null\n+++ baz\n@@ -0,0 +1 @@\n+baz\n",
+                              strip=0)]
+        head = self.repo.head
+        pq.apply_and_commit_series(self.repo, series, None,
+                                   names=['foo.patch', 'baz.patch'])
+        self.assertIn('foo', self.repo.list_files())
+        self.assertIn('baz', self.repo.list_files())
+        commits = self.repo.get_commits(since=head, until='HEAD')
+        self.assertEqual(2, len(commits))
+        info = self.repo.get_commit_info(commits[0])
+        self.assertEqual('Add baz', info['subject'])
+        self.assertEqual('a@example.com', info['author'].email)
+        self.assertIn('From the description', info['body'])
+        self.assertIn('Gbp-Pq: Name baz.patch', info['body'])
+        info = self.repo.get_commit_info(commits[1])
+        self.assertIn('Gbp-Pq: Name foo.patch', info['body'])
+
+    def test_same_as_single(self):
+        """The series creates the same commits as applying one by one"""
+        series = [gbp.patch_series.Patch(_patch_path('foo.patch')),
+                  self._patch('ws.patch',
+                              "From: A U Thor <a@example.com>\n"
+                              "Date: Mon, 1 Jan 2001 00:00:00 +0100\n"
+                              "Subject: Add ws\n\n"
+                              "Trailing space  \n\n\n"
+                              "Double blank line above\n\n"
+                              "---\n"
+                              "--- /dev/null\n+++ b/ws\n@@ -0,0 +1 @@\n+ws\n")]
+        # Dates of patches without a Date header come from the environment
+        for var in ['GIT_AUTHOR_DATE', 'GIT_COMMITTER_DATE']:
+            os.environ[var] = '1000000000 +0000'
+        try:
+            head = self.repo.head
+            for patch in series:
+                pq.apply_and_commit_patch(self.repo, patch, None,
+                                          name=os.path.basename(patch.path))
+            single = self.repo.get_commits(since=head, until='HEAD')
+            self.repo.force_head(head, hard=True)
+            pq.apply_and_commit_series(self.repo, series, None,
+                                       names=['foo.patch', 'ws.patch'])
+            commits = self.repo.get_commits(since=head, until='HEAD')
+        finally:
+            del os.environ['GIT_AUTHOR_DATE']
+            del os.environ['GIT_COMMITTER_DATE']
+        info = self.repo.get_commit_info(commits[0])
+        self.assertIn('Trailing space  \n\n\nDouble', info['body'])
+        self.assertEqual(single, commits)
+
+    def test_rollback(self):
+        """Test that a failing patch is reported and nothing is applied"""
+        series = [gbp.patch_series.Patch(_patch_path('foo.patch')),
+                  self._patch('bad.patch',
+                              "From: A U Thor <a@example.com>\n"
+                              "Subject: Break\n\n"
+                              "---\n--- a/nonexistent\n+++ b/nonexistent\n"
+                              "@@ -1 +1 @@\n-a\n+b\n")]
+        head = self.repo.head
+        with self.assertRaisesRegexp(GbpError, "bad.patch"):
+            pq.apply_and_commit_series(self.repo, series, None)
+        self.assertEqual(head, self.repo.head)
+        self.assertNotIn('foo', self.repo.list_files())
+        self.assertTrue(self.repo.is_clean()[0])
+
+
+class TestCheckSeries(TestApplyAndCommitSeries):
+    """Test L{gbp.pq}'s check_series"""
+
+    def test_check_series(self):
+        """Test that all failing patches are reported"""
+        foo = gbp.patch_series.Patch(_patch_path('foo.patch'))
+        # Depends on foo.patch
+        foo2 = self._patch('foo2.patch',
+                           "--- a/foo\n+++ b/foo\n@@ -1 +1 @@\n-foo\n+foo2\n")
+        bad1 = self._patch('bad1.patch',
+                           "--- a/bar\n+++ b/bar\n@@ -1 +1 @@\n-x\n+y\n")
+        bad2 = self._patch('bad2.patch',
+                           "--- a/baz\n+++ b/baz\n@@ -1 +1 @@\n-x\n+y\n")
+        head = self.repo.head
+        failed, merged = pq.check_series(self.repo, [bad1, foo, foo2, bad2],
+                                         head)
+        self.assertEqual([bad1, bad2], [patch for patch, _err in failed])
+        self.assertIn('bar', str(failed[0][1]))
+        self.assertEqual([], merged)
+        self.assertEqual(head, self.repo.head)
+        self.assertTrue(self.repo.is_clean()[0])
+
+    def test_three_way(self):
+        """Test checking patches with a three-way merge"""
+        lines = ['%d\n' % num for num in range(20)]
+        self.add_file('lines', ''.join(lines))
+        base = self.repo.head
+        self.add_file('lines', ''.join(lines[:15] + ['new\n'] + lines[16:]))
+        diff = self.repo.diff(base, 'HEAD')
+        self.repo.force_head(base, hard=True)
+        # Change the context of the patch
+        self.add_file('lines', ''.join(lines[:12] + ['new\n'] + lines[13:]))
+        patch = self._patch('lines.patch', diff)
+        failed, merged = pq.check_series(self.repo, [patch], 'HEAD')
+        self.assertEqual([patch], [patch for patch, _err in failed])
+        failed, merged = pq.check_series(self.repo, [patch], 'HEAD',
+                                         three_way=True)
+        self.assertEqual([], failed)
+        self.assertEqual([patch], merged)
+
+
+class TestReplayCommits(testutils.DebianGitTestRepo):
+    """Test L{gbp.pq}'s replay_commits"""
+
+    def setUp(self):
+        testutils.DebianGitTestRepo.setUp(self)
+        self.add_file('foo', 'foo\n')
+        self.base = self.repo.head
+        self.add_file('bar', 'bar\n', msg="Add bar\n\nGbp-Pq: Name bar.patch")
+        self.add_file('foo', 'foo2\n', msg="Change foo")
+        self.commits = self.repo.get_commits(since=self.base,
+                                             until='HEAD')[::-1]
+
+    def test_replay(self):
+        """Test replaying commits onto a new upstream"""
+        self.repo.create_branch('upstream', self.base)
+        self.repo.set_branch('upstream')
+        self.add_file('baz', 'baz\n')
+        upstream = self.repo.head
+        tip, conflicting = pq.replay_commits(self.repo, self.commits,
+                                             upstream)
+        self.assertEqual([], conflicting)
+        self.assertEqual(upstream, self.repo.head)
+        self.assertEqual(self.commits[::-1],
+                         self.repo.get_commits(since=self.base,
+                                               until='master'))
+        replayed = self.repo.get_commits(since=upstream, until=tip)
+        self.assertEqual(2, len(replayed))
+        info = self.repo.get_commit_info(replayed[1])
+        orig_info = self.repo.get_commit_info(self.commits[0])
+        self.assertEqual('Add bar', info['subject'])
+        self.assertIn('Gbp-Pq: Name bar.patch', info['body'])
+        self.assertEqual(orig_info['author'].date, info['author'].date)
+        files = [entry[3] for entry in self.repo.list_tree(tip)]
+        self.assertEqual(['bar', 'baz', 'foo'], sorted(files))
+
+    def test_conflict(self):
+        """Test that replaying stops at the first conflicting commit"""
+        self.repo.create_branch('upstream', self.base)
+        self.repo.set_branch('upstream')
+        self.add_file('foo', 'foo3\n')
+        upstream = self.repo.head
+        tip, conflicting = pq.replay_commits(self.repo, self.commits,
+                                             upstream)
+        self.assertEqual(self.commits[1:], conflicting)
+        self.assertEqual([tip], self.repo.get_commits(since=upstream,
+                                                      until=tip))
+
+    def test_drop_upstream_changes(self):
+        """Test that commits already upstream are dropped"""
+        self.repo.create_branch('upstream', self.base)
+        self.repo.set_branch('upstream')
+        self.add_file('foo', 'foo2\n')
+        upstream = self.repo.head
+        tip, conflicting = pq.replay_commits(self.repo, self.commits,
+                                             upstream)
+        self.assertEqual([], conflicting)
+        self.assertEqual(1, len(self.repo.get_commits(since=upstream,
+                                                      until=tip)))
+
+
+class TestSafePatches(testutils.DebianGitTestRepo):
+    """Test L{gbp.scripts.pq_rpm.safe_patches}"""
+
+    def setUp(self):
+        testutils.DebianGitTestRepo.setUp(self)
+        self.add_file('bar')
+        with open(_patch_path('foo.patch')) as patch:
+            self.content = patch.read()
+
+    def _compressed(self, comp, ext):
+        """Compress the test patch"""
+        path = os.path.join(str(self.tmpdir), 'foo.patch')
+        with open(path, 'w') as patch:
+            patch.write(self.content)
+        subprocess.check_call([comp, '-f', path])
+        return path + ext
+
+    def test_decompress(self):
+        """Test reading compressed patches"""
+        paths = [_patch_path('foo.patch'),
+                 self._compressed('gzip', '.gz'),
+                 self._compressed('bzip2', '.bz2'),
+                 self._compressed('xz', '.xz')]
+        queue = safe_patches([gbp.patch_series.Patch(path) for path in paths])
+        for patch in queue:
+            self.assertEqual('foo.patch', patch.name)
+            self.assertEqual('foobar', patch.subject)
+            with patch.open() as stream:
+                self.assertEqual(self.content, stream.read())
+
+    def test_apply_after_remove(self):
+        """Test applying a compressed patch that has been removed"""
+        path = self._compressed('gzip', '.gz')
+        queue = safe_patches([gbp.patch_series.Patch(path)])
+        os.unlink(path)
+        pq.apply_and_commit_patch(self.repo, queue[0], None)
+        self.assertIn('foo', self.repo.list_files())
+
+    @unittest.skipUnless(os.path.isdir('/proc/self/fd'), "needs /proc")
+    def test_open_files(self):
+        """Test that only the patch being read and the next one are open"""
+        paths = []
+        for num in range(100):
+            path = os.path.join(str(self.tmpdir), '%03d.patch' % num)
+            with open(path, 'w') as patch:
+                patch.write(self.content.replace('foo', 'foo%03d' % num))
+            paths.append(path)
+        queue = safe_patches([gbp.patch_series.Patch(path) for path in paths])
+        for path in paths:
+            os.unlink(path)
+        open_fds = len(os.listdir('/proc/self/fd'))
+        max_fds = open_fds
+        for patch in queue:
+            with patch.open() as stream:
+                stream.read()
+                max_fds = max(max_fds, len(os.listdir('/proc/self/fd')))
+        self.assertLessEqual(max_fds, open_fds + 2)
+        self.assertEqual(open_fds, len(os.listdir('/proc/self/fd')))
+
+
 class TestApplySinglePatch(testutils.DebianGitTestRepo):
     """Test L{gbp.pq}'s apply_single_patch"""
 
@@ -211,6 +481,20 @@ class TestWritePatch(testutils.DebianGitTestRepo):
         self._test_generate_patches(changes, expected_patches, opts)
 
 
+    def test_quoted_author(self):
+        """Quoted author names survive an export and import"""
+        self.add_file('foo', 'foo')
+        info = self.repo.get_commit_info('HEAD')
+        info['author'] = GitModifier('J. Random Hacker', 'jrh@example.com',
+                                     info['author'].date)
+        d = context.new_tmpdir(__name__)
+        path = os.path.join(str(d), 'quoted.patch')
+        diff = self.repo.diff('HEAD^', 'HEAD')
+        pq.write_patch_file(path, info, diff)
+        patch = gbp.patch_series.Patch(path)
+        self.assertEqual('J. Random Hacker', patch.author)
+        self.assertEqual('jrh@example.com', patch.email)
+
 class TestExport(testutils.DebianGitTestRepo):
     class Options(object):
         drop = True
@@ -15,12 +15,19 @@
 #    <http://www.gnu.org/licenses/>
 """Test L{gbp} command wrapper"""
 
+import os
+import shutil
 import sys
+import tempfile
 # Try unittest2 for CentOS
 try:
     import unittest2 as unittest
 except ImportError:
     import unittest
+import mock
+from six import StringIO
+
+import gbp.scripts
 import gbp.scripts.supercommand
 
 class TestSuperCommand(unittest.TestCase):
@@ -57,3 +64,30 @@ class TestSuperCommand(unittest.TestCase):
         self.assertEqual(gbp.scripts.supercommand.supercommand(
                          ['argv0']), 1)
 
+
+    def test_list_cmds(self):
+        """Listing the commands must not import them"""
+        stdout = StringIO()
+        with mock.patch('sys.stdout', stdout):
+            with mock.patch('gbp.scripts.supercommand.import_command') as imp:
+                self.assertEqual(gbp.scripts.supercommand.supercommand(
+                                 ['argv0', 'list-cmds']), 0)
+                self.assertFalse(imp.called)
+        self.assertIn('pq - Manage Debian patches on a patch queue branch',
+                      stdout.getvalue())
+
+    def test_command_manifest(self):
+        """The command manifest matches the docstrings of the commands"""
+        path = os.path.dirname(gbp.scripts.__file__)
+        tmpdir = tempfile.mkdtemp(prefix='gbp_%s_' % __name__)
+        try:
+            manifest = os.path.join(tmpdir, 'manifest.py')
+            gbp.scripts.supercommand.write_command_manifest(path, manifest)
+            namespace = {}
+            exec(open(manifest).read(), namespace)
+        finally:
+            shutil.rmtree(tmpdir)
+        docs = namespace['command_docs']
+        self.assertEqual(docs, gbp.scripts.supercommand.get_command_docs(path))
+        self.assertEqual(docs['pq'],
+                         gbp.scripts.supercommand.import_command('pq').__doc__)
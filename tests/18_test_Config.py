@@ -1,13 +1,19 @@
 # vim: set fileencoding=utf-8 :
 
 import os
+import shutil
+import tempfile
 # Try unittest2 for CentOS
 try:
     import unittest2 as unittest
 except ImportError:
     import unittest
 import sys
+
+import mock
+
 from gbp.config import GbpOptionParser, GbpOptionGroup
+from gbp.git.repository import GitRepository
 from .testutils import GbpLogTester
 
 
@@ -114,3 +120,59 @@ class TestConfigParser(unittest.TestCase, GbpLogTester):
         self.assertTrue('upstream-branch' in params)
         self.assertTrue('debian-branch' in params)
         self.assertTrue('color' in params)
+
+
+class TestConfigCache(unittest.TestCase):
+    """Test caching of the merged config files"""
+
+    def setUp(self):
+        self.conffiles_save = os.environ.get('GBP_CONF_FILES')
+        os.environ['GBP_CONF_FILES'] = '%(top_dir)s/.gbp.conf:' \
+                                       '%(top_dir)s/debian/gbp.conf'
+        self.tmpdir = tempfile.mkdtemp(prefix='gbp_%s_' % __name__)
+        self.repo = GitRepository.create(os.path.join(self.tmpdir, 'repo'))
+        self._write_conf('[DEFAULT]\ndebian-branch = committed\n')
+        self.repo.add_files('.gbp.conf')
+        self.repo.commit_staged('Add config')
+
+    def tearDown(self):
+        if self.conffiles_save:
+            os.environ['GBP_CONF_FILES'] = self.conffiles_save
+        else:
+            del os.environ['GBP_CONF_FILES']
+        shutil.rmtree(self.tmpdir)
+
+    def _write_conf(self, content):
+        with open(os.path.join(self.repo.path, '.gbp.conf'), 'w') as conf:
+            conf.write(content)
+
+    def test_worktree(self):
+        """Config files are re-read only when changed"""
+        parser = GbpOptionParser('cmd', repo=self.repo)
+        self.assertEqual(parser.config['debian-branch'], 'committed')
+        self.assertIs(GbpOptionParser.read_config_files(self.repo),
+                      GbpOptionParser.read_config_files(self.repo))
+
+        self._write_conf('[DEFAULT]\ndebian-branch = modified in worktree\n')
+        parser = GbpOptionParser('cmd', repo=self.repo)
+        self.assertEqual(parser.config['debian-branch'],
+                         'modified in worktree')
+
+    def test_treeish(self):
+        """Per-tree config files are read in one go and cached by tree"""
+        self._write_conf('[DEFAULT]\ndebian-branch = modified in worktree\n')
+        with mock.patch.object(GitRepository, 'iter_objects',
+                               wraps=self.repo.iter_objects) as iter_mock:
+            parser = GbpOptionParser('cmd', git_treeish='HEAD', repo=self.repo)
+            self.assertEqual(parser.config['debian-branch'], 'committed')
+            self.assertEqual(iter_mock.call_count, 1)
+            # Same tree, different name
+            parser = GbpOptionParser('cmd', git_treeish='master',
+                                     repo=self.repo)
+            self.assertEqual(parser.config['debian-branch'], 'committed')
+            self.assertEqual(iter_mock.call_count, 1)
+
+        # Invalid treeish means no per-tree config
+        parser = GbpOptionParser('cmd', git_treeish='nonexistent',
+                                 repo=self.repo)
+        self.assertEqual(parser.config['debian-branch'], 'master')
@@ -194,6 +194,25 @@ class TestSpecFile(RpmTestBase):
         spec.write_spec_file()
         eq_(filecmp.cmp(tmp_spec, reference_spec), True)
 
+    def test_write_spec_links(self):
+        """Writing the spec goes through symlinks and keeps hard links"""
+        real_spec = os.path.join(self.tmpdir, 'real.spec')
+        shutil.copy2(os.path.join(SPEC_DIR, 'gbp-test.spec'), real_spec)
+        link_spec = os.path.join(self.tmpdir, 'gbp-test.spec')
+        os.symlink('real.spec', link_spec)
+        hard_spec = os.path.join(self.tmpdir, 'hard.spec')
+        os.link(real_spec, hard_spec)
+
+        reference_spec = os.path.join(SPEC_DIR, 'gbp-test-reference.spec')
+        spec = SpecFile(link_spec)
+        spec.update_patches(['new.patch'], {})
+        spec.write_spec_file()
+        ok_(os.path.islink(link_spec))
+        eq_(filecmp.cmp(real_spec, reference_spec), True)
+        eq_(filecmp.cmp(hard_spec, reference_spec), True)
+        eq_(sorted(os.listdir(self.tmpdir)),
+            ['gbp-test.spec', 'hard.spec', 'real.spec'])
+
     def test_update_spec2(self):
         """Another test for spec autoupdate functionality"""
         tmp_spec = os.path.join(self.tmpdir, 'gbp-test2.spec')
@@ -217,6 +236,21 @@ class TestSpecFile(RpmTestBase):
         spec.write_spec_file()
         eq_(filecmp.cmp(tmp_spec, reference_spec), True)
 
+    def test_update_patches_unchanged(self):
+        """Updating with the same patch series leaves the spec intact"""
+        tmp_spec = os.path.join(self.tmpdir, 'gbp-test2.spec')
+        shutil.copy2(os.path.join(SPEC_DIR, 'gbp-test2.spec'), tmp_spec)
+
+        spec = SpecFile(tmp_spec)
+        commands = {'1.patch': {'if': 'true'}}
+        eq_(spec.update_patches(['1.patch', '2.patch'], commands), True)
+        spec.write_spec_file()
+
+        spec = SpecFile(tmp_spec)
+        eq_(spec.update_patches(['1.patch', '2.patch'], commands), False)
+        eq_(spec.update_patches(['1.patch', '2.patch'], {}), True)
+        eq_(spec.update_patches(['2.patch'], {}), True)
+
     def test_modifying(self):
         """Test updating/deleting of tags and macros"""
         tmp_spec = os.path.join(self.tmpdir, 'gbp-test.spec')
@@ -1,9 +1,13 @@
 # vim: set fileencoding=utf-8 :
 """Test L{gbp.command_wrappers.Command}'s tarball unpack"""
 
+import os
+import shutil
+
 from gbp.scripts.buildpackage import (get_pbuilder_dist,
                                       setup_pbuilder,
                                       GbpError)
+from gbp.scripts.common.buildpackage import dump_tree, has_export_attributes
 from . testutils import DebianGitTestRepo
 
 from mock import patch
@@ -109,3 +113,31 @@ class TestGbpBuildpackageSetupPbuilder(DebianGitTestRepo):
                            'GBP_PBUILDER_DIST': 'sid'},
                           {'GBP_PBUILDER_ARCH': 'arm64',
                            'GBP_PBUILDER_DIST': 'sid'}))
+
+
+class TestDumpTree(DebianGitTestRepo):
+    """Test dumping the top level of a packaging dir"""
+
+    def setUp(self):
+        DebianGitTestRepo.setUp(self)
+        self.add_file('packaging/foo.spec', 'Name: foo\n')
+        self.add_file('packaging/ignored', 'not exported\n')
+        self.dumpdir = self.tmpdir.join('dump')
+
+    def _dump(self):
+        shutil.rmtree(self.dumpdir, ignore_errors=True)
+        self.assertTrue(dump_tree(self.repo, self.dumpdir, 'HEAD:packaging',
+                                  False, False))
+        return sorted(os.listdir(self.dumpdir))
+
+    def test_no_export_attributes(self):
+        """Without export attributes all blobs are written"""
+        self.assertFalse(has_export_attributes(self.repo, 'HEAD:packaging'))
+        self.assertEqual(self._dump(), ['foo.spec', 'ignored'])
+
+    def test_export_attributes(self):
+        """Export attributes of the tree are applied like by git archive"""
+        self.add_file('packaging/.gitattributes', 'ignored export-ignore\n')
+        self.assertTrue(has_export_attributes(self.repo, 'HEAD:packaging'))
+        self.assertFalse(has_export_attributes(self.repo, 'HEAD'))
+        self.assertEqual(self._dump(), ['.gitattributes', 'foo.spec'])
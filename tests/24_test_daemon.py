@@ -0,0 +1,173 @@
+# vim: set fileencoding=utf-8 :
+"""Test L{gbp.daemon}"""
+
+from . import context
+
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+import mock
+from six import StringIO
+
+from gbp.daemon import GbpDaemon, SOCKET_ENV, run_remote
+from gbp.git.repository import GitRepository
+
+
+class TestDaemon(unittest.TestCase):
+    """Test running commands through the gbp daemon"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='gbp_%s_' % __name__)
+        self.socket = os.path.join(self.tmpdir, 'gbp.sock')
+        self.pid = os.fork()
+        if self.pid == 0:
+            # Skip importing all commands, not needed here
+            GbpDaemon.preload = staticmethod(lambda: None)
+            GbpDaemon.reap_interval = 0.05
+            try:
+                GbpDaemon(self.socket).serve()
+            finally:
+                os._exit(0)
+        for _num in range(100):
+            if os.path.exists(self.socket):
+                break
+            time.sleep(0.05)
+
+    def tearDown(self):
+        os.kill(self.pid, signal.SIGTERM)
+        os.waitpid(self.pid, 0)
+        self.assertFalse(os.path.exists(self.socket))
+        shutil.rmtree(self.tmpdir)
+
+    def _run(self, argv):
+        """Run a command through the daemon, capturing its output"""
+        stdout, stderr = StringIO(), StringIO()
+        with mock.patch('sys.stdin', StringIO()):
+            with mock.patch('sys.stdout', stdout):
+                with mock.patch('sys.stderr', stderr):
+                    retval = run_remote(self.socket, argv)
+        return retval, stdout.getvalue(), stderr.getvalue()
+
+    def test_run_remote(self):
+        """Output and exit code are relayed to the client"""
+        retval, stdout, stderr = self._run(['gbp', 'no-such-command'])
+        self.assertEqual(retval, 2)
+        self.assertIn('Usage:', stdout)
+        self.assertIn("'no-such-command' is not a valid command.", stderr)
+
+        retval, stdout, stderr = self._run(['gbp', 'version'])
+        self.assertEqual(retval, 0)
+        self.assertIn('gbp', stdout)
+
+    def _children(self):
+        """States of the child processes of the daemon"""
+        states = []
+        for pid in os.listdir('/proc'):
+            try:
+                with open('/proc/%s/stat' % pid) as fobj:
+                    fields = fobj.read().rsplit(')', 1)[1].split()
+            except (IOError, ValueError, IndexError):
+                continue
+            if int(fields[1]) == self.pid:
+                states.append(fields[0])
+        return states
+
+    @unittest.skipUnless(os.path.isdir('/proc/self'), "needs /proc")
+    def test_reap_handlers(self):
+        """Request handlers are reaped while the daemon is idle"""
+        repo = GitRepository.create(os.path.join(self.tmpdir, 'repo'))
+        saved_cwd = os.getcwd()
+        os.chdir(repo.path)
+        try:
+            for _num in range(3):
+                self.assertEqual(self._run(['gbp', 'version'])[0], 0)
+        finally:
+            os.chdir(saved_cwd)
+        for _num in range(100):
+            if not self._children():
+                break
+            time.sleep(0.05)
+        self.assertEqual(self._children(), [])
+
+    def _run_gbp(self, args, env):
+        """Run gbp in a separate process, like from a script"""
+        env = dict(env, PYTHONPATH=os.pathsep.join(sys.path))
+        with open(os.devnull) as devnull:
+            popen = subprocess.Popen([sys.executable, '-c',
+                                      'import sys\n'
+                                      'from gbp.scripts.supercommand import '
+                                      'supercommand\n'
+                                      'sys.exit(supercommand())'] + args,
+                                     stdin=devnull,
+                                     stdout=subprocess.PIPE,
+                                     stderr=subprocess.PIPE,
+                                     cwd=self.tmpdir, env=env)
+            stdout, stderr = popen.communicate()
+        return popen.returncode, stdout, stderr
+
+    def test_same_as_local(self):
+        """Commands give the same results in the daemon as locally"""
+        env = dict(os.environ)
+        env.pop(SOCKET_ENV, None)
+        for args in (['pq', 'export'], ['pull', '--help']):
+            local = self._run_gbp(args, env)
+            remote = self._run_gbp(args,
+                                   dict(env, GBP_DAEMON_SOCKET=self.socket))
+            self.assertEqual(remote, local)
+        self.assertEqual(local[0], 0)
+        self.assertIn('Usage:', local[1])
+
+    def test_interactive_local(self):
+        """Interactive commands and commands from a terminal run locally"""
+        self.assertEqual(self._run(['gbp', 'dch', '--help'])[0], None)
+        self.assertEqual(self._run(['gbp', 'import-orig', '--help'])[0], None)
+        tty = mock.Mock()
+        tty.isatty.return_value = True
+        with mock.patch('sys.stdin', tty):
+            self.assertEqual(run_remote(self.socket, ['gbp', 'version']),
+                             None)
+
+    def test_unencodable_request(self):
+        """Commands are run locally if the request can't be encoded"""
+        with mock.patch.dict(os.environ, {'GBP_TEST_LATIN1': 'caf\xe9'}):
+            self.assertEqual(self._run(['gbp', 'version'])[0], None)
+        self.assertEqual(self._run(['gbp', 'version', 'caf\xe9'])[0], None)
+
+    def test_no_daemon(self):
+        """Commands are run locally if there is no daemon"""
+        self.assertEqual(run_remote(os.path.join(self.tmpdir, 'nonexistent'),
+                                    ['gbp', 'version']), None)
+
+
+class TestDirCache(unittest.TestCase):
+    """Test the repository location cache of L{GitRepository}"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='gbp_%s_' % __name__)
+        GitRepository.enable_dir_cache()
+
+    def tearDown(self):
+        GitRepository._dir_cache = None
+        shutil.rmtree(self.tmpdir)
+
+    def test_dir_cache(self):
+        """Repositories are opened without running git when cached"""
+        repo = GitRepository.create(os.path.join(self.tmpdir, 'repo'))
+        GitRepository(repo.path)
+        with mock.patch.object(GitRepository, '_git_inout') as git_mock:
+            cached = GitRepository(repo.path)
+            self.assertFalse(git_mock.called)
+        self.assertEqual(cached.git_dir, repo.git_dir)
+        self.assertEqual(cached.path, repo.path)
+        self.assertFalse(cached.bare)
+
+        # Changing the repository config invalidates the entry
+        subprocess.check_call(['git', 'config', 'core.bare', 'true'],
+                              cwd=repo.path)
+        self.assertTrue(GitRepository(repo.path).bare)
@@ -0,0 +1,78 @@
+# vim: set fileencoding=utf-8 :
+"""Test the build scheduler of L{gbp.scripts.build_many_rpm}"""
+
+from . import context
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import mock
+
+import gbp.scripts.buildpackage_rpm as buildpackage_rpm
+from gbp.scripts.build_many_rpm import BuildScheduler, Package, read_manifest
+
+
+def fake_buildpackage_rpm(argv):
+    """Build the package in the current directory, one build at a time"""
+    if os.path.basename(os.getcwd()).startswith('fail'):
+        return 1
+    with buildpackage_rpm.builder_slot():
+        # Fails if another build is running
+        os.mkdir('../build.lock')
+        time.sleep(0.1)
+        os.rmdir('../build.lock')
+    print("Built with %s" % argv)
+    return 0
+
+
+class TestBuildScheduler(unittest.TestCase):
+    """Test scheduling of the builds"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='gbp_%s_' % __name__)
+        self.orig_cwd = os.getcwd()
+
+    def tearDown(self):
+        os.chdir(self.orig_cwd)
+        shutil.rmtree(self.tmpdir)
+
+    def _packages(self, names):
+        """Create package repository directories"""
+        packages = []
+        for name in names:
+            os.mkdir(os.path.join(self.tmpdir, name))
+            packages.append(Package(os.path.join(self.tmpdir, name),
+                                    self.tmpdir))
+            packages[-1].argv = ['buildpackage-rpm', '--git-%s' % name]
+        return packages
+
+    def test_builder_jobs(self):
+        """Exports run in parallel, builds one at a time"""
+        packages = self._packages(['pkg1', 'pkg2', 'fail1', 'pkg3'])
+        with mock.patch('gbp.scripts.buildpackage_rpm.main',
+                        fake_buildpackage_rpm):
+            BuildScheduler(packages, 4, 1).run()
+        self.assertEqual([pkg.retval for pkg in packages], [0, 0, 1, 0])
+        self.assertEqual([pkg.state for pkg in packages], ['done'] * 4)
+
+        builds = sorted([(pkg.times['build'], pkg.times['finish'])
+                         for pkg in packages if not pkg.retval])
+        for prev, cur in zip(builds, builds[1:]):
+            self.assertLessEqual(prev[1], cur[0])
+        self.assertIsNone(packages[2].duration('build', 'finish'))
+        with open(packages[0].log) as log:
+            self.assertEqual(log.read(),
+                             "Built with ['buildpackage-rpm', '--git-pkg1']\n")
+
+    def test_read_manifest(self):
+        """Paths in the manifest are relative to it"""
+        manifest = os.path.join(self.tmpdir, 'manifest')
+        with open(manifest, 'w') as fobj:
+            fobj.write("# Release\npkg1\n\n  sub/pkg2  \n/abs/pkg3\n")
+        self.assertEqual(read_manifest(manifest),
+                         [os.path.join(self.tmpdir, 'pkg1'),
+                          os.path.join(self.tmpdir, 'sub/pkg2'),
+                          '/abs/pkg3'])
@@ -0,0 +1,100 @@
+# vim: set fileencoding=utf-8 :
+"""Test L{gbp.rpm.buildcache}"""
+
+from . import context
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from gbp.rpm.buildcache import BuildCache, find_packages, new_packages
+
+
+class TestBuildCache(unittest.TestCase):
+    """Test storing and restoring build results"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='gbp_%s_' % __name__)
+        self.topdir = os.path.join(self.tmpdir, 'rpmbuild')
+        self.cache = BuildCache(os.path.join(self.tmpdir, 'cache'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _write(self, path, content):
+        path = os.path.join(self.topdir, path)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as fobj:
+            fobj.write(content)
+        return path
+
+    def test_build_key(self):
+        """All build inputs affect the key"""
+        spec = self._write('SPECS/foo.spec', 'Name: foo')
+        key = BuildCache.build_key('1' * 40, {'spec': spec}, ['rpmbuild'])
+        self.assertEqual(key, BuildCache.build_key('1' * 40, {'spec': spec},
+                                                   ['rpmbuild']))
+        self.assertNotEqual(key, BuildCache.build_key('2' * 40,
+                                                      {'spec': spec},
+                                                      ['rpmbuild']))
+        self.assertNotEqual(key, BuildCache.build_key('1' * 40,
+                                                      {'spec': spec},
+                                                      ['rpmbuild', '-bb']))
+        self._write('SPECS/foo.spec', 'Name: bar')
+        self.assertNotEqual(key, BuildCache.build_key('1' * 40,
+                                                      {'spec': spec},
+                                                      ['rpmbuild']))
+
+    def test_put_get(self):
+        """Only packages produced by the build are cached and restored"""
+        self._write('RPMS/noarch/old-1.0-1.noarch.rpm', 'old')
+        before = find_packages(self.topdir)
+        self._write('SRPMS/foo-1.0-1.src.rpm', 'srpm')
+        self._write('RPMS/noarch/foo-1.0-1.noarch.rpm', 'rpm')
+        self._write('BUILD/foo.log', 'log')
+        packages = new_packages(self.topdir, before)
+        self.assertEqual(packages, ['RPMS/noarch/foo-1.0-1.noarch.rpm',
+                                    'SRPMS/foo-1.0-1.src.rpm'])
+        self.assertIsNone(self.cache.get('a' * 64, self.topdir))
+        self.cache.put('a' * 64, self.topdir, packages)
+
+        shutil.rmtree(self.topdir)
+        self.assertEqual(self.cache.get('a' * 64, self.topdir), packages)
+        self.assertEqual(sorted(find_packages(self.topdir)), packages)
+        with open(os.path.join(self.topdir, packages[1])) as fobj:
+            self.assertEqual(fobj.read(), 'srpm')
+
+        # Corrupted entries are dropped
+        with open(os.path.join(self.cache.path, 'a' * 64, packages[0]),
+                  'w') as fobj:
+            fobj.write('corrupted')
+        self.assertIsNone(self.cache.get('a' * 64, self.topdir))
+        self.assertFalse(os.path.exists(os.path.join(self.cache.path,
+                                                     'a' * 64)))
+
+    def test_no_packages(self):
+        """Builds without packages are not cached"""
+        self.cache.put('a' * 64, self.topdir, [])
+        self.assertFalse(os.path.exists(os.path.join(self.cache.path,
+                                                     'a' * 64)))
+        self.assertIsNone(self.cache.get('a' * 64, self.topdir))
+
+        # An entry without packages is a miss
+        os.makedirs(os.path.join(self.cache.path, 'b' * 64))
+        open(os.path.join(self.cache.path, 'b' * 64,
+                          BuildCache.manifest_name), 'w').close()
+        self.assertIsNone(self.cache.get('b' * 64, self.topdir))
+
+    def test_evict(self):
+        """Least recently used entries are evicted"""
+        self.cache.max_size = 25
+        self._write('RPMS/foo.rpm', '1' * 10)
+        self.cache.put('a' * 64, self.topdir, ['RPMS/foo.rpm'])
+        self.cache.put('b' * 64, self.topdir, ['RPMS/foo.rpm'])
+        self.assertIsNotNone(self.cache.get('a' * 64, self.topdir))
+        self.cache.put('c' * 64, self.topdir, ['RPMS/foo.rpm'])
+        self.assertIsNone(self.cache.get('b' * 64, self.topdir))
+        self.assertIsNotNone(self.cache.get('a' * 64, self.topdir))
+        self.assertIsNotNone(self.cache.get('c' * 64, self.topdir))
@@ -0,0 +1,87 @@
+# vim: set fileencoding=utf-8 :
+"""Test L{gbp.rpm.mockpool}"""
+
+from . import context
+
+import os
+import select
+import shutil
+import stat
+import tempfile
+import time
+import unittest
+
+from gbp.rpm.mockpool import MockPool
+
+
+class TestMockPool(unittest.TestCase):
+    """Test leasing chroots from the mock chroot pool"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='gbp_%s_' % __name__)
+        self.calls = os.path.join(self.tmpdir, 'calls')
+        self.pool = MockPool(os.path.join(self.tmpdir, 'pool'), 2,
+                             ['--configdir=/foo'])
+        self.pool.mock_cmd = os.path.join(self.tmpdir, 'mock')
+        self._fake_mock('echo "$@" >> %s' % self.calls)
+        os.chmod(self.pool.mock_cmd, stat.S_IRWXU)
+        self.pool.poll_interval = 0.05
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _fake_mock(self, script):
+        """Replace the fake mock command"""
+        with open(self.pool.mock_cmd, 'w') as fobj:
+            fobj.write('#!/bin/sh\n%s\n' % script)
+
+    def _wait_ready(self, num):
+        """Wait for the background initialization of a slot"""
+        ready = os.path.join(self.pool.path, 'epel-7-x86_64', '%d.ready' % num)
+        for _num in range(100):
+            if os.path.exists(ready):
+                return
+            time.sleep(0.05)
+        self.fail("Slot %d never got ready" % num)
+
+    def test_lease(self):
+        """Leased chroots are re-initialized in the background"""
+        with self.pool.lease('epel-7-x86_64') as env:
+            # Nothing initialized yet, the build does a full init
+            self.assertEqual(env, {'GBP_BUILDER_MOCK_UNIQUEEXT': 'gbp0'})
+            self._wait_ready(1)
+            with self.pool.lease('epel-7-x86_64') as env2:
+                self.assertEqual(env2,
+                                 {'GBP_BUILDER_MOCK_UNIQUEEXT': 'gbp1',
+                                  'GBP_BUILDER_MOCK_NO_CLEAN': '1'})
+        self._wait_ready(0)
+        self._wait_ready(1)
+        with self.pool.lease('epel-7-x86_64') as env:
+            self.assertEqual(env['GBP_BUILDER_MOCK_NO_CLEAN'], '1')
+        self._wait_ready(0)
+        self._wait_ready(1)
+        with open(self.calls) as fobj:
+            calls = sorted(fobj.read().splitlines())
+        self.assertEqual(calls[0], '-r epel-7-x86_64 --uniqueext=gbp0 '
+                                   '--configdir=/foo --init')
+        self.assertEqual(calls[-1], '-r epel-7-x86_64 --uniqueext=gbp1 '
+                                    '--configdir=/foo --init')
+
+    def test_no_inherited_fds(self):
+        """The background initialization doesn't keep our files open"""
+        self._fake_mock('sleep 2; echo "$@" >> %s' % self.calls)
+        rfd, wfd = os.pipe()
+        try:
+            with self.pool.lease('epel-7-x86_64'):
+                pass
+            os.close(wfd)
+            wfd = None
+            # The pipe is at EOF only if no scrubber holds the write end
+            readable = select.select([rfd], [], [], 1)[0]
+            self.assertEqual(readable, [rfd])
+            self.assertEqual(os.read(rfd, 1), b'')
+        finally:
+            os.close(rfd)
+            if wfd is not None:
+                os.close(wfd)
+        self._wait_ready(0)
@@ -0,0 +1,69 @@
+# vim: set fileencoding=utf-8 :
+
+"""Test L{gbp.git.mailinfo}"""
+
+from . import context
+
+import os
+import subprocess
+import tempfile
+# Try unittest2 for CentOS
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from gbp.git.mailinfo import mailinfo, MailinfoUnsupported
+
+
+class TestMailinfo(unittest.TestCase):
+    data_dir = os.path.join(context.projectdir, 'tests', '08_test_patch_data')
+
+    @staticmethod
+    def _git_mailinfo(path):
+        """Parse a patch with git mailinfo"""
+        msg = tempfile.NamedTemporaryFile()
+        cmd = ['git', 'mailinfo', msg.name, os.devnull]
+        with open(path) as patch:
+            output = subprocess.Popen(cmd, stdin=patch,
+                                      stdout=subprocess.PIPE).communicate()[0]
+        info = {}
+        for line in output.splitlines():
+            if ':' in line:
+                header, value = line.split(' ', 1)
+                info[header[:-1].lower()] = value.strip()
+        return info, msg.read()
+
+    def _check_same_as_git(self, name):
+        path = os.path.join(self.data_dir, name)
+        with open(path) as patch:
+            self.assertEqual(self._git_mailinfo(path), mailinfo(patch))
+
+    def test_same_as_git(self):
+        """Output matches git mailinfo"""
+        for name in ['patch1.diff', 'inbody.patch', 'quoted.patch']:
+            self._check_same_as_git(name)
+
+    def test_scissors(self):
+        """Message before a scissors line is dropped"""
+        lines = ['Subject: Mail subject\n', '\n', 'Dropped\n',
+                 '-- >8 --\n', 'Subject: Real subject\n', '\n',
+                 'Kept\n', '---\n']
+        info, msg = mailinfo(lines, scissors=True)
+        self.assertEqual('Real subject', info['subject'])
+        self.assertEqual('Kept\n', msg)
+        info, msg = mailinfo(lines)
+        self.assertEqual('Mail subject', info['subject'])
+        self.assertEqual('Dropped\n-- >8 --\nSubject: Real subject\n\nKept\n',
+                         msg)
+
+    def test_unsupported(self):
+        """Mails needing MIME decoding are refused"""
+        with open(os.path.join(self.data_dir, 'latin1.patch')) as patch:
+            self.assertRaises(MailinfoUnsupported, mailinfo, patch)
+        lines = ['Subject: foo\n',
+                 'Content-Type: multipart/mixed; boundary="xx"\n', '\n']
+        self.assertRaises(MailinfoUnsupported, mailinfo, lines)
+        lines = ['Subject: foo\n', 'Content-Transfer-Encoding: base64\n',
+                 '\n']
+        self.assertRaises(MailinfoUnsupported, mailinfo, lines)
@@ -0,0 +1,246 @@
+# vim: set fileencoding=utf-8 :
+#
+# (C) 2026 agent <agent@local>
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, please see
+#    <http://www.gnu.org/licenses/>
+"""Benchmark the RPM tools of git-buildpackage on synthetic repositories"""
+
+import json
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from optparse import OptionParser
+
+import gbp.log
+import gbp.profile
+
+from tests.benchmark.synthetic import SyntheticRpmPackage
+
+
+# Scenarios: each prepare function sets up a fresh copy of the input data and
+# returns the directory to run in and the command line to run. The tool
+# modules are imported lazily as they need the rpm python bindings.
+
+def prepare_buildpackage_rpm(package, rundir):
+    """Export the sources of the latest release"""
+    from gbp.scripts.buildpackage_rpm import main
+    argv = ['gbp-buildpackage-rpm', '--git-no-build', '--git-ignore-branch',
+            '--git-export-dir=%s' % os.path.join(rundir, 'rpmbuild')]
+    if package.submodules:
+        argv.append('--git-submodules')
+    return package.clone(rundir), main, argv
+
+
+def prepare_pq_rpm_import(package, rundir):
+    """Import the patch series to a patch-queue branch"""
+    from gbp.scripts.pq_rpm import main
+    return package.clone(rundir), main, ['gbp-pq-rpm', 'import']
+
+
+def _pq_rpm_imported(package, rundir):
+    """Clone the package and import the patch series, untimed"""
+    from gbp.scripts.pq_rpm import main
+    cwd = package.clone(rundir)
+    orig_cwd = os.getcwd()
+    os.chdir(cwd)
+    try:
+        if main(['gbp-pq-rpm', 'import']):
+            raise Exception("Failed to prepare the patch-queue branch")
+    finally:
+        os.chdir(orig_cwd)
+    return cwd, main
+
+
+def prepare_pq_rpm_export(package, rundir):
+    """Export the patch-queue branch as a patch series"""
+    cwd, main = _pq_rpm_imported(package, rundir)
+    return cwd, main, ['gbp-pq-rpm', 'export']
+
+
+def prepare_pq_rpm_rebase(package, rundir):
+    """Rebase the patch-queue branch"""
+    cwd, main = _pq_rpm_imported(package, rundir)
+    return cwd, main, ['gbp-pq-rpm', 'rebase']
+
+
+def prepare_import_srpm(package, rundir):
+    """Import the unpacked source rpm into a new repository"""
+    from gbp.scripts.import_srpm import main
+    return rundir, main, ['gbp-import-srpm', package.srpm_dir]
+
+
+def prepare_import_orig_rpm(package, rundir):
+    """Import a new upstream release"""
+    from gbp.scripts.import_orig_rpm import main
+    return package.clone(rundir), main, ['gbp-import-orig-rpm',
+                                         '--no-interactive',
+                                         package.new_tarball]
+
+
+def prepare_rpm_ch(package, rundir):
+    """Update the spec file changelog"""
+    from gbp.scripts.rpm_ch import main
+    return package.clone(rundir), main, ['gbp-rpm-ch', '--spawn-editor=never',
+                                         '--since=packaging/%s-1' %
+                                         package.versions[0]]
+
+
+SCENARIOS = [('buildpackage-rpm', prepare_buildpackage_rpm),
+             ('pq-rpm-import', prepare_pq_rpm_import),
+             ('pq-rpm-export', prepare_pq_rpm_export),
+             ('pq-rpm-rebase', prepare_pq_rpm_rebase),
+             ('import-srpm', prepare_import_srpm),
+             ('import-orig-rpm', prepare_import_orig_rpm),
+             ('rpm-ch', prepare_rpm_ch)]
+
+
+def run_once(prepare, package, workdir):
+    """Run one scenario once, returning the measurements"""
+    rundir = tempfile.mkdtemp(prefix='run_', dir=workdir)
+    orig_cwd = os.getcwd()
+    try:
+        cwd, main, argv = prepare(package, rundir)
+        os.chdir(cwd)
+        profiler = gbp.profile.enable()
+        tracer = gbp.profile.enable_trace()
+        try:
+            retval = main(argv)
+        finally:
+            profiler.finish()
+            gbp.profile.disable()
+            gbp.profile.disable_trace()
+    finally:
+        os.chdir(orig_cwd)
+        shutil.rmtree(rundir)
+    result = profiler.total.to_dict()
+    del result['name']
+    result['retval'] = retval
+    result['git_commands'] = len([event for event in tracer.events
+                                  if event['cat'] == 'git'])
+    result['phases'] = [phase.to_dict() for phase in profiler.phases]
+    return result
+
+
+def git_version():
+    """Version of the git suite in use"""
+    try:
+        return subprocess.check_output(['git', '--version']).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def build_parser():
+    """Construct command line parser"""
+    names = [name for name, _prepare in SCENARIOS]
+    parser = OptionParser(usage="%prog [options] [scenario ...]",
+                          description="Benchmark the RPM tools of "
+                          "git-buildpackage on a synthetic package. "
+                          "Scenarios: %s" % ', '.join(names))
+    parser.add_option("-o", "--output", metavar="FILE",
+                      help="write results in JSON format to FILE")
+    parser.add_option("-w", "--workdir", metavar="DIR",
+                      help="directory for the generated data, kept after the "
+                           "run, a temporary directory is used by default")
+    parser.add_option("-r", "--repeats", type="int", default=3,
+                      help="number of times to run each scenario, default is "
+                           "%default")
+    parser.add_option("--files", type="int", default=1000,
+                      help="number of upstream files, default is %default")
+    parser.add_option("--patches", type="int", default=20,
+                      help="number of patches (patch-queue commits), default "
+                           "is %default")
+    parser.add_option("--tags", type="int", default=10,
+                      help="number of releases, each having an upstream and a "
+                           "packaging tag, default is %default")
+    parser.add_option("--changelog-entries", type="int", default=200,
+                      help="number of extra changelog entries in the spec "
+                           "file, default is %default")
+    parser.add_option("--submodules", type="int", default=0,
+                      help="number of git submodules, default is %default")
+    parser.add_option("-v", "--verbose", action="store_true", default=False,
+                      help="show the output of the benchmarked tools")
+    return parser
+
+
+def main(argv):
+    """Generate the synthetic package and run the benchmarks"""
+    parser = build_parser()
+    options, args = parser.parse_args(argv[1:])
+    if options.repeats < 1:
+        parser.error("--repeats must be at least 1")
+    scenarios = dict(SCENARIOS)
+    for name in args:
+        if name not in scenarios:
+            parser.error("unknown scenario '%s'" % name)
+    selected = [(name, prepare) for name, prepare in SCENARIOS
+                if not args or name in args]
+
+    gbp.log.initialize()
+    if options.verbose:
+        logging.disable(logging.NOTSET)
+    else:
+        logging.disable(logging.INFO)
+
+    workdir = options.workdir or tempfile.mkdtemp(prefix='gbp-benchmark_')
+    workdir = os.path.abspath(workdir)
+    try:
+        package = SyntheticRpmPackage(workdir, files=options.files,
+                                      patches=options.patches,
+                                      tags=options.tags,
+                                      changelog_entries=options.changelog_entries,
+                                      submodules=options.submodules)
+        start = time.time()
+        package.generate()
+        sys.stderr.write("Generated synthetic package in %.1fs\n" %
+                         (time.time() - start))
+
+        results = {'params': package.params(),
+                   'repeats': options.repeats,
+                   'environment': {'python': platform.python_version(),
+                                   'platform': platform.platform(),
+                                   'git': git_version()},
+                   'scenarios': {}}
+        for name, prepare in selected:
+            runs = []
+            for _num in range(options.repeats):
+                runs.append(run_once(prepare, package, workdir))
+                if runs[-1]['retval']:
+                    sys.stderr.write("Scenario %s failed with exit code %d\n"
+                                     % (name, runs[-1]['retval']))
+            results['scenarios'][name] = {'runs': runs}
+            walls = sorted([run['wall'] for run in runs])
+            sys.stderr.write("%-20s %8.3fs (min of %d), %d git commands\n" %
+                             (name, walls[0], len(runs),
+                              runs[0]['git_commands']))
+    finally:
+        if not options.workdir:
+            shutil.rmtree(workdir)
+
+    if options.output:
+        with open(options.output, 'w') as fobj:
+            json.dump(results, fobj, indent=2, sort_keys=True)
+            fobj.write('\n')
+    else:
+        json.dump(results, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,236 @@
+# vim: set fileencoding=utf-8 :
+#
+# (C) 2026 agent <agent@local>
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, please see
+#    <http://www.gnu.org/licenses/>
+"""Compare two benchmark result files and report regressions"""
+
+import json
+import sys
+from optparse import OptionParser
+
+
+def quantile(values, fraction):
+    """
+    Quantile of a list of values, interpolating linearly between data points
+
+    >>> quantile([1, 2, 3, 4], 0.5)
+    2.5
+    >>> quantile([3, 1, 2], 0.25)
+    1.5
+    >>> quantile([7], 0.75)
+    7.0
+    """
+    values = sorted(values)
+    pos = (len(values) - 1) * fraction
+    low = int(pos)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (pos - low) * 1.0
+
+
+def median(values):
+    """
+    Median of a list of values
+
+    >>> median([5, 1, 3])
+    3.0
+    """
+    return quantile(values, 0.5)
+
+
+def iqr(values):
+    """
+    Interquartile range of a list of values
+
+    >>> iqr([1, 2, 3, 4, 5])
+    2.0
+    """
+    return quantile(values, 0.75) - quantile(values, 0.25)
+
+
+class Comparison(object):
+    """
+    Comparison of one measured quantity between two benchmark runs
+
+    Timings are considered regressed if the median grew more than the
+    relative I{threshold}, more than I{min_diff} seconds and more than the
+    larger of the two interquartile ranges, i.e. the noise level of the
+    measurement. Counters, like the number of executed git commands, are
+    deterministic and any growth is a regression.
+
+    >>> Comparison('wall', [1.0, 1.1, 1.0], [1.5, 1.4, 1.6], 0.1, 0.05).regressed
+    True
+    >>> Comparison('wall', [1.0, 1.5, 1.0], [1.2, 1.0, 1.3], 0.1, 0.05).regressed
+    False
+    >>> Comparison('git_commands', [10, 10], [11, 11], counter=True).regressed
+    True
+    """
+    def __init__(self, name, old, new, threshold=0.0, min_diff=0.0,
+                 counter=False):
+        self.name = name
+        self.counter = counter
+        self.old = median(old)
+        self.new = median(new)
+        self.noise = max(iqr(old), iqr(new))
+        diff = self.new - self.old
+        if counter:
+            self.regressed = diff > 0
+        else:
+            self.regressed = (diff > self.old * threshold and
+                              diff > min_diff and diff > self.noise)
+        self.improved = diff < 0 if counter else \
+                        (-diff > self.old * threshold and
+                         -diff > min_diff and -diff > self.noise)
+
+    @property
+    def change(self):
+        """Relative change of the median, in percent"""
+        if not self.old:
+            return 0.0 if not self.new else float('inf')
+        return (self.new - self.old) * 100.0 / self.old
+
+    def format(self, indent=''):
+        """Human readable representation"""
+        if self.regressed:
+            status = 'REGRESSION'
+        elif self.improved:
+            status = 'improved'
+        else:
+            status = ''
+        if self.counter:
+            values = "%10g %10g" % (self.old, self.new)
+        else:
+            values = "%10.3f %10.3f" % (self.old, self.new)
+        return "%-40s %s %+8.1f%% %s" % (indent + self.name, values,
+                                        self.change, status)
+
+
+def _collect(runs, key):
+    """Values of one key of all runs"""
+    return [run.get(key, 0) for run in runs]
+
+
+def _collect_phases(runs):
+    """Per-phase wall times and command counts of all runs"""
+    phases = {}
+    for run in runs:
+        for phase in run.get('phases', []):
+            data = phases.setdefault(phase['name'], {'wall': [],
+                                                     'commands': []})
+            data['wall'].append(phase['wall'])
+            data['commands'].append(phase['commands'])
+    return phases
+
+
+def compare_scenario(old_runs, new_runs, threshold, min_diff, timings=True):
+    """
+    Compare the runs of one scenario
+
+    @return: comparisons of the whole scenario and the comparisons of each
+        phase present in both results
+    @rtype: C{tuple} of (C{list} of L{Comparison}, C{dict} of C{list} of
+        L{Comparison})
+    """
+    total = [Comparison(key, _collect(old_runs, key), _collect(new_runs, key),
+                        counter=True)
+             for key in ('commands', 'git_commands')]
+    if timings:
+        total = [Comparison(key, _collect(old_runs, key),
+                            _collect(new_runs, key), threshold, min_diff)
+                 for key in ('wall', 'cpu', 'child_cpu')] + total
+
+    phases = {}
+    old_phases = _collect_phases(old_runs)
+    new_phases = _collect_phases(new_runs)
+    for name in sorted(set(old_phases) & set(new_phases)):
+        old, new = old_phases[name], new_phases[name]
+        phases[name] = [Comparison('commands', old['commands'],
+                                   new['commands'], counter=True)]
+        if timings:
+            phases[name].insert(0, Comparison('wall', old['wall'],
+                                              new['wall'], threshold,
+                                              min_diff))
+    return total, phases
+
+
+def build_parser():
+    """Construct command line parser"""
+    parser = OptionParser(usage="%prog [options] OLD_RESULTS NEW_RESULTS",
+                          description="Compare two benchmark result files. "
+                          "Exits with 1 if regressions are found.")
+    parser.add_option("-t", "--threshold", type="float", default=10.0,
+                      help="relative growth of a median time, in percent, "
+                           "that is considered a regression, default is "
+                           "%default")
+    parser.add_option("--min-diff", type="float", default=0.05,
+                      help="ignore time differences smaller than this many "
+                           "seconds, default is %default")
+    parser.add_option("--counters-only", action="store_true", default=False,
+                      help="only compare deterministic counters, e.g. the "
+                           "number of executed git commands, for noisy "
+                           "machines")
+    parser.add_option("-a", "--all", action="store_true", default=False,
+                      help="show all comparisons, not only changed ones")
+    return parser
+
+
+def main(argv):
+    """Compare benchmark results"""
+    parser = build_parser()
+    options, args = parser.parse_args(argv[1:])
+    if len(args) != 2:
+        parser.error("need exactly two result files")
+    results = []
+    for path in args:
+        try:
+            with open(path) as fobj:
+                results.append(json.load(fobj))
+        except (IOError, ValueError) as err:
+            sys.stderr.write("Failed to read results from '%s': %s\n" %
+                             (path, err))
+            return 2
+    old, new = results
+    if old.get('params') != new.get('params'):
+        sys.stderr.write("Warning: benchmark parameters differ: %s vs. %s\n"
+                         % (old.get('params'), new.get('params')))
+
+    regressions = 0
+    print("%-40s %10s %10s %9s" % ('scenario / quantity', 'old', 'new',
+                                   'change'))
+    for scenario in sorted(set(old['scenarios']) & set(new['scenarios'])):
+        total, phases = compare_scenario(old['scenarios'][scenario]['runs'],
+                                         new['scenarios'][scenario]['runs'],
+                                         options.threshold / 100.0,
+                                         options.min_diff,
+                                         not options.counters_only)
+        print(scenario)
+        for comp in total:
+            regressions += comp.regressed
+            if options.all or comp.regressed or comp.improved:
+                print(comp.format('  '))
+        for name, comps in sorted(phases.items()):
+            for comp in comps:
+                regressions += comp.regressed
+                if options.all or comp.regressed or comp.improved:
+                    print(comp.format('  %s: ' % name))
+    for scenario in sorted(set(old['scenarios']) ^ set(new['scenarios'])):
+        sys.stderr.write("Scenario %s only present in one of the results\n" %
+                         scenario)
+
+    print("%d regression(s) found" % regressions)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
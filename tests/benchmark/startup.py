@@ -0,0 +1,91 @@
+# vim: set fileencoding=utf-8 :
+#
+# (C) 2026 agent <agent@local>
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, please see
+#    <http://www.gnu.org/licenses/>
+"""Benchmark the startup latency of the gbp supercommand"""
+
+import os
+import subprocess
+import sys
+import time
+from optparse import OptionParser
+
+from tests.benchmark.compare import median
+
+
+# Command lines to measure, the ones with a latency target first
+CASES = [('help', ['--help']),
+         ('list-cmds', ['list-cmds']),
+         ('version', ['version']),
+         ('pq-help', ['help', 'pq'])]
+TARGETED = ['help', 'list-cmds']
+
+
+def measure(args, repeats):
+    """Wall clock times of running gbp with the given arguments"""
+    argv = [sys.executable, '-m', 'gbp.scripts.supercommand'] + args
+    times = []
+    with open(os.devnull, 'w') as devnull:
+        for _num in range(repeats):
+            start = time.time()
+            subprocess.call(argv, stdout=devnull, stderr=devnull)
+            times.append(time.time() - start)
+    return times
+
+
+def build_parser():
+    """Construct command line parser"""
+    parser = OptionParser(usage="%prog [options]",
+                          description="Measure how long simple gbp commands "
+                          "take to run. Exits with 1 if the median latency of "
+                          "%s exceeds the target." % ' or '.join(TARGETED))
+    parser.add_option("-r", "--repeats", type="int", default=10,
+                      help="number of times to run each command, default is "
+                           "%default")
+    parser.add_option("-t", "--target", type="float", default=0.15,
+                      help="target latency in seconds, default is %default")
+    parser.add_option("--baseline", action="store_true", default=False,
+                      help="subtract the startup time of the bare Python "
+                           "interpreter")
+    return parser
+
+
+def main(argv):
+    """Run the startup benchmarks"""
+    parser = build_parser()
+    options, _args = parser.parse_args(argv[1:])
+    if options.repeats < 1:
+        parser.error("--repeats must be at least 1")
+
+    offset = 0.0
+    if options.baseline:
+        start = time.time()
+        for _num in range(options.repeats):
+            subprocess.call([sys.executable, '-c', 'pass'])
+        offset = (time.time() - start) / options.repeats
+
+    failed = 0
+    for name, args in CASES:
+        latency = median(measure(args, options.repeats)) - offset
+        status = ''
+        if name in TARGETED and latency > options.target:
+            status = 'TOO SLOW'
+            failed += 1
+        print("%-12s %8.3fs %s" % (name, latency, status))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,338 @@
+# vim: set fileencoding=utf-8 :
+#
+# (C) 2026 agent <agent@local>
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, please see
+#    <http://www.gnu.org/licenses/>
+"""Generator for synthetic RPM packaging repositories"""
+
+import os
+import shutil
+import tarfile
+import tempfile
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+from gbp.git import GitRepository
+
+
+SPEC_TEMPLATE = """\
+Name:       %(name)s
+Version:    %(version)s
+Release:    1
+Summary:    Synthetic package for benchmarking git-buildpackage
+Group:      Development/Tools
+License:    GPLv2
+Source0:    %%{name}-%%{version}.tar.gz
+%(patch_tags)s
+
+%%description
+Package with synthetic contents, generated for benchmarking the
+git-buildpackage RPM tools.
+
+%%prep
+%%setup -q
+%(patch_macros)s
+
+%%build
+make %%{?_smp_mflags}
+
+%%install
+make install DESTDIR=%%{buildroot}
+
+%%files
+%%defattr(-,root,root,-)
+%%{_datadir}/%%{name}
+
+%%changelog
+%(changelog)s"""
+
+
+@contextmanager
+def file_protocol_allowed():
+    """
+    Allow cloning submodules from local paths, which recent git versions
+    refuse by default
+    """
+    env = {'GIT_CONFIG_COUNT': '1',
+           'GIT_CONFIG_KEY_0': 'protocol.file.allow',
+           'GIT_CONFIG_VALUE_0': 'always'}
+    saved = dict([(key, os.environ.get(key)) for key in env])
+    os.environ.update(env)
+    try:
+        yield
+    finally:
+        for key, value in saved.items():
+            if value is None:
+                del os.environ[key]
+            else:
+                os.environ[key] = value
+
+
+class SyntheticRpmPackage(object):
+    """
+    A synthetic RPM package maintained in Git
+
+    The generated repository has an I{upstream} branch with one commit and
+    one upstream tag per release and a I{master} packaging branch that merges
+    each release and has a packaging tag for it. Packaging files are kept in
+    the I{packaging} subdirectory. The latest release carries a series of
+    patches that the spec file applies in %prep. In addition, an unpacked
+    source rpm of the latest release and the tarball of a new upstream
+    release are generated for the import tools.
+
+    @ivar repo_dir: path to the generated packaging repository
+    @ivar srpm_dir: path to the unpacked source rpm
+    @ivar new_tarball: path to the tarball of a new upstream release
+    """
+    files_per_dir = 100
+    lines_per_file = 20
+
+    def __init__(self, workdir, name='synthetic', files=100, patches=10,
+                 tags=5, changelog_entries=50, submodules=0):
+        """
+        @param workdir: directory under which everything is generated
+        @type workdir: C{str}
+        @param name: name of the package
+        @type name: C{str}
+        @param files: number of upstream source files
+        @type files: C{int}
+        @param patches: number of patches, i.e. patch-queue commits
+        @type patches: C{int}
+        @param tags: number of releases, each having an upstream and a
+            packaging tag
+        @type tags: C{int}
+        @param changelog_entries: number of changelog entries in the spec file
+            on top of the ones generated for each release
+        @type changelog_entries: C{int}
+        @param submodules: number of git submodules in the upstream sources
+        @type submodules: C{int}
+        """
+        self.workdir = os.path.abspath(workdir)
+        self.name = name
+        self.files = max(files, 1)
+        self.patches = patches
+        self.tags = max(tags, 1)
+        self.changelog_entries = changelog_entries
+        self.submodules = submodules
+        self.repo_dir = os.path.join(self.workdir, 'repos', name)
+        self.srpm_dir = os.path.join(self.workdir, 'srpm', name)
+        self.new_tarball = None
+        self._revisions = [0] * self.files
+        self._changelog = []
+
+    def params(self):
+        """Scale parameters of the package"""
+        return {'files': self.files,
+                'patches': self.patches,
+                'tags': self.tags,
+                'changelog_entries': self.changelog_entries,
+                'submodules': self.submodules}
+
+    @property
+    def versions(self):
+        """Upstream versions of all releases, oldest first"""
+        return ['1.%d' % num for num in range(self.tags)]
+
+    @property
+    def version(self):
+        """Upstream version of the latest release"""
+        return self.versions[-1]
+
+    @property
+    def new_version(self):
+        """Upstream version of the new, not yet imported, release"""
+        return '2.0'
+
+    def file_path(self, num):
+        """Path of one upstream source file"""
+        return os.path.join('src', 'dir%03d' % (num // self.files_per_dir),
+                            'file%05d.c' % num)
+
+    def file_content(self, num, revision):
+        """Content of one upstream source file"""
+        return ''.join(["/* file %d revision %d line %d */\n" %
+                        (num, revision, line)
+                        for line in range(self.lines_per_file)])
+
+    def _write_file(self, path, content):
+        path = os.path.join(self.repo_dir, path)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as fobj:
+            fobj.write(content)
+
+    def _changelog_entry(self, day, version, changes):
+        """One entry of the spec file changelog"""
+        header = "* %s Benchmark <benchmark@example.com> %s-1" % \
+                 (day.strftime('%a %b %d %Y'), version)
+        return '\n'.join([header] + ['- %s' % chg for chg in changes]) + '\n'
+
+    def _spec(self, version, patches):
+        """Content of the spec file"""
+        patch_tags = ''.join(["Patch%d:    %s\n" % (num, patch)
+                              for num, patch in enumerate(patches)])
+        patch_macros = ''.join(["%%patch%d -p1\n" % num
+                                for num in range(len(patches))])
+        return SPEC_TEMPLATE % {'name': self.name,
+                                'version': version,
+                                'patch_tags': patch_tags,
+                                'patch_macros': patch_macros,
+                                'changelog': '\n'.join(self._changelog)}
+
+    def _add_submodules(self, repo):
+        """Create submodule repositories and add them to upstream"""
+        for num in range(self.submodules):
+            path = os.path.join(self.workdir, 'submodules', 'sub%d' % num)
+            sub_repo = GitRepository.create(path)
+            with open(os.path.join(path, 'README'), 'w') as fobj:
+                fobj.write("Submodule %d\n" % num)
+            sub_repo.add_files('README')
+            sub_repo.commit_staged('Initial commit of submodule %d' % num)
+            with file_protocol_allowed():
+                repo.add_submodule(path)
+
+    def _commit_upstream(self, repo, vnum):
+        """Create one upstream release"""
+        version = self.versions[vnum]
+        if vnum == 0:
+            for num in range(self.files):
+                self._write_file(self.file_path(num), self.file_content(num, 0))
+            self._add_submodules(repo)
+        else:
+            num = (vnum - 1) % self.files
+            self._revisions[num] += 1
+            self._write_file(self.file_path(num),
+                             self.file_content(num, self._revisions[num]))
+        self._write_file('VERSION', version + '\n')
+        repo.add_files(repo.path)
+        repo.commit_staged('Upstream release %s' % version)
+        repo.create_tag('upstream/%s' % version, msg='Upstream version %s' %
+                        version)
+
+    def _create_patches(self, repo):
+        """Generate the patch series on top of the latest upstream release"""
+        repo.create_branch('patch-queue', 'upstream/%s' % self.version)
+        repo.set_branch('patch-queue')
+        for num in range(self.patches):
+            path = self.file_path(num % self.files)
+            with open(os.path.join(self.repo_dir, path), 'a') as fobj:
+                fobj.write("/* patch %d */\n" % num)
+            repo.add_files(path)
+            repo.commit_staged('Synthetic change %d\n\nChange number %d of '
+                               'the synthetic patch series.\n' % (num, num))
+        patch_dir = tempfile.mkdtemp(dir=self.workdir)
+        repo.format_patches('upstream/%s' % self.version, 'patch-queue',
+                            patch_dir, signature=False, symmetric=False)
+        repo.set_branch('master')
+        repo.delete_branch('patch-queue')
+        patches = sorted(os.listdir(patch_dir))
+        for patch in patches:
+            shutil.move(os.path.join(patch_dir, patch),
+                        os.path.join(self.repo_dir, 'packaging', patch))
+        os.rmdir(patch_dir)
+        return patches
+
+    def _commit_packaging(self, repo, vnum, day):
+        """Merge one upstream release to the packaging branch"""
+        version = self.versions[vnum]
+        if vnum > 0:
+            # Merge upstream: packaging files are kept in their own
+            # subdirectory so the merge result is simply the upstream tree
+            # plus the packaging files
+            upstream = repo.rev_parse('upstream/%s^0' % version)
+            repo.set_branch('master')
+            repo.checkout_files(upstream, ['.'])
+            merge = repo.commit_tree(repo.write_tree(),
+                                     'Merge upstream version %s' % version,
+                                     [repo.head, upstream])
+            repo.update_ref('refs/heads/master', merge)
+        if vnum == 0:
+            self._write_file('.gbp.conf',
+                             "[DEFAULT]\npackaging-dir = packaging\n")
+        patches = []
+        if vnum == len(self.versions) - 1:
+            patches = self._create_patches(repo)
+        self._changelog.insert(0, self._changelog_entry(day, version,
+                                    ['New upstream release %s' % version]))
+        self._write_file(os.path.join('packaging', '%s.spec' % self.name),
+                         self._spec(version, patches))
+        repo.add_files(repo.path)
+        repo.commit_staged('Release %s-1' % version)
+        repo.create_tag('packaging/%s-1' % version,
+                        msg='%s release %s-1' % (self.name, version))
+
+    def _write_tarball(self, path, version, revisions):
+        """Write an upstream tarball directly from the synthetic content"""
+        prefix = '%s-%s' % (self.name, version)
+        tmp_dir = tempfile.mkdtemp(dir=self.workdir)
+        try:
+            for num in range(self.files):
+                fpath = os.path.join(tmp_dir, prefix, self.file_path(num))
+                if not os.path.isdir(os.path.dirname(fpath)):
+                    os.makedirs(os.path.dirname(fpath))
+                with open(fpath, 'w') as fobj:
+                    fobj.write(self.file_content(num, revisions[num]))
+            with open(os.path.join(tmp_dir, prefix, 'VERSION'), 'w') as fobj:
+                fobj.write(version + '\n')
+            with tarfile.open(path, 'w:gz') as tar:
+                tar.add(os.path.join(tmp_dir, prefix), prefix)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def generate(self):
+        """Generate the repository and the other input data"""
+        repo = GitRepository.create(self.repo_dir)
+
+        # Changelog entries older than the first release
+        first_day = date(2010, 1, 1)
+        for num in range(self.changelog_entries):
+            day = first_day + timedelta(days=num)
+            self._changelog.insert(0, self._changelog_entry(day, '0.%d' % num,
+                                            ['Synthetic change %d' % num,
+                                             'Another synthetic change']))
+
+        for vnum in range(len(self.versions)):
+            day = first_day + timedelta(days=self.changelog_entries + vnum)
+            if vnum == 0:
+                # Upstream is committed on master first, the branch is then
+                # forked off it
+                self._commit_upstream(repo, vnum)
+                repo.create_branch('upstream')
+            else:
+                repo.set_branch('upstream')
+                self._commit_upstream(repo, vnum)
+            self._commit_packaging(repo, vnum, day)
+
+        # Unpacked source rpm of the latest release
+        os.makedirs(self.srpm_dir)
+        packaging_dir = os.path.join(self.repo_dir, 'packaging')
+        for fname in os.listdir(packaging_dir):
+            shutil.copy2(os.path.join(packaging_dir, fname), self.srpm_dir)
+        self._write_tarball(os.path.join(self.srpm_dir, '%s-%s.tar.gz' %
+                                         (self.name, self.version)),
+                            self.version, self._revisions)
+
+        # Tarball of a new upstream release, every tenth file changed
+        revisions = [rev + 1 if num % 10 == 0 else rev
+                     for num, rev in enumerate(self._revisions)]
+        self.new_tarball = os.path.join(self.workdir, '%s-%s.tar.gz' %
+                                        (self.name, self.new_version))
+        self._write_tarball(self.new_tarball, self.new_version, revisions)
+        return repo
+
+    def clone(self, path):
+        """Copy the generated repository for running a benchmark on it"""
+        dst = os.path.join(path, self.name)
+        shutil.copytree(self.repo_dir, dst, symlinks=True)
+        return dst
@@ -0,0 +1,71 @@
+# vim: set fileencoding=utf-8 :
+#
+# (C) 2026 agent <agent@local>
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, please see
+#    <http://www.gnu.org/licenses/>
+"""Tests for the gbp build-many-rpm tool"""
+
+import os
+from nose.tools import eq_, ok_  # pylint: disable=E0611
+
+from gbp.scripts.build_many_rpm import main as build_many_rpm
+from tests.component.rpm import RpmRepoTestBase
+
+# Disable "Method could be a function warning"
+# pylint: disable=R0201
+
+
+def mock_build_many(args, gbp_args=None):
+    """Wrapper for gbp-build-many-rpm"""
+    argv = ['arg0', '--export-dir=builds'] + args
+    if gbp_args is not None:
+        argv += ['--', '--git-notify=off'] + gbp_args
+    return build_many_rpm(argv)
+
+
+class TestBuildManyRpm(RpmRepoTestBase):
+    """Basic tests for gbp build-many-rpm"""
+
+    def setUp(self):
+        """Test case setup"""
+        super(TestBuildManyRpm, self).setUp()
+        self.init_test_repo('gbp-test')
+        os.chdir('..')
+        self.init_test_repo('gbp-test-native')
+        os.chdir('..')
+
+    def test_build(self):
+        """Export and build several packages"""
+        eq_(mock_build_many(['gbp-test', 'gbp-test-native'],
+                            ['--git-builder=true']), 0)
+        for name in ('gbp-test', 'gbp-test-native'):
+            ok_(os.path.exists(os.path.join('builds', name, 'SPECS',
+                                            '%s.spec' % name)))
+            ok_(os.path.exists(os.path.join('builds', '%s.log' % name)))
+        self._check_log(-1, r'gbp:info: 2 package\(s\) built, 0 failed')
+
+    def test_failed_build(self):
+        """A failing package does not stop the others"""
+        with open('builds.list', 'w') as manifest:
+            manifest.write('# Packages to build\ngbp-test\n\ngbp-test-native\n')
+        eq_(mock_build_many(['--manifest=builds.list', '--log-dir=logs'],
+                            ['--git-builder=false']), 1)
+        for name in ('gbp-test', 'gbp-test-native'):
+            ok_(os.path.exists(os.path.join('logs', '%s.log' % name)))
+        self._check_log(-1, r'gbp:info: 0 package\(s\) built, 2 failed')
+
+    def test_no_repos(self):
+        """Fail if there is nothing to build"""
+        eq_(mock_build_many([]), 1)
+        self._check_log(0, 'gbp:error: No repositories to build given')
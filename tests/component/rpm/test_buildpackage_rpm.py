@@ -18,6 +18,7 @@
 """Unit tests for the gbp-buildpackage-rpm tool"""
 
 import glob
+import json
 import mock
 import os
 import re
@@ -30,6 +31,7 @@ from nose.tools import assert_raises, eq_, ok_ # pylint: disable=E0611
 
 from gbp.git import GitRepository
 from gbp.scripts.buildpackage_rpm import main as gbp_rpm
+from gbp.scripts.common.buildpackage import current_exports, git_blob_sha1
 from tests.component.rpm import RpmRepoTestBase, RPM_TEST_DATA_DIR
 from tests.testutils import ls_dir, ls_tar, ls_zip, capture
 
@@ -118,6 +120,13 @@ class TestGbpRpm(RpmRepoTestBase):
         eq_(mock_gbp([]), 1)
         self._check_log(0, 'gbp:error: File contains no section headers.')
 
+    def test_repo_opened_once(self):
+        """Config parsing reuses the already opened repository"""
+        self.init_test_repo('gbp-test-native')
+        with mock.patch('gbp.config.GitRepository') as repo_mock:
+            eq_(mock_gbp([]), 0)
+        eq_(repo_mock.called, False)
+
     def test_native_build(self):
         """Basic test of native pkg"""
         self.init_test_repo('gbp-test-native')
@@ -533,6 +542,38 @@ class TestGbpRpm(RpmRepoTestBase):
         eq_(mock_gbp(args + ['--git-no-hooks']), 0)
         ok_(not os.path.exists('../hooks'))
 
+    def test_option_build_cache(self):
+        """Test the --git-build-cache-* options"""
+        self.init_test_repo('gbp-test-native')
+        builder = ('echo -n build >> ../builds; mkdir -p RPMS; '
+                   'echo pkg > RPMS/gbp-test-native.rpm; true')
+        postbuild = 'echo -n postbuild >> $GBP_BUILD_DIR/../hooks'
+        args = ['--git-builder=%s' % builder,
+                '--git-postbuild=%s' % postbuild,
+                '--git-build-cache-dir=../cache']
+
+        # Builder is run and the results are stored in the cache
+        eq_(mock_gbp(args), 0)
+        self.check_and_rm_file('../builds', 'build')
+        self.check_and_rm_file('../hooks', 'postbuild')
+        shutil.rmtree('../rpmbuild')
+
+        # Results are restored from the cache, postbuild still run
+        eq_(mock_gbp(args), 0)
+        ok_(not os.path.exists('../builds'))
+        self.check_and_rm_file('../hooks', 'postbuild')
+        self.check_and_rm_file('../rpmbuild/RPMS/gbp-test-native.rpm',
+                               'pkg\n')
+
+        eq_(mock_gbp(args + ['--git-no-build-cache-postbuild']), 0)
+        ok_(not os.path.exists('../builds'))
+        ok_(not os.path.exists('../hooks'))
+
+        # Different builder args cause a cache miss
+        eq_(mock_gbp(args + ['--with-foo']), 0)
+        self.check_and_rm_file('../builds', 'build')
+        self.check_and_rm_file('../hooks', 'postbuild')
+
     def test_builddir_options(self):
         """Test the options related to different build directories"""
         self.init_test_repo('gbp-test-native')
@@ -545,6 +586,65 @@ class TestGbpRpm(RpmRepoTestBase):
         eq_(set(os.listdir('../foo')),
             set(['BUILD', 'BUILDROOT', 'RPMS', 'source', 'spec', 'SRPMS']))
 
+    def test_option_export_incremental(self):
+        """Test the --git-export-incremental option"""
+        repo = self.init_test_repo('gbp-test')
+        args = ['--git-no-build', '--git-export-incremental']
+
+        eq_(mock_gbp(args), 0)
+        ok_(os.path.exists('../rpmbuild/.gbp-export-manifest'))
+        orig_stat = os.stat('../rpmbuild/SOURCES/foo.txt')
+
+        # The manifest has the spec file as re-written with the VCS tag
+        eq_(current_exports('../rpmbuild')['SPECS/gbp-test.spec'],
+            git_blob_sha1('../rpmbuild/SPECS/gbp-test.spec'))
+
+        # Unchanged files are not re-written
+        eq_(mock_gbp(args), 0)
+        new_stat = os.stat('../rpmbuild/SOURCES/foo.txt')
+        eq_(new_stat.st_ctime, orig_stat.st_ctime)
+
+        # Files modified in the export dir are re-written
+        with open('../rpmbuild/SOURCES/foo.txt', 'w') as fobj:
+            fobj.write('modified')
+        eq_(mock_gbp(args), 0)
+        eq_(open('../rpmbuild/SOURCES/foo.txt').read(),
+            repo.show('HEAD:foo.txt'))
+
+        # Files removed from packaging are removed from the export dir
+        repo.remove_files(['foo.txt'])
+        repo.commit_staged('Remove foo.txt')
+        eq_(mock_gbp(args), 0)
+        ok_(not os.path.exists('../rpmbuild/SOURCES/foo.txt'))
+
+    def test_option_profile(self):
+        """Test the --git-profile option"""
+        self.init_test_repo('gbp-test')
+        eq_(mock_gbp(['--git-no-build', '--git-profile=../profile.json']), 0)
+        with open('../profile.json') as fobj:
+            report = json.load(fobj)
+        phases = [phase['name'] for phase in report['phases']]
+        ok_('dump' in phases)
+        ok_('spec-parse' in phases)
+        ok_('orig' in phases)
+        ok_(report['total']['commands'] > 0)
+
+    def test_option_trace(self):
+        """Test the --git-trace option"""
+        self.init_test_repo('gbp-test')
+        eq_(mock_gbp(['--git-no-build', '--git-trace=../trace.json']), 0)
+        with open('../trace.json') as fobj:
+            events = json.load(fobj)['traceEvents']
+        git_events = [event for event in events if event['cat'] == 'git']
+        ok_(len(git_events) > 0)
+        for event in git_events:
+            eq_(event['ph'], 'X')
+            eq_(event['args']['argv'][0], 'git')
+            ok_('returncode' in event['args'])
+            ok_('stdout_bytes' in event['args'])
+        ok_('dump' in [event['name'] for event in events
+                       if event['cat'] == 'phase'])
+
     def test_export_failure(self):
         """Test export dir permission problems"""
 
@@ -16,6 +16,7 @@
 #    <http://www.gnu.org/licenses/>
 """Basic tests for the git-import-srpm tool"""
 
+import json
 import os
 import shutil
 from six.moves import urllib
@@ -61,6 +62,18 @@ class TestImportPacked(ComponentTestBase):
         # of imported patches
         eq_(len(repo.get_commits()), 4)
 
+    def test_option_profile(self):
+        """Test the --profile option"""
+        srpm = os.path.join(DATA_DIR, 'gbp-test-1.0-1.src.rpm')
+        eq_(mock_import(['--no-pristine-tar', '--profile=profile.json',
+                         srpm]), 0)
+        with open('profile.json') as fobj:
+            report = json.load(fobj)
+        phases = [phase['name'] for phase in report['phases']]
+        for name in ('unpack', 'import-upstream', 'import-packaging',
+                     'patch-import'):
+            ok_(name in phases)
+
     def test_basic_import2(self):
         """Import package with multiple spec files and full url patch"""
         srpm = os.path.join(DATA_DIR, 'gbp-test2-2.0-0.src.rpm')
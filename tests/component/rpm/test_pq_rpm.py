@@ -16,6 +16,7 @@
 #    <http://www.gnu.org/licenses/>
 """Tests for the gbp pq-rpm tool"""
 
+import json
 import os
 import tempfile
 from nose.tools import assert_raises, eq_, ok_ # pylint: disable=E0611
@@ -71,6 +72,28 @@ class TestPqRpm(RpmRepoTestBase):
         self._check_log(0, 'gbp:error: Invalid config file: File contains no '
                            'section headers.')
 
+    def test_option_profile(self):
+        """Test the --profile option"""
+        self.init_test_repo('gbp-test')
+        eq_(mock_pq(['import', '--profile=../profile.json']), 0)
+        with open('../profile.json') as fobj:
+            report = json.load(fobj)
+        phases = [phase['name'] for phase in report['phases']]
+        ok_('import' in phases)
+        ok_('import/dump' in phases)
+        ok_('import/apply' in phases)
+        ok_(report['total']['commands'] > 0)
+
+    def test_option_trace(self):
+        """Test the --trace option"""
+        self.init_test_repo('gbp-test')
+        eq_(mock_pq(['import', '--trace=../trace.json']), 0)
+        with open('../trace.json') as fobj:
+            events = json.load(fobj)['traceEvents']
+        ok_([event for event in events if event['cat'] == 'git'])
+        ok_('import' in [event['name'] for event in events
+                         if event['cat'] == 'phase'])
+
     def test_import_export(self):
         """Basic test for patch import and export"""
         repo = self.init_test_repo('gbp-test')
@@ -99,6 +122,81 @@ class TestPqRpm(RpmRepoTestBase):
         eq_(mock_pq(['export']), 0)
         self._check_repo_state(repo, 'master', branches, files)
 
+    def test_export_unchanged(self):
+        """Re-exporting an unchanged patch queue doesn't rewrite any files"""
+        repo = self.init_test_repo('gbp-test')
+        eq_(mock_pq(['import']), 0)
+        eq_(mock_pq(['export']), 0)
+        files = ['gbp-test.spec', '0001-my-gz.patch', '0002-my-bzip2.patch',
+                 '0003-my2.patch']
+        for fname in files:
+            os.utime(fname, (0, 0))
+        eq_(mock_pq(['export']), 0)
+        eq_([os.path.getmtime(fname) for fname in files], [0] * len(files))
+        eq_(repo.status()[' M'], ['gbp-test.spec'])
+
+        # Only the changed patch is rewritten
+        os.unlink('0002-my-bzip2.patch')
+        eq_(mock_pq(['export']), 0)
+        ok_(os.path.getmtime('0002-my-bzip2.patch') > 0)
+        eq_([os.path.getmtime(fname) for fname in files if
+             fname != '0002-my-bzip2.patch'], [0] * (len(files) - 1))
+
+    def test_option_import_in_index(self):
+        """Test the --import-in-index cmdline option"""
+        repo = self.init_test_repo('gbp-test')
+        branches = repo.get_local_branches() + ['development/master']
+        eq_(mock_pq(['import', '--import-in-index']), 0)
+        files = ['AUTHORS', 'dummy.sh', 'Makefile', 'NEWS', 'README',
+                 'mydir/myfile.txt', '.gbp.conf']
+        self._check_repo_state(repo, 'development/master', branches, files)
+        in_index = repo.get_commits('', 'development/master')
+
+        # Result is identical to a normal import, apart from commit dates
+        eq_(mock_pq(['import', '--force']), 0)
+        self._check_repo_state(repo, 'development/master', branches, files)
+        eq_(repo.rev_parse('development/master^{tree}'),
+            repo.rev_parse('%s^{tree}' % in_index[0]))
+        eq_(len(repo.get_commits('', 'development/master')), len(in_index))
+
+        # Re-import on top of the existing pq branch
+        eq_(mock_pq(['import', '--force', '--import-in-index']), 0)
+        self._check_repo_state(repo, 'development/master', branches, files)
+
+        # Failed import leaves the repository untouched
+        eq_(mock_pq(['switch']), 0)
+        eq_(mock_pq(['drop']), 0)
+        branches.remove('development/master')
+        with open('my2.patch', 'w') as patch_file:
+            patch_file.write('-this-does\n+not-apply\n')
+        repo.add_files(['my2.patch'], force=True)
+        repo.commit_files(['my2.patch'], msg="Mangle patch")
+        eq_(mock_pq(['import', '--import-in-index']), 1)
+        self._check_log(-1, "gbp:error: Import failed: Error running git apply")
+        self._check_repo_state(repo, 'master', branches)
+
+    def test_option_check_patches(self):
+        """Test the --check-patches cmdline option"""
+        repo = self.init_test_repo('gbp-test')
+        branches = repo.get_local_branches() + ['development/master']
+        eq_(mock_pq(['import', '--check-patches']), 0)
+        files = ['AUTHORS', 'dummy.sh', 'Makefile', 'NEWS', 'README',
+                 'mydir/myfile.txt', '.gbp.conf']
+        self._check_repo_state(repo, 'development/master', branches, files)
+
+        # Failing patches are reported before anything is imported
+        eq_(mock_pq(['switch']), 0)
+        eq_(mock_pq(['drop']), 0)
+        branches.remove('development/master')
+        with open('my2.patch', 'w') as patch_file:
+            patch_file.write('--- a/README\n+++ b/README\n@@ -1 +1 @@\n'
+                             '-this-does\n+not-apply\n')
+        repo.add_files(['my2.patch'], force=True)
+        repo.commit_files(['my2.patch'], msg="Mangle patch")
+        eq_(mock_pq(['import', '--check-patches']), 1)
+        self._check_log(-1, "gbp:error: 1 of .* patches do not apply")
+        self._check_repo_state(repo, 'master', branches)
+
     def test_import_export2(self):
         """Another test for import and export"""
         repo = self.init_test_repo('gbp-test2')
@@ -568,6 +666,7 @@ class TestPqRpm(RpmRepoTestBase):
         repo.add_files(['my2.patch'], force=True)
         repo.commit_files(['my2.patch'], msg="Mangle patch")
         eq_(mock_pq(['import']), 1)
-        self._check_log(-1, "gbp:error: Import failed: Error running git apply")
+        self._check_log(-1, "gbp:error: Import failed: Failed to apply "
+                            "'.*my2.patch': Error running git apply")
         self._check_repo_state(repo, 'master', branches)
 
@@ -16,12 +16,17 @@
 #    <http://www.gnu.org/licenses/>
 """Tests for the git-rpm-ch tool"""
 
+import json
 import os
 import re
 from nose.tools import assert_raises, eq_, ok_ # pylint: disable=E0611
 
 from gbp.scripts.rpm_ch import main as rpm_ch
+from gbp.scripts.rpm_ch import (parse_args, guess_commit, CommitIndex,
+                                 splice_file)
 from gbp.git import GitRepository
+from gbp.rpm.changelog import ChangelogParser
+from gbp.rpm.policy import RpmPkgPolicy
 
 from tests.component.rpm import RpmRepoTestBase
 
@@ -74,17 +79,60 @@ class TestRpmCh(RpmRepoTestBase):
         self._check_log(0, 'gbp:error: invalid config file: File contains no '
                            'section headers.')
 
+    @staticmethod
+    def changelog_tail(content):
+        """Lines of a changelog file after the topmost section"""
+        headers = [num for num, line in enumerate(content) if
+                   line.startswith('* ')]
+        return content[headers[1]:] if len(headers) > 1 else []
+
     def test_update_spec_changelog(self):
         """Test updating changelog in spec"""
         repo = self.init_test_repo('gbp-test')
+        orig_content = self.read_file('gbp-test.spec')
         eq_(mock_ch([]), 0)
         eq_(repo.status(), {' M': ['gbp-test.spec']})
+        tail = self.changelog_tail(orig_content)
+        content = self.read_file('gbp-test.spec')
+        eq_(content[len(content) - len(tail):], tail)
+
+    def test_option_profile(self):
+        """Test the --profile option"""
+        self.init_test_repo('gbp-test')
+        eq_(mock_ch(['--profile=../profile.json']), 0)
+        with open('../profile.json') as fobj:
+            report = json.load(fobj)
+        phases = [phase['name'] for phase in report['phases']]
+        for name in ('spec-parse', 'changelog-parse', 'entries', 'write'):
+            ok_(name in phases)
 
     def test_update_changes_file(self):
         """Test updating a separate changes file"""
         repo = self.init_test_repo('gbp-test-native')
+        changes = 'packaging/gbp-test-native.changes'
+        orig_content = self.read_file(changes)
+        os.chmod(changes, 0o600)
         eq_(mock_ch([]), 0)
-        eq_(repo.status(), {' M': ['packaging/gbp-test-native.changes']})
+        eq_(repo.status(), {' M': [changes]})
+        # Untouched sections are retained as is, file permissions kept
+        tail = self.changelog_tail(orig_content)
+        content = self.read_file(changes)
+        eq_(content[len(content) - len(tail):], tail)
+        eq_(os.stat(changes).st_mode & 0o777, 0o600)
+        ok_(not os.path.exists(changes + '.tmp'))
+
+    def test_splice_file_links(self):
+        """Splicing a file goes through symlinks and keeps hard links"""
+        with open('real.changes', 'w') as fobj:
+            fobj.write('old head\ntail\n')
+        os.symlink('real.changes', 'link.changes')
+        os.link('real.changes', 'hard.changes')
+        splice_file('link.changes', 'new head\n', 0, len('old head\n'))
+        ok_(os.path.islink('link.changes'))
+        eq_(self.read_file('real.changes'), ['new head\n', 'tail\n'])
+        eq_(self.read_file('hard.changes'), ['new head\n', 'tail\n'])
+        eq_(sorted(os.listdir('.')),
+            ['hard.changes', 'link.changes', 'real.changes'])
 
     def test_create_spec_changelog(self):
         """Test creating changelog in spec file"""
@@ -440,6 +488,23 @@ class TestRpmCh(RpmRepoTestBase):
         eq_(mock_ch(['--changelog-revision=%(upstreamversion)s-%(release)s']),
             0)
 
+    def test_commit_guessing_index(self):
+        """Test guessing with lookup tables shared between calls"""
+        repo = self.init_test_repo('gbp-test-native')
+        repo.create_tag('my-tag', msg='My tag', commit='HEAD^')
+        options = parse_args(['arg0', '--changelog-revision=%(tagname)s'])[0]
+        section = ChangelogParser(RpmPkgPolicy).parse_section(
+                        '* Sat Jan 01 2000 User <user@host.com> my-tag\n')
+        index = CommitIndex(repo)
+        eq_(guess_commit(section, repo, options, index),
+            repo.rev_parse('HEAD^'))
+
+        # Tags are only listed once
+        repo.delete_tag('my-tag')
+        eq_(guess_commit(section, repo, options, index),
+            repo.rev_parse('HEAD^'))
+        eq_(guess_commit(section, repo, options), None)
+
     def test_commit_guessing_fail(self):
         """Test for failure of start commit guessing"""
         repo = self.init_test_repo('gbp-test-native')
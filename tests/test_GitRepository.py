@@ -246,6 +246,7 @@ def test_tag():
          - L{gbp.git.GitRepository.verify_tag}
          - L{gbp.git.GitRepository.has_tag}
          - L{gbp.git.GitRepository.get_tags}
+         - L{gbp.git.GitRepository.get_tag_commits}
 
     >>> import gbp.git
     >>> repo = gbp.git.GitRepository(repo_dir)
@@ -263,6 +264,15 @@ def test_tag():
     ['tag', 'tag2']
     >>> repo.tags
     ['tag', 'tag2']
+    >>> commits = repo.get_tag_commits()
+    >>> sorted(commits.keys())
+    ['tag', 'tag2']
+    >>> commits['tag2'] == repo.rev_parse('tag2^0') == repo.head
+    True
+    >>> list(repo.get_tag_commits('tag2').keys())
+    ['tag2']
+    >>> repo.get_tag_commits('unknown')
+    {}
     """
 
 def test_describe():
@@ -387,6 +397,28 @@ def test_get_obj_type():
     >>> repo.delete_tag("tag3")
     """
 
+def test_iter_objects():
+    """
+    Read several objects in one go
+
+    Methods tested:
+         - L{gbp.git.GitRepository.iter_objects}
+
+    >>> import gbp.git
+    >>> repo = gbp.git.GitRepository(repo_dir)
+    >>> objs = list(repo.iter_objects(['HEAD:testfile', 'HEAD^{tree}', 'HEAD:testfile']))
+    >>> [obj[0] for obj in objs]
+    ['blob', 'tree', 'blob']
+    >>> objs[0][1] == objs[2][1] == repo.show('HEAD:testfile')
+    True
+    >>> list(repo.iter_objects([]))
+    []
+    >>> list(repo.iter_objects(['HEAD:doesnotexist']))
+    Traceback (most recent call last):
+    ...
+    GitRepositoryError: Object 'HEAD:doesnotexist' missing
+    """
+
 def test_list_files():
     """
     List files in the index
@@ -463,6 +495,28 @@ def test_get_commits():
     """
 
 
+def test_iter_commits():
+    """
+    Test iterating over commits
+
+    Methods tested:
+         - L{gbp.git.GitRepository.iter_commits}
+
+    >>> import gbp.git
+    >>> repo = gbp.git.GitRepository(repo_dir)
+    >>> commits = repo.iter_commits()
+    >>> next(commits) == repo.head
+    True
+    >>> commits.close()
+    >>> list(repo.iter_commits()) == repo.get_commits()
+    True
+    >>> list(repo.iter_commits(until='doesnotexist'))
+    Traceback (most recent call last):
+    ...
+    GitRepositoryError: Error getting commits None..doesnotexist
+    """
+
+
 def test_get_commit_info():
     """
     Test inspecting commits
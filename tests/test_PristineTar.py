@@ -20,6 +20,8 @@ from . import context
 import os
 
 repo_dir = context.new_tmpdir(__name__).join('repo')
+index_repo_dir = context.new_tmpdir(__name__).join('index_repo')
+cache_dir = context.new_tmpdir(__name__).join('cache')
 test_data = os.path.join(context.projectdir, "tests/test_PristineTar_data")
 
 def test_create():
@@ -138,6 +140,125 @@ def test_pristine_tar_checkout_nonexistent():
     pristine-tar: git show refs/heads/pristine-tar:upstream_1.1.orig.tar.gz.delta failed
     """
 
+def test_pristine_tar_index():
+    """
+    Look up pristine-tar commits through the commit index
+
+    Methods tested:
+         - L{gbp.pkg.pristinetar.PristineTar.get_commit}
+         - L{gbp.pkg.pristinetar.PristineTar.get_archive_commit}
+         - L{gbp.deb.pristinetar.DebianPristineTar.has_commit}
+
+    >>> import os, gbp.deb.git
+    >>> repo = gbp.deb.git.DebianGitRepository.create(index_repo_dir)
+    >>> tree = repo.write_tree()
+    >>> first = repo.commit_tree(tree, 'pristine-tar data for foo_1.0.orig.tar.gz', [])
+    >>> repo.update_ref('refs/heads/pristine-tar', first)
+    >>> repo.pristine_tar.get_commit('foo_1.0.orig.tar.gz') == first
+    True
+    >>> repo.pristine_tar.has_commit('foo', '1.0')
+    True
+    >>> repo.pristine_tar.has_commit('foo', '2.0')
+    False
+    >>> os.path.exists(os.path.join(repo.git_dir, 'gbp_pristine_tar_index'))
+    True
+    >>> second = repo.commit_tree(tree, 'pristine-tar data for foo_2.0.orig.tar.gz', [first])
+    >>> repo.update_ref('refs/heads/pristine-tar', second)
+    >>> repo = gbp.deb.git.DebianGitRepository(index_repo_dir)
+    >>> repo.pristine_tar.get_commit('foo_2.0.orig.tar.gz') == second
+    True
+    >>> repo.pristine_tar.get_commit('foo_1.0.orig.tar.gz') == first
+    True
+    >>> rewritten = repo.commit_tree(tree, 'pristine-tar data for foo_3.0.orig.tar.gz', [])
+    >>> repo.update_ref('refs/heads/pristine-tar', rewritten)
+    >>> repo.pristine_tar.has_commit('foo', '1.0')
+    False
+    >>> repo.pristine_tar.get_commit('foo_3.0.orig.tar.gz') == rewritten
+    True
+
+    The archive lookup for the checkout cache matches the whole subject
+
+    >>> other = repo.commit_tree(tree, 'pristine-tar data for foo_3.0.orig.tar.gz.old', [rewritten])
+    >>> repo.update_ref('refs/heads/pristine-tar', other)
+    >>> repo.pristine_tar.get_commit('foo_3.0.orig.tar.gz') == other
+    True
+    >>> repo.pristine_tar.get_archive_commit('foo_3.0.orig.tar.gz') == rewritten
+    True
+    >>> repo.pristine_tar.get_archive_commit('3.0.orig.tar.gz') is None
+    True
+    """
+
+def test_pristine_tar_cache():
+    """
+    Store and retrieve tarballs in the pristine-tar checkout cache
+
+    Methods tested:
+         - L{gbp.pkg.pristinetar.PristineTarCache.put}
+         - L{gbp.pkg.pristinetar.PristineTarCache.get}
+         - L{gbp.pkg.pristinetar.PristineTarCache._evict}
+
+    >>> import os
+    >>> from gbp.pkg.pristinetar import PristineTarCache
+    >>> os.makedirs(cache_dir)
+    >>> cache = PristineTarCache(os.path.join(cache_dir, 'tarballs'), max_size=10)
+    >>> archive = os.path.join(cache_dir, 'foo_1.0.orig.tar.gz')
+    >>> with open(archive, 'w') as fobj: fobj.write('123456')
+    >>> cache.get('1' * 40, archive)
+    False
+    >>> cache.put('1' * 40, archive)
+    >>> os.unlink(archive)
+    >>> cache.get('1' * 40, archive)
+    True
+    >>> open(archive).read()
+    '123456'
+    >>> cache.get('2' * 40, archive)
+    False
+
+    Corrupted entries are dropped
+
+    >>> with open(archive, 'w') as fobj: fobj.write('corrupt')
+    >>> cache.get('1' * 40, archive)
+    False
+    >>> cache.get('1' * 40, archive)
+    False
+
+    Least recently used entries are evicted
+
+    >>> with open(archive, 'w') as fobj: fobj.write('123456')
+    >>> cache.put('1' * 40, archive)
+    >>> os.unlink(archive)
+    >>> with open(archive, 'w') as fobj: fobj.write('abcdef')
+    >>> cache.put('2' * 40, archive)
+    >>> os.unlink(archive)
+    >>> cache.get('1' * 40, archive)
+    False
+    >>> cache.get('2' * 40, archive)
+    True
+    >>> open(archive).read()
+    'abcdef'
+
+    Entries removed by another build while evicting are skipped, and a
+    failing eviction only warns
+
+    >>> import errno, mock
+    >>> real_stat = os.stat
+    >>> def vanishing_stat(path):
+    ...     if path.endswith('.orig.tar.gz'):
+    ...         raise OSError(errno.ENOENT, 'No such file or directory', path)
+    ...     return real_stat(path)
+    >>> with mock.patch('os.stat', vanishing_stat):
+    ...     cache._entries()
+    []
+    >>> denied = OSError(errno.EACCES, 'Permission denied')
+    >>> with mock.patch('os.listdir', side_effect=denied):
+    ...     with mock.patch('gbp.log.warn') as warn:
+    ...         cache.put('2' * 40, archive)
+    >>> warn.called
+    True
+    >>> cache.get('2' * 40, archive)
+    True
+    """
+
 def test_teardown():
     """
     Perform the teardown
@@ -159,7 +159,8 @@ class TestChangelogParser(object):
         eq_(str(changelog), self.cl_default_style)
 
         # Parse and check section
-        section = self.parser.parse_section(changelog.sections[0])
+        raw_section = changelog.sections.raw(0)
+        section = changelog.sections[0]
 
         eq_(section.header['time'], datetime(2014, 1, 29))
         eq_(section.header['name'], "Markus Lehtonen")
@@ -167,7 +168,45 @@ class TestChangelogParser(object):
         eq_(section.header['revision'], "0.3-1")
 
         # Check that re-creating section doesn't mangle it
-        eq_(str(section), changelog.sections[0])
+        eq_(str(section), raw_section)
+        eq_(str(changelog), self.cl_default_style)
+
+    def test_parse_lazy(self):
+        """Sections are parsed on first access only"""
+        text = self.cl_default_style + self.cl_broken_header_3
+        changelog = self.parser.raw_parse_string(text.replace('\n', '\r\n'))
+        eq_(len(changelog.sections), 4)
+        eq_(changelog.sections.raw(3), self.cl_broken_header_3)
+        eq_(changelog.sections[0].header['revision'], '0.3-1')
+        eq_(str(changelog), text)
+        with assert_raises(ChangelogError):
+            changelog.sections[3]
+
+        # Lines only matching in the middle don't start a section
+        changelog = self.parser.raw_parse_string(self.cl_default_style +
+                                                 "- foo * bar\n")
+        eq_(len(changelog.sections), 3)
+
+    def test_split(self):
+        """Test splitting the changelog into modified head and intact tail"""
+        text = self.cl_default_style
+        changelog = self.parser.raw_parse_string(text)
+        eq_(changelog.sections.split(), ('', 0))
+
+        # Sections after the last accessed one are the untouched tail
+        eq_(changelog.sections[0].header['revision'], '0.3-1')
+        head, tail = changelog.sections.split()
+        eq_(head, changelog.sections.raw(0))
+        eq_(text[tail:], text[len(head):])
+        changelog.add_section(time=datetime(2014, 1, 30), name="Jane",
+                              email="u@h", revision="1.1")
+        head, tail = changelog.sections.split()
+        ok_(head.startswith("* Thu Jan 30 2014 Jane <u@h> 1.1\n"))
+        eq_(head + text[tail:], str(changelog))
+
+        # No tail if the line endings were normalized
+        changelog = self.parser.raw_parse_string(text.replace('\n', '\r\n'))
+        eq_(changelog.sections.split(), (text, None))
 
     def test_parse_authors(self):
         """Test parsing of authors from changelog entries"""